@@ -0,0 +1,209 @@
+import ssl
+import time
+import socket
+import asyncio
+import threading
+from collections import defaultdict, deque
+from urllib.parse import urlparse
+
+DEFAULT_ASYNC_CONNECTIONS = 256  # requests in flight on the loop, one keep-alive connection each
+DEFAULT_WARM_CONNECTIONS = 32  # connections opened at mount time, before the application asks for anything
+FETCH_TIMEOUT = 60
+DNS_TTL = 60  # seconds a resolved address is reused for new connections
+PRESIGN_TTL = 3600  # lifetime of presigned S3 urls, they are renewed at half of it
+
+class FetchError(IOError):
+    def __init__(self, status, url):
+        super().__init__(f'GET {urlparse(url).path} failed with HTTP {status}')
+        self.status = status
+
+class Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def usable(self):
+        # The server closes idle keep-alive connections on its own schedule
+        return not self.reader.at_eof() and not self.writer.is_closing()
+
+    def close(self):
+        self.writer.close()
+
+class FetchEngine:
+    """HTTP range reads on an asyncio loop of its own, shared by every FUSE thread.
+
+    FUSE threads hand a request to the loop and wait for its result, the loop keeps up to
+    connections requests in flight over keep-alive connections, independent of how many FUSE or
+    pool threads there are. Names are resolved once per DNS_TTL and warm() opens connections
+    ahead of time, so the first reads after mount don't pay for DNS, TCP and TLS setup.
+    """
+
+    def __init__(self, connections=DEFAULT_ASYNC_CONNECTIONS, timeout=FETCH_TIMEOUT):
+        self.connections = connections
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        self.ssl_context = ssl.create_default_context()
+        self.idle = defaultdict(deque)  # (scheme, host, port) -> idle Connection
+        self.addresses = {}  # (host, port) -> (address, resolved at)
+        self.slots = None  # asyncio.Semaphore of the loop, one slot per request in flight
+        self.stats = {'requests': 0, 'connects': 0, 'reused': 0, 'bytes': 0}
+        threading.Thread(target=self.loop.run_forever, name='ffbox-fetch-loop', daemon=True).start()
+        self.run(self.start())
+
+    async def start(self):
+        self.slots = asyncio.Semaphore(self.connections)
+
+    def run(self, coroutine):
+        # Called from FUSE and worker threads, never from the loop itself
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def get_range(self, url, offset, length) -> bytes:
+        return self.run(self.fetch(url, {'Range': f'bytes={offset}-{offset + length - 1}'}))
+
+    def get(self, url) -> bytes:
+        return self.run(self.fetch(url))
+
+    def warm(self, url, count=DEFAULT_WARM_CONNECTIONS):
+        """Resolve the host of url and open count idle connections to it, returns how many opened"""
+        return self.run(self.open_idle(url, count))
+
+    async def open_idle(self, url, count):
+        key = self.key(url)
+        results = await asyncio.gather(*[self.connect(key) for _ in range(count)], return_exceptions=True)
+        opened = [connection for connection in results if isinstance(connection, Connection)]
+        self.idle[key].extend(opened)
+        return len(opened)
+
+    def key(self, url):
+        parsed = urlparse(url)
+        return parsed.scheme, parsed.hostname, parsed.port or (443 if parsed.scheme == 'https' else 80)
+
+    async def resolve(self, host, port):
+        cached = self.addresses.get((host, port))
+        if cached is not None and time.time() - cached[1] < DNS_TTL:
+            return cached[0]
+        infos = await self.loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        address = infos[0][4][0]
+        self.addresses[(host, port)] = (address, time.time())
+        return address
+
+    async def connect(self, key):
+        scheme, host, port = key
+        address = await self.resolve(host, port)
+        if scheme == 'https':
+            reader, writer = await asyncio.open_connection(address, port, ssl=self.ssl_context, server_hostname=host)
+        else:
+            reader, writer = await asyncio.open_connection(address, port)
+        self.stats['connects'] += 1
+        return Connection(reader, writer)
+
+    async def acquire(self, key):
+        """(connection, reused)"""
+        idle = self.idle[key]
+        while idle:
+            connection = idle.pop()
+            if connection.usable():
+                self.stats['reused'] += 1
+                return connection, True
+            connection.close()
+        return await self.connect(key), False
+
+    async def fetch(self, url, headers=None):
+        async with self.slots:
+            self.stats['requests'] += 1
+            return await asyncio.wait_for(self.request(url, headers or {}), self.timeout)
+
+    async def request(self, url, headers):
+        parsed = urlparse(url)
+        key = self.key(url)
+        target = parsed.path or '/'
+        if parsed.query:
+            target += '?' + parsed.query
+        head = f'GET {target} HTTP/1.1\r\nHost: {parsed.netloc}\r\n'
+        head += ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+        head = (head + '\r\n').encode('latin-1')
+        while True:
+            connection, reused = await self.acquire(key)
+            try:
+                connection.writer.write(head)
+                await connection.writer.drain()
+                status, response_headers = await self.read_head(connection.reader)
+                body = await self.read_body(connection.reader, response_headers)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                connection.close()
+                if not reused:
+                    raise
+                continue  # the idle connection was dropped by the server, again on a fresh one
+            except BaseException:
+                # Timed out or cancelled with the response half read, the connection can't be reused
+                connection.close()
+                raise
+            if response_headers.get('connection', '').lower() == 'close':
+                connection.close()
+            else:
+                self.idle[key].append(connection)
+            break
+        if status == 404:
+            raise FileNotFoundError(parsed.path)
+        if status >= 400 and status != 416:
+            raise FetchError(status, url)
+        if status == 416:
+            return b''  # range past the end, like S3 and local files
+        self.stats['bytes'] += len(body)
+        return body
+
+    async def read_head(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed before the response')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return status, headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    async def read_body(self, reader, headers):
+        if 'content-length' in headers:
+            return await reader.readexactly(int(headers['content-length']))
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    return b''.join(chunks)
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+        headers['connection'] = 'close'  # delimited by the end of the connection
+        return await reader.read()
+
+    def close(self):
+        def close_all():
+            for idle in self.idle.values():
+                for connection in idle:
+                    connection.close()
+            self.loop.stop()
+        self.loop.call_soon_threadsafe(close_all)
+
+class Presigner:
+    """Presigned GET urls of S3 objects, so the engine fetches them without an S3 SDK on the loop"""
+
+    def __init__(self, client_getter, ttl=PRESIGN_TTL):
+        self.client_getter = client_getter  # the mount swaps its boto3 client when growing the pool
+        self.ttl = ttl
+        self.urls = {}  # (bucket, key) -> (url, signed at)
+        self.lock = threading.Lock()
+
+    def url(self, bucket, key):
+        with self.lock:
+            cached = self.urls.get((bucket, key))
+        if cached is not None and time.time() - cached[1] < self.ttl / 2:
+            return cached[0]
+        url = self.client_getter().generate_presigned_url(
+            'get_object', Params={'Bucket': bucket, 'Key': key}, ExpiresIn=self.ttl)
+        with self.lock:
+            self.urls[(bucket, key)] = (url, time.time())
+        return url
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Cold start of a pushed image, raw objects vs per-block compressed objects.
+
+Pushes the same tree twice, with and without --compress, then opens every file through a fresh
+mount and reports the bytes fetched from the backend and the time until every file is cached.
+Run against a local S3 stand-in (MinIO, moto_server, ...) by pointing boto3 at it:
+    AWS_ENDPOINT_URL=http://127.0.0.1:9000 python -m ffbox.benchmark_compression s3://bench/compression
+"""
+
+import os
+import time
+import shutil
+import tempfile
+from ffbox import mount
+
+class CountingClient:
+    """Wraps the mount's NsClient to count the stored bytes it fetches"""
+
+    def __init__(self, client):
+        self.client = client
+        self.root = client.root
+        self.bytes_fetched = 0
+
+    def get_range(self, relpath, offset, length):
+        data = self.client.get_range(relpath, offset, length)
+        self.bytes_fetched += len(data)
+        return data
+
+    def read_into(self, relpath, fd, offset, length, fd_offset):
+        written = self.client.read_into(relpath, fd, offset, length, fd_offset)
+        self.bytes_fetched += written
+        return written
+
+    def head(self, relpath):
+        return self.client.head(relpath)
+
+    def get_binary(self, relpath):
+        data = self.client.get_binary(relpath)
+        self.bytes_fetched += len(data)
+        return data
+
+    def get_object(self, relpath):
+        data = self.client.get_object(relpath)
+        self.bytes_fetched += len(data)
+        return data
+
+class CompressionBenchmark:
+    def __init__(self, s3_url, work_dir=None):
+        self.s3_url = s3_url.rstrip('/')
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='ffbox_bench_compression_')
+        self.local_dir = os.path.join(self.work_dir, 'project')
+
+    def create_tree(self, source_dir, dense_mb):
+        """Code and shared libraries copied from source_dir, plus dense weights that are never compressed"""
+        shutil.copytree(source_dir, os.path.join(self.local_dir, 'lib'),
+                        ignore=shutil.ignore_patterns('__pycache__', 'site-packages', 'test', 'tests'))
+        os.makedirs(os.path.join(self.local_dir, 'model'), exist_ok=True)
+        with open(os.path.join(self.local_dir, 'model', 'model.safetensors'), 'wb') as f:
+            for _ in range(dense_mb):
+                f.write(os.urandom(1024 * 1024))
+
+    def raw_bytes(self):
+        total = 0
+        for root, dirs, files in os.walk(self.local_dir):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        return total
+
+    def push(self, name, compress):
+        mount.ffpush(self.local_dir, f'{self.s3_url}/{name}', force=True, compress=compress)
+
+    def cold_start(self, name, lazy):
+        """Open every file of the pushed image through a fresh mount, returns (seconds, bytes fetched)"""
+        url = f'{self.s3_url}/{name}'
+        cache_dir = os.path.join(self.work_dir, f'cache_{name}')
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.makedirs(cache_dir)
+        mount.nsclient = CountingClient(mount.S3Client(url))
+        passthru = mount.Passthrough(cache_dir, os.path.join(self.work_dir, 'mnt'), url, True, lazy=lazy)
+        start_time = time.time()
+        passthru.load_index()
+        for root, dirs, files in os.walk(self.local_dir):
+            for file in files:
+                path = '/' + os.path.relpath(os.path.join(root, file), self.local_dir)
+                fh = passthru.open(path, os.O_RDONLY)
+                # Lazy mounts fetch on read, read everything so both modes end with the whole image cached
+                offset = 0
+                while passthru.read(path, mount.DEFAULT_BLOCK_SIZE, offset, fh):
+                    offset += mount.DEFAULT_BLOCK_SIZE
+                passthru.release(path, fh)
+        elapsed = time.time() - start_time
+        return elapsed, mount.nsclient.bytes_fetched
+
+    def cleanup(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark cold start of raw vs compressed images')
+    parser.add_argument('s3_url', help='s3://bucket/prefix to push the test images to')
+    parser.add_argument('--source', default=os.path.dirname(os.__file__), help='Folder of code and shared libraries to push, the stdlib by default')
+    parser.add_argument('--dense-mb', type=int, default=256, help='MB of incompressible .safetensors weights')
+    parser.add_argument('--lazy', action='store_true', help='Mount lazily, fetching blocks on read')
+    args = parser.parse_args()
+
+    benchmark = CompressionBenchmark(args.s3_url)
+    try:
+        benchmark.create_tree(args.source, args.dense_mb)
+        raw_gb = benchmark.raw_bytes() / 1024 ** 3
+        print(f'Image size: {raw_gb:.3f} GB')
+        results = {}
+        for name, compress in (('raw', False), ('compressed', True)):
+            benchmark.push(name, compress)
+            results[name] = benchmark.cold_start(name, args.lazy)
+        for name, (elapsed, fetched) in results.items():
+            print(f'{name}: {elapsed:.3f} seconds to ready, {fetched / 1024 ** 3:.3f} GB fetched, '
+                  f'{raw_gb / elapsed:.3f} GB/s effective')
+    finally:
+        benchmark.cleanup()
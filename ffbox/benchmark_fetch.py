@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Concurrent small-object fetch throughput, the threaded boto3 client vs the asyncio fetch engine.
+
+Run against a local S3 stand-in (MinIO, moto_server, ...) by pointing boto3 at it:
+    AWS_ENDPOINT_URL=http://127.0.0.1:9000 python -m ffbox.benchmark_fetch s3://bench/fetch --create 2000
+"""
+
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from ffbox import mount
+from ffbox.mount import S3Client, AsyncS3Client
+from ffbox.aiofetch import FetchEngine, DEFAULT_ASYNC_CONNECTIONS
+
+class FetchBenchmark:
+    def __init__(self, s3_url):
+        self.s3_url = s3_url.rstrip('/')
+        self.client = S3Client(self.s3_url)
+
+    def key(self, i):
+        return f'obj-{i:06d}'
+
+    def create_objects(self, count, size_kb):
+        data = os.urandom(size_kb * 1024)
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            list(executor.map(lambda i: mount.s3_client.put_object(
+                Bucket=self.client.bucket, Key=self.client.bucket_key(self.key(i))[1], Body=data), range(count)))
+
+    def fetch_all(self, client, count, threads):
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            total = sum(executor.map(lambda i: len(client.get_range(self.key(i), 0, 1024 * 1024)), range(count)))
+        return time.time() - start_time, total
+
+    def benchmark_boto3(self, count, threads):
+        """Baseline: FUSE-style threads each blocking on a boto3 request"""
+        mount.ensure_pool_connections(threads)
+        return self.fetch_all(self.client, count, threads)
+
+    def benchmark_engine(self, count, threads, connections, warm):
+        """The same threads handing their requests to the asyncio engine"""
+        client = AsyncS3Client(self.s3_url, FetchEngine(connections))
+        if warm:
+            client.warm(min(warm, connections))
+        try:
+            return self.fetch_all(client, count, threads)
+        finally:
+            client.engine.close()
+
+    def benchmark_engine_gather(self, count, connections):
+        """Every request submitted to the loop at once, the engine's own ceiling"""
+        engine = FetchEngine(connections)
+        client = AsyncS3Client(self.s3_url, engine)
+        urls = [client.presigned_url(self.key(i)) for i in range(count)]
+
+        async def fetch_all():
+            results = await asyncio.gather(*[engine.fetch(url) for url in urls])
+            return sum(len(data) for data in results)
+        start_time = time.time()
+        try:
+            total = engine.run(fetch_all())
+        finally:
+            engine.close()
+        return time.time() - start_time, total
+
+    def first_request_latency(self, warm):
+        """Seconds of the first fetch after mount, with and without pre-warmed connections"""
+        client = AsyncS3Client(self.s3_url, FetchEngine(8))
+        if warm:
+            client.warm(1)
+        start_time = time.time()
+        client.get_range(self.key(0), 0, 1024)
+        elapsed = time.time() - start_time
+        client.engine.close()
+        return elapsed
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark concurrent small-object fetches')
+    parser.add_argument('s3_url', help='s3://bucket/prefix holding the objects')
+    parser.add_argument('--create', type=int, default=0, help='Create this many objects first')
+    parser.add_argument('--size', type=int, default=16, help='Size of created objects in KB')
+    parser.add_argument('--count', type=int, default=2000, help='Objects to fetch per run')
+    parser.add_argument('--threads', default='16,64', help='Comma separated fetching thread counts')
+    parser.add_argument('--connections', type=int, default=DEFAULT_ASYNC_CONNECTIONS, help='Engine requests in flight')
+    args = parser.parse_args()
+
+    benchmark = FetchBenchmark(args.s3_url)
+    if args.create:
+        print(f'Creating {args.create} objects of {args.size}KB under {args.s3_url}...')
+        benchmark.create_objects(args.create, args.size)
+
+    print(f'first request: cold {benchmark.first_request_latency(False) * 1000:.1f} ms, '
+          f'warm {benchmark.first_request_latency(True) * 1000:.1f} ms')
+    for threads in [int(x) for x in args.threads.split(',')]:
+        for name, run in (('boto3', lambda: benchmark.benchmark_boto3(args.count, threads)),
+                          ('engine', lambda: benchmark.benchmark_engine(args.count, threads, args.connections, threads))):
+            elapsed, total = run()
+            print(f'{name} threads={threads}: {args.count / elapsed:.0f} objects/s, {total / 1024 ** 2 / elapsed:.1f} MB/s')
+    elapsed, total = benchmark.benchmark_engine_gather(args.count, args.connections)
+    print(f'engine gather connections={args.connections}: {args.count / elapsed:.0f} objects/s, '
+          f'{total / 1024 ** 2 / elapsed:.1f} MB/s')
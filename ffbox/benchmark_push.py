@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Push throughput, the old one-worker-per-folder upload vs the global upload pipeline of ffpush.
+
+Run against a local S3 stand-in (MinIO, moto_server, ...) by pointing boto3 at it:
+    AWS_ENDPOINT_URL=http://127.0.0.1:9000 python -m ffbox.benchmark_push s3://bench/push --shards 200 --shard-size 64
+"""
+
+import os
+import time
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from ffbox import mount
+from ffbox.upload import DEFAULT_UPLOAD_WORKERS, DEFAULT_BYTES_IN_FLIGHT
+
+class PushBenchmark:
+    def __init__(self, s3_url, work_dir=None):
+        self.s3_url = s3_url.rstrip('/')
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='ffbox_bench_push_')
+        self.local_dir = os.path.join(self.work_dir, 'project')
+
+    def create_tree(self, shards, shard_size_mb, small_files):
+        """A model folder of equally sized shards plus a code folder of small files"""
+        os.makedirs(os.path.join(self.local_dir, 'model'), exist_ok=True)
+        os.makedirs(os.path.join(self.local_dir, 'code'), exist_ok=True)
+        chunk = os.urandom(1024 * 1024)
+        for i in range(shards):
+            with open(os.path.join(self.local_dir, 'model', f'shard-{i:05d}.bin'), 'wb') as f:
+                for _ in range(shard_size_mb):
+                    f.write(chunk)
+        for i in range(small_files):
+            with open(os.path.join(self.local_dir, 'code', f'module_{i}.py'), 'w') as f:
+                f.write(f'VALUE = {i}\n' * 20)
+
+    def total_bytes(self):
+        total = 0
+        for root, dirs, files in os.walk(self.local_dir):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        return total
+
+    def benchmark_per_folder(self):
+        """Baseline: one task per folder on 20 workers, files of a folder uploaded one after another"""
+        bucket, _, prefix = self.s3_url[len('s3://'):].partition('/')
+        prefix = f'{prefix}/per_folder'.strip('/')
+
+        def upload_folder(root, files):
+            for name in files:
+                path = os.path.join(root, name)
+                key = f'{prefix}/{os.path.relpath(path, self.local_dir)}'
+                mount.s3_client.upload_file(path, bucket, key, Config=mount.config)
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            futures = [executor.submit(upload_folder, root, files) for root, dirs, files in os.walk(self.local_dir)]
+            for future in futures:
+                future.result()
+        return time.time() - start_time
+
+    def benchmark_pipeline(self, workers, bytes_in_flight):
+        """ffpush with the global pipeline, forced so every file is uploaded"""
+        start_time = time.time()
+        mount.ffpush(self.local_dir, f'{self.s3_url}/pipeline_{workers}', force=True,
+                     workers=workers, bytes_in_flight=bytes_in_flight)
+        return time.time() - start_time
+
+    def cleanup(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark ffpush upload throughput')
+    parser.add_argument('s3_url', help='s3://bucket/prefix to push the generated project to')
+    parser.add_argument('--shards', type=int, default=200, help='Number of shard files in one folder')
+    parser.add_argument('--shard-size', type=int, default=64, help='Size of each shard in MB')
+    parser.add_argument('--small-files', type=int, default=500, help='Number of small code files')
+    parser.add_argument('--workers', default=f'8,{DEFAULT_UPLOAD_WORKERS},64', help='Comma separated pipeline worker counts')
+    parser.add_argument('--bytes-in-flight', type=int, default=DEFAULT_BYTES_IN_FLIGHT // 1024 // 1024, help='Pipeline MB in flight')
+    args = parser.parse_args()
+
+    benchmark = PushBenchmark(args.s3_url)
+    try:
+        print(f'Creating {args.shards} x {args.shard_size}MB shards and {args.small_files} small files...')
+        benchmark.create_tree(args.shards, args.shard_size, args.small_files)
+        gb = benchmark.total_bytes() / 1024 ** 3
+
+        elapsed = benchmark.benchmark_per_folder()
+        print(f'\nper folder: {elapsed:.3f} seconds, {gb / elapsed:.3f} GB/s')
+
+        for workers in [int(x) for x in args.workers.split(',')]:
+            elapsed = benchmark.benchmark_pipeline(workers, args.bytes_in_flight * 1024 * 1024)
+            print(f'pipeline workers={workers}: {elapsed:.3f} seconds, {gb / elapsed:.3f} GB/s')
+    finally:
+        benchmark.cleanup()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Download throughput of large objects, boto3 download_file vs the parallel ranged engine.
+
+Run against a local S3 stand-in (MinIO, moto_server, ...) by pointing boto3 at it:
+    AWS_ENDPOINT_URL=http://127.0.0.1:9000 python -m ffbox.benchmark_transfer s3://bench/big.bin --create 2048
+"""
+
+import os
+import time
+import tempfile
+from ffbox import mount
+from ffbox.mount import S3Client, PathClient
+from ffbox.transfer import RangedDownloader
+
+class TransferBenchmark:
+    def __init__(self, url, work_dir=None):
+        self.url = url
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='ffbox_bench_')
+        if url.startswith('s3://'):
+            self.client = S3Client(url)
+        else:
+            self.client = PathClient(os.path.dirname(url))
+
+    def create_object(self, size_mb):
+        """Upload (or write) a random object of size_mb megabytes to benchmark against"""
+        local_path = os.path.join(self.work_dir, 'source.bin')
+        with open(local_path, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+        if isinstance(self.client, S3Client):
+            mount.s3_client.upload_file(local_path, self.client.bucket, self.client.prefix, Config=mount.config)
+        else:
+            os.replace(local_path, self.url)
+
+    def object_size(self):
+        if isinstance(self.client, S3Client):
+            return mount.s3_client.head_object(Bucket=self.client.bucket, Key=self.client.prefix)['ContentLength']
+        return os.path.getsize(self.url)
+
+    def benchmark_download_file(self):
+        """Baseline: whole-object download as Passthrough.open used to do it"""
+        dest = os.path.join(self.work_dir, 'download_file.bin')
+        start_time = time.time()
+        if isinstance(self.client, S3Client):
+            mount.s3_client.download_file(self.client.bucket, self.client.prefix, dest)
+        else:
+            with open(self.url, 'rb') as src, open(dest, 'wb') as dst:
+                while dst.write(src.read(8 * 1024 * 1024)):
+                    pass
+        elapsed = time.time() - start_time
+        os.unlink(dest)
+        return elapsed
+
+    def benchmark_ranged(self, part_size, concurrency):
+        """Parallel ranged GETs written with pwrite into a sparse file"""
+        mount.ensure_pool_connections(concurrency)
+        size = self.object_size()
+        dest = os.path.join(self.work_dir, 'ranged.bin')
+        downloader = RangedDownloader(part_size, concurrency)
+        relpath = self.url if isinstance(self.client, S3Client) else os.path.basename(self.url)
+        start_time = time.time()
+        fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            downloader.download(lambda offset, length: self.client.get_range(relpath, offset, length), fd, 0, size)
+        finally:
+            os.close(fd)
+        elapsed = time.time() - start_time
+        downloader.shutdown()
+        os.unlink(dest)
+        return elapsed
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark large object download throughput')
+    parser.add_argument('url', help='s3://bucket/key or local file path of the object to download')
+    parser.add_argument('--create', type=int, default=0, help='Create a random object of this many MB first')
+    parser.add_argument('--part-sizes', default='8,16,32', help='Comma separated part sizes in MB')
+    parser.add_argument('--concurrency', default='4,16,32,64', help='Comma separated request concurrency values')
+    args = parser.parse_args()
+
+    benchmark = TransferBenchmark(args.url)
+    if args.create:
+        print(f'Creating {args.create}MB object at {args.url}...')
+        benchmark.create_object(args.create)
+    size = benchmark.object_size()
+    gb = size / 1024 ** 3
+    print(f'Object size: {size} bytes')
+
+    elapsed = benchmark.benchmark_download_file()
+    print(f'\ndownload_file: {elapsed:.3f} seconds, {gb / elapsed:.3f} GB/s')
+
+    for part_size_mb in [int(x) for x in args.part_sizes.split(',')]:
+        for concurrency in [int(x) for x in args.concurrency.split(',')]:
+            elapsed = benchmark.benchmark_ranged(part_size_mb * 1024 * 1024, concurrency)
+            print(f'ranged part={part_size_mb}MB concurrency={concurrency}: {elapsed:.3f} seconds, {gb / elapsed:.3f} GB/s')
@@ -0,0 +1,78 @@
+import os
+import struct
+import threading
+
+# Sidecar layout: magic, block size, file size, then one bit per block (LSB first)
+HEADER = struct.Struct('<4sIQ')
+MAGIC = b'FFBM'
+
+class BlockMap:
+    """Persistent presence bitmap of the fixed-size blocks of one partially cached file."""
+
+    def __init__(self, sidecar_path: str, size: int, block_size: int):
+        self.sidecar_path = sidecar_path
+        self.size = size
+        self.block_size = block_size
+        self.block_count = (size + block_size - 1) // block_size
+        self.bits = bytearray((self.block_count + 7) // 8)
+        self.present = 0
+        self.lock = threading.Lock()
+        self.fd = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.sidecar_path, 'rb') as f:
+                header = f.read(HEADER.size)
+                bits = f.read()
+        except FileNotFoundError:
+            return
+        if len(header) != HEADER.size or HEADER.unpack(header) != (MAGIC, self.block_size, self.size):
+            # Written for another block size or another version of the object, start over
+            print(f'🟠 discarding stale block map {self.sidecar_path}')
+            os.unlink(self.sidecar_path)
+            return
+        self.bits[:len(bits)] = bits[:len(self.bits)]
+        self.present = sum(bin(b).count('1') for b in self.bits)
+
+    def has(self, i: int) -> bool:
+        return bool(self.bits[i >> 3] & (1 << (i & 7)))
+
+    def missing(self, first: int, last: int):
+        return [i for i in range(first, last + 1) if not self.has(i)]
+
+    def add(self, i: int):
+        # Callers write and fdatasync the block data before calling add, so a set bit always means the bytes are on disk
+        with self.lock:
+            if self.has(i):
+                return
+            self.bits[i >> 3] |= 1 << (i & 7)
+            self.present += 1
+            if self.fd is None:
+                os.makedirs(os.path.dirname(self.sidecar_path), exist_ok=True)
+                self.fd = os.open(self.sidecar_path, os.O_RDWR | os.O_CREAT, 0o644)
+                os.pwrite(self.fd, HEADER.pack(MAGIC, self.block_size, self.size) + bytes(self.bits), 0)
+            else:
+                os.pwrite(self.fd, self.bits[i >> 3:(i >> 3) + 1], HEADER.size + (i >> 3))
+
+    def clear(self):
+        # Every block is fetched again, e.g. after the file failed its content hash
+        with self.lock:
+            self.bits = bytearray(len(self.bits))
+            self.present = 0
+            if self.fd is not None:
+                os.pwrite(self.fd, bytes(self.bits), HEADER.size)
+
+    def is_empty(self) -> bool:
+        return self.present == 0
+
+    def is_complete(self) -> bool:
+        return self.present >= self.block_count
+
+    def remove(self):
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+            if os.path.exists(self.sidecar_path):
+                os.unlink(self.sidecar_path)
@@ -0,0 +1,144 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from ffbox.cas import is_sha256
+
+RESCAN_INTERVAL = 60  # seconds between measurements of the cache dir, for what other mounts of the node added
+
+def scan(root: str, store_root=None):
+    """(allocated bytes under root, [(sha256, bytes)] of store entries no image links to any more).
+
+    Every inode is counted once however many images and the content store link it.
+    """
+    seen = set()
+    used = 0
+    unreferenced = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            try:
+                st = os.lstat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+            if store_root is not None and st.st_nlink == 1 and dirpath.startswith(store_root) and is_sha256(name):
+                unreferenced.append((name, st.st_blocks * 512))
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            used += st.st_blocks * 512
+    return used, unreferenced
+
+def disk_usage(root: str) -> int:
+    return scan(root)[0]
+
+class CacheManager:
+    """Keeps the node's cache dir under a byte budget, evicting whole files least recently used first.
+
+    The budget covers everything under root, the caches of every image mounted from it and the
+    content store, measured by inode so hardlinked content counts once. Each mount evicts its own
+    image's files: it reports every file it fetches or opens with touch, with the bytes that file
+    added to the disk, evict(path) is the mount's callback that drops one file and returns the
+    bytes that freed on disk, None when the file can't go right now (open, being fetched, changed
+    locally). Content store entries no image links to any more go first. Pinned paths, the hot set
+    of the image's read order, are never evicted.
+
+    touch runs on FUSE request threads and only keeps the count, measuring and evicting happen on
+    the manager's own thread, which touch wakes when the count goes over the budget.
+    """
+
+    def __init__(self, budget: int, evict, root=None, store=None):
+        self.budget = budget
+        self.evict = evict
+        self.root = root  # cache dir measured for the budget, None counts only the touched files
+        self.store = store  # ContentStore whose unreferenced entries are evicted first
+        self.sizes = OrderedDict()  # path -> bytes on disk, least recently used first
+        self.used = 0
+        self.measured_at = 0.0
+        self.unreferenced = []  # (sha256, bytes) of store entries only the store links, as of the last measurement
+        self.pinned = set()
+        self.evictions = 0
+        self.stuck_at = None  # usage at which nothing more could be evicted, avoids waking on every touch
+        self.lock = threading.Lock()
+        self.evict_lock = threading.Lock()
+        self.wake = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, name='ffbox-cache', daemon=True).start()
+
+    def run(self):
+        while True:
+            self.wake.wait(RESCAN_INTERVAL)
+            self.wake.clear()
+            if time.time() - self.measured_at > RESCAN_INTERVAL:
+                self.measure()
+            self.check()
+
+    def measure(self):
+        if self.root is None:
+            return
+        used, unreferenced = scan(self.root, self.store.root if self.store is not None else None)
+        with self.lock:
+            self.used = used
+            self.unreferenced = unreferenced
+            self.measured_at = time.time()
+
+    def track(self, path: str, size: int):
+        # A file already on disk when the mount starts, measure() counts its bytes
+        with self.lock:
+            self.sizes[path] = size
+            self.sizes.move_to_end(path)
+
+    def touch(self, path: str, size=None):
+        with self.lock:
+            if size is not None:
+                self.used += size - self.sizes.get(path, 0)
+                self.sizes[path] = size
+            elif path not in self.sizes:
+                return
+            self.sizes.move_to_end(path)
+        if self.used > self.budget and (self.stuck_at is None or self.used > self.stuck_at):
+            self.wake.set()
+
+    def forget(self, path: str, freed: int):
+        with self.lock:
+            self.sizes.pop(path, None)
+            self.used -= freed
+
+    def check(self):
+        if self.used > self.budget:
+            self.shrink()
+
+    def pin(self, paths):
+        with self.lock:
+            self.pinned.update(paths)
+
+    def shrink(self):
+        with self.evict_lock:
+            if self.store is not None:
+                with self.lock:
+                    unreferenced, self.unreferenced = self.unreferenced, []
+                for sha256, size in unreferenced:
+                    if self.used <= self.budget:
+                        with self.lock:
+                            self.unreferenced.append((sha256, size))
+                        continue
+                    if self.store.remove_unreferenced(sha256):
+                        with self.lock:
+                            self.used -= size
+                        self.evictions += 1
+            with self.lock:
+                candidates = [path for path in self.sizes if path not in self.pinned]
+            for path in candidates:
+                if self.used <= self.budget:
+                    break
+                freed = self.evict(path)
+                if freed is not None:
+                    self.forget(path, freed)
+                    self.evictions += 1
+            if self.used > self.budget:
+                self.stuck_at = self.used
+                print(f'🟠 cache holds {self.used} bytes over its {self.budget} byte budget, '
+                      f'everything left is pinned, open, changed locally or used by other images')
+            else:
+                self.stuck_at = None
@@ -0,0 +1,88 @@
+import os
+import re
+import hashlib
+import shutil
+
+CAS_DIR = '.ffbox_cas'  # node-wide content-addressed store, lives next to the per-image caches in cache_dir
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+SHA256_RE = re.compile(r'[0-9a-f]{64}')
+
+def is_sha256(value) -> bool:
+    # Hashes come from image metas and peer requests, anything else could name a path outside the store
+    return isinstance(value, str) and SHA256_RE.fullmatch(value) is not None
+
+def hash_file(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+class ContentStore:
+    """Complete files keyed by sha256, shared by every image mounted from the same cache_dir.
+
+    Entries are hardlinks of cached image files, so a file fetched for one image is served to
+    every other image that references the same content without another download or copy.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, sha256: str) -> str:
+        if not is_sha256(sha256):
+            raise ValueError(f'not a sha256 hex digest: {sha256!r}')
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def has(self, sha256: str) -> bool:
+        return is_sha256(sha256) and os.path.exists(self.path(sha256))
+
+    def link_into(self, sha256: str, dest: str) -> bool:
+        # Swap dest for a hardlink of the stored content, atomically so readers never see a missing file
+        if not is_sha256(sha256):
+            return False
+        tmp_path = f'{dest}.ffbox_cas_tmp'
+        try:
+            os.link(self.path(sha256), tmp_path)
+        except FileNotFoundError:
+            return False
+        os.replace(tmp_path, dest)
+        return True
+
+    def remove_unreferenced(self, sha256: str) -> bool:
+        # Only while no image links the entry, one may have linked it since it was found unreferenced
+        try:
+            if os.lstat(self.path(sha256)).st_nlink != 1:
+                return False
+        except (FileNotFoundError, ValueError):
+            return False
+        return self.remove(sha256)
+
+    def remove(self, sha256: str) -> bool:
+        try:
+            os.unlink(self.path(sha256))
+            return True
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def publish(self, src: str, sha256: str):
+        if not is_sha256(sha256):
+            return
+        cas_path = self.path(sha256)
+        if os.path.exists(cas_path):
+            return
+        os.makedirs(os.path.dirname(cas_path), exist_ok=True)
+        tmp_path = f'{cas_path}.{os.getpid()}.tmp'
+        os.link(src, tmp_path)
+        os.replace(tmp_path, cas_path)
+
+def break_link(path: str):
+    """Give path its own copy of the data before it is modified, so shared content stays intact."""
+    if os.stat(path).st_nlink <= 1:
+        return
+    tmp_path = f'{path}.ffbox_cow_tmp'
+    shutil.copy2(path, tmp_path)
+    os.replace(tmp_path, path)
@@ -12,6 +12,8 @@ import traceback
 import threading
 
 from ffbox.mount import ffmount
+from ffbox.prefetch import PrefetchScheduler, parse_read_order, READ_ORDER_LOG
+from ffbox.concurrency import ConcurrencyController
 
 CACHE_DIR = os.environ.get("FFBOX_CACHE_DIR", os.path.expanduser("~/ffbox_cache"))
 MOUNT_DIR = os.environ.get("FFBOX_MOUNT_DIR", os.path.expanduser("~/ffbox_mount"))
@@ -154,50 +156,37 @@ def run_python_project(bucket_url = None, extra_args = []):
     subprocess.run(run_cmd, shell=True, cwd=mountpoint)
 
 def background_pulling_read_order(mountpoint, num_threads=10):
-    read_order_log_path = os.path.join(mountpoint, ".ffbox/read_order.log")
+    read_order_log_path = os.path.join(mountpoint, READ_ORDER_LOG)
     
     if not os.path.exists(read_order_log_path):
         print(f"🟠 No read order log found at {read_order_log_path}")
         return
 
     with open(read_order_log_path, 'r') as log_file:
-        file_paths = [line.strip() for line in log_file.readlines()]
-
-    def cache_file(strace_line):
-        # print(f"🔵 Caching {strace_line}")
-        try:
-            fileop, rel_path = strace_line.split(' ', 1)
-            abs_path = os.path.join(mountpoint, rel_path)
-            if (fileop == 'openat' or fileop == 'open') and rel_path[-1] != '/':
-                with open(abs_path, 'rb') as f:
-                    f.read()  # Read the file to cache it
-            elif (fileop == 'openat' or fileop == 'open') and rel_path[-1] == '/':
-                os.listdir(abs_path)
-            elif fileop == 'stat' or fileop == 'lstat' or fileop == 'newfstatat': 
-                os.stat(abs_path)
-            # print(f"🔵 Cached {abs_path}")
-        except Exception as e:
-            print(f"🟠 Failed to cache line {strace_line}: {e}")
-            pass
-
-    lock = threading.Lock()  # Create a lock object
-
-    def worker():
-        while True:
-            with lock:  # Acquire the lock before modifying the list
-                if not file_paths:
-                    break
-                file_path = file_paths.pop(0)
-            cache_file(os.path.join(mountpoint, file_path))
-
-    threads = []
-    for _ in range(num_threads):
-        thread = threading.Thread(target=worker)
-        thread.start()
-        threads.append(thread)
-
-    for thread in threads:
-        thread.join()
+        entries = parse_read_order(log_file.read())
+
+    # num_threads is where prefetch starts, the controller moves it with what the mount sustains
+    controller = ConcurrencyController({'prefetch': num_threads})
+
+    def cache_file(rel_path, fileop):
+        # print(f"🔵 Caching {rel_path}")
+        abs_path = os.path.join(mountpoint, rel_path)
+        if fileop == 'openat' and rel_path[-1] != '/':
+            with controller.slot('prefetch', os.path.getsize(abs_path)), open(abs_path, 'rb') as f:
+                while f.read(8 * 1024 * 1024):  # Read the file to cache it, without holding it in memory
+                    pass
+        elif fileop == 'openat' and rel_path[-1] == '/':
+            os.listdir(abs_path)
+        elif fileop == 'stat' or fileop == 'lstat' or fileop == 'newfstatat': 
+            os.stat(abs_path)
+        # print(f"🔵 Cached {abs_path}")
+
+    # The rclone mount can't tell us where the app is, so prefetch runs through the whole log
+    scheduler = PrefetchScheduler(cache_file, workers=controller.maximum, distance=None)
+    scheduler.add((order, rel_path, fileop) for order, (fileop, rel_path) in enumerate(entries))
+    scheduler.start()
+    scheduler.join()
+    print(f"🔵 prefetch concurrency: {controller.stats()['prefetch']}")
 
 def log_file_read_order(run_cmd, push_dir):
     log_file_path = os.path.join(push_dir, ".ffbox/unfiltered_read_order.log")
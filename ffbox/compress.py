@@ -0,0 +1,82 @@
+import os
+import zlib
+import struct
+
+COMPRESSION = 'zlib'  # value of the compression attr of compressed files in folder meta and the index
+COMPRESSED_BLOCK_SIZE = 1024 * 1024  # raw bytes per independently compressed block
+MIN_COMPRESS_SIZE = 4096  # smaller files gain nothing worth a block table
+MIN_SAVING = 0.1  # store raw when compression saves less than this fraction
+TABLE_PREFIX_SIZE = 64 * 1024  # first read of a compressed object, holds the table of files up to ~8GB
+
+# Layout: header, block count + 1 u64 offsets of the compressed blocks in the object (the last one
+# is the end of the object), then the blocks. Every block decompresses on its own, so a range of
+# the raw file only needs the blocks that cover it.
+HEADER = struct.Struct('<4sIQI')  # magic, raw block size, raw size, block count
+MAGIC = b'FFBZ'
+
+# Already dense formats, compressing them costs CPU on both ends for next to no bytes
+DENSE_EXTENSIONS = {
+    '.safetensors', '.bin', '.pt', '.pth', '.ckpt', '.gguf', '.onnx', '.msgpack', '.h5',
+    '.gz', '.tgz', '.xz', '.bz2', '.zst', '.zip', '.whl', '.7z',
+    '.jpg', '.jpeg', '.png', '.webp', '.gif', '.mp3', '.mp4', '.webm',
+}
+
+def choose_compression(path: str, size: int):
+    """Compression of a file by type, None to store it raw"""
+    if size < MIN_COMPRESS_SIZE:
+        return None
+    if os.path.splitext(path)[1].lower() in DENSE_EXTENSIONS:
+        return None
+    return COMPRESSION
+
+def compress_file(src: str, dest: str, block_size=COMPRESSED_BLOCK_SIZE) -> int:
+    """Write the compressed object of src to dest, returns its size"""
+    raw_size = os.path.getsize(src)
+    block_count = (raw_size + block_size - 1) // block_size
+    table_size = HEADER.size + 8 * (block_count + 1)
+    offsets = [table_size]
+    with open(src, 'rb') as f, open(dest, 'wb') as out:
+        out.seek(table_size)
+        for _ in range(block_count):
+            out.write(zlib.compress(f.read(block_size), 6))
+            offsets.append(out.tell())
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, block_size, raw_size, block_count))
+        out.write(struct.pack(f'<{block_count + 1}Q', *offsets))
+    return offsets[-1]
+
+class BlockTable:
+    """Where the compressed blocks of one object are"""
+
+    def __init__(self, block_size, raw_size, offsets):
+        self.block_size = block_size
+        self.raw_size = raw_size
+        self.offsets = offsets
+
+    @classmethod
+    def table_size(cls, prefix: bytes) -> int:
+        magic, block_size, raw_size, block_count = HEADER.unpack_from(prefix, 0)
+        if magic != MAGIC:
+            raise ValueError('not an ffbox compressed object')
+        return HEADER.size + 8 * (block_count + 1)
+
+    @classmethod
+    def parse(cls, table: bytes):
+        magic, block_size, raw_size, block_count = HEADER.unpack_from(table, 0)
+        offsets = struct.unpack_from(f'<{block_count + 1}Q', table, HEADER.size)
+        return cls(block_size, raw_size, offsets)
+
+    def span(self, offset: int, length: int):
+        """(first block, last block, stored offset, stored length) covering a raw range"""
+        end = min(offset + length, self.raw_size)
+        first = offset // self.block_size
+        last = (end - 1) // self.block_size
+        return first, last, self.offsets[first], self.offsets[last + 1] - self.offsets[first]
+
+    def decompress(self, first: int, last: int, stored: bytes, offset: int, length: int) -> bytes:
+        """Raw bytes [offset, offset + length) out of the stored bytes of blocks first..last"""
+        base = self.offsets[first]
+        raw = b''.join(zlib.decompress(stored[self.offsets[i] - base:self.offsets[i + 1] - base])
+                       for i in range(first, last + 1))
+        start = offset - first * self.block_size
+        return raw[start:start + length]
@@ -0,0 +1,151 @@
+import time
+import errno
+import threading
+from contextlib import contextmanager
+
+DEFAULT_LIMITS = {'foreground': 16, 'prefetch': 16, 'push': 32}  # starting requests in flight per traffic class
+DEFAULT_MAX_LIMIT = 256  # pools are sized to this, the limit decides how much of them is used
+ADJUST_INTERVAL = 0.5  # seconds of completions behind each adjustment
+LATENCY_TOLERANCE = 1.5  # latency this many times the best seen means requests are queueing somewhere
+LATENCY_FLAT = 1.1  # below this many times the best seen, another request in flight costs nothing
+THROUGHPUT_GAIN = 1.05  # a window faster than the previous one by this much pays for the extra requests
+LATENCY_DECREASE = 0.75
+ERROR_DECREASE = 0.5
+BEST_LATENCY_DRIFT = 1.01  # the best latency creeps up each window, so one lucky window doesn't pin it
+
+class AimdLimit:
+    """Requests in flight of one traffic class, adjusted from the throughput and latency it measures.
+
+    Starts in slow start, doubling every window in which the limit was reached, until the first
+    congestion signal: errors halve the limit, latency beyond LATENCY_TOLERANCE times the best seen
+    without a throughput gain cuts it by a quarter. After that the limit grows by one per saturated
+    window, as long as that still buys throughput or costs no latency, so it settles just past the
+    point where the link or backend is full. Windows with fewer requests than the limit in flight
+    leave it alone.
+    """
+
+    def __init__(self, name, initial, minimum=1, maximum=DEFAULT_MAX_LIMIT):
+        self.name = name
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.waiting = 0  # requests queued for a slot
+        self.slow_start = True
+        self.best_latency = None
+        self.throughput = 0.0  # bytes/s of the last window with completions
+        self.latency = 0.0  # mean seconds per request of that window
+        self.cond = threading.Condition()
+        self.reset_window(time.monotonic())
+
+    def reset_window(self, now):
+        self.window_start = now
+        self.window_bytes = 0
+        self.window_latency = 0.0
+        self.window_count = 0
+        self.window_errors = 0
+        self.window_peak = self.in_flight
+
+    def acquire(self, moved=None):
+        """Wait for a free slot, False as soon as moved() says the request went to another class"""
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                if moved is not None and moved():
+                    return False
+                self.waiting += 1
+                try:
+                    self.cond.wait()
+                finally:
+                    self.waiting -= 1
+            if moved is not None and moved():
+                return False
+            self.in_flight += 1
+            self.window_peak = max(self.window_peak, self.in_flight)
+            return True
+
+    def release(self, nbytes, latency, error):
+        with self.cond:
+            self.in_flight -= 1
+            self.window_count += 1
+            self.window_latency += latency
+            if error:
+                self.window_errors += 1
+            else:
+                self.window_bytes += nbytes
+            now = time.monotonic()
+            if now - self.window_start >= ADJUST_INTERVAL:
+                self.adjust(now)
+            self.cond.notify_all()
+
+    def adjust(self, now):
+        throughput = self.window_bytes / (now - self.window_start)
+        latency = self.window_latency / self.window_count
+        saturated = self.window_peak >= int(self.limit)
+        if self.window_errors:
+            self.limit = max(self.minimum, self.limit * ERROR_DECREASE)
+            self.slow_start = False
+        elif (self.best_latency is not None and latency > self.best_latency * LATENCY_TOLERANCE
+                and throughput <= self.throughput * THROUGHPUT_GAIN):
+            # More requests in flight only made each of them slower
+            self.limit = max(self.minimum, self.limit * LATENCY_DECREASE)
+            self.slow_start = False
+        elif saturated and self.slow_start:
+            self.limit = min(self.maximum, self.limit * 2)
+        elif saturated and (throughput > self.throughput * THROUGHPUT_GAIN
+                            or self.best_latency is None or latency <= self.best_latency * LATENCY_FLAT):
+            self.limit = min(self.maximum, self.limit + 1)
+        if not self.window_errors:
+            self.best_latency = latency if self.best_latency is None else min(latency, self.best_latency * BEST_LATENCY_DRIFT)
+        self.throughput = throughput
+        self.latency = latency
+        self.reset_window(now)
+
+    def stats(self):
+        return {
+            'limit': int(self.limit),
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'slow_start': self.slow_start,
+            'throughput_mb_s': round(self.throughput / 1024 ** 2, 1),
+            'latency_ms': round(self.latency * 1000, 1),
+        }
+
+class ConcurrencyController:
+    """One AimdLimit per traffic class (foreground reads, prefetch, push), shared by everything fetching for a mount or push"""
+
+    def __init__(self, limits=None, maximum=DEFAULT_MAX_LIMIT):
+        self.maximum = maximum
+        self.limits = {name: AimdLimit(name, initial, maximum=maximum)
+                       for name, initial in {**DEFAULT_LIMITS, **(limits or {})}.items()}
+
+    @contextmanager
+    def slot(self, traffic, nbytes, fetch=None):
+        """Hold one of the in-flight requests of traffic around a request moving nbytes.
+
+        With a fetch, its traffic attribute is the class and may be promoted while it waits.
+        """
+        limit = self.limits[traffic if fetch is None else fetch.traffic]
+        while not limit.acquire(None if fetch is None else lambda name=limit.name: fetch.traffic != name):
+            limit = self.limits[fetch.traffic]
+        start = time.monotonic()
+        error = False
+        try:
+            yield
+        except Exception as e:
+            # A missing object says nothing about the backend's capacity
+            error = not isinstance(e, FileNotFoundError) and getattr(e, 'errno', None) != errno.ENOENT
+            raise
+        finally:
+            limit.release(nbytes, time.monotonic() - start, error)
+
+    def wake(self, traffic):
+        # Requests waiting for a slot of traffic check whether they were promoted meanwhile
+        limit = self.limits[traffic]
+        with limit.cond:
+            limit.cond.notify_all()
+
+    def limit(self, traffic) -> int:
+        return int(self.limits[traffic].limit)
+
+    def stats(self):
+        return {name: limit.stats() for name, limit in self.limits.items()}
@@ -0,0 +1,282 @@
+import os
+import json
+import errno
+import socket
+import socketserver
+import threading
+from collections import OrderedDict, deque
+from botocore.exceptions import ClientError
+
+DEFAULT_SOCKET = os.path.join(os.path.expanduser('~'), '.cache', 'ffbox', 'ffbox.sock')
+DEFAULT_DAEMON_WORKERS = 32
+DEFAULT_DAEMON_MEMORY = 1024 * 1024 * 1024  # recently fetched ranges kept for replicas asking a moment later
+DEFAULT_DAEMON_BLOCK_SIZE = 1024 * 1024  # unit fetches are shared in, mounts with any block size of whole MBs line up
+
+# Protocol: one JSON request per line, {"mount", "source", "url", "offset", "length"}, a null length is the whole object.
+# The reply is one JSON header line, {"length"} followed by that many bytes, or {"errno", "error"}.
+
+class Fetch:
+    """One backend read of contiguous blocks, shared by every mount that asks for one of them while it is in flight"""
+
+    def __init__(self, obj, blocks):
+        self.obj = obj  # (source, url)
+        self.blocks = blocks  # [None] for the whole object
+        self.done = threading.Event()
+        self.data = None
+        self.error = None
+
+class FairQueue:
+    """One FIFO per mount, served round robin so a mount with a deep queue can't starve the others.
+
+    Requests are block sized parts, so taking turns per request splits bandwidth evenly between mounts.
+    """
+
+    def __init__(self):
+        self.queues = OrderedDict()  # mount -> deque, in turn order
+        self.cond = threading.Condition()
+
+    def put(self, mount, item):
+        with self.cond:
+            self.queues.setdefault(mount, deque()).append(item)
+            self.cond.notify()
+
+    def get(self):
+        with self.cond:
+            while not self.queues:
+                self.cond.wait()
+            mount, queue = next(iter(self.queues.items()))
+            item = queue.popleft()
+            # Move the mount to the back of the line
+            del self.queues[mount]
+            if queue:
+                self.queues[mount] = queue
+            return item
+
+class FetchDaemon:
+    """Node-wide owner of backend connections and the fetch queue, shared by every mount on the node.
+
+    Mounts ask for byte ranges over a unix socket. Ranges are split in blocks of block_size like the
+    mounts' InflightTable does, a block in flight is fetched once whatever range of whichever mount
+    asked for it, and recently fetched blocks are kept in memory for replicas that mount the same
+    image a moment later.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, workers=DEFAULT_DAEMON_WORKERS, memory=DEFAULT_DAEMON_MEMORY,
+                 block_size=DEFAULT_DAEMON_BLOCK_SIZE):
+        self.socket_path = socket_path
+        self.workers = workers
+        self.memory = memory
+        self.block_size = block_size
+        self.clients = {}  # source -> NsClient
+        self.inflight = {}  # (source, url) -> {block: Fetch}
+        self.recent = OrderedDict()  # (source, url, block) -> bytes, least recently used first
+        self.recent_bytes = 0
+        self.queue = FairQueue()
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'backend_fetches': 0, 'shared_fetches': 0, 'memory_hits': 0}
+
+    def client(self, source, url=''):
+        # Imported here, the mount imports this module for DaemonClient
+        from ffbox.mount import S3Client, PathClient, HttpClient, is_http_url
+        # Absolute urls of dir meta can live on another backend than the mount, one shared client per scheme
+        if is_http_url(url) and not is_http_url(source):
+            source = 'https://'
+        elif url.startswith('s3://') and not source.startswith('s3://'):
+            source = 's3://'
+        with self.lock:
+            if source not in self.clients:
+                if source.startswith('/'):
+                    self.clients[source] = PathClient(source)
+                elif is_http_url(source):
+                    self.clients[source] = HttpClient(source, max_connections=self.workers)
+                else:
+                    self.clients[source] = S3Client(source)
+            return self.clients[source]
+
+    def get_range(self, mount, source, url, offset, length):
+        obj = (source, url)
+        if length is None:
+            blocks = [None]  # whole objects are shared as one block
+        elif length <= 0:
+            return b''
+        else:
+            blocks = list(range(offset // self.block_size, (offset + length - 1) // self.block_size + 1))
+        found = {}
+        mine = []
+        waits = set()
+        with self.lock:
+            self.stats['requests'] += 1
+            running = self.inflight.setdefault(obj, {})
+            for i in blocks:
+                data = self.recent.get(obj + (i,))
+                if data is not None:
+                    self.recent.move_to_end(obj + (i,))
+                    found[i] = data
+                    continue
+                fetch = running.get(i)
+                if fetch is not None:
+                    waits.add(fetch)
+                elif mine and i is not None and mine[-1].blocks[-1] == i - 1:
+                    mine[-1].blocks.append(i)
+                    running[i] = mine[-1]
+                else:
+                    mine.append(Fetch(obj, [i]))
+                    running[i] = mine[-1]
+            if not running:
+                del self.inflight[obj]
+            if not mine and not waits:
+                self.stats['memory_hits'] += 1
+            self.stats['backend_fetches'] += len(mine)
+            self.stats['shared_fetches'] += len(waits)
+        for fetch in mine:
+            self.queue.put(mount, fetch)
+        for fetch in mine + list(waits):
+            fetch.done.wait()
+            if fetch.error is not None:
+                raise fetch.error
+            found.update(self.split(fetch))
+        if length is None:
+            return found[None]
+        data = b''.join(found[i] for i in blocks)
+        start = offset - blocks[0] * self.block_size
+        return data[start:start + length]
+
+    def split(self, fetch):
+        # {block: bytes} of a finished fetch, blocks past the end of the object come out short or empty
+        if fetch.blocks == [None]:
+            return {None: fetch.data}
+        return {i: fetch.data[n * self.block_size:(n + 1) * self.block_size] for n, i in enumerate(fetch.blocks)}
+
+    def read_range(self, source, url, offset, length):
+        max_retries = 3
+        for attempt in range(max_retries):
+            try:
+                if length is None:
+                    return self.client(source, url).get_binary(url)
+                return self.client(source, url).get_range(url, offset, length)
+            except Exception as e:
+                if isinstance(e, ClientError) and e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                    raise OSError(errno.ENOENT, f'{url} does not exist')
+                if isinstance(e, FileNotFoundError):
+                    raise OSError(errno.ENOENT, f'{url} does not exist')
+                if attempt < max_retries - 1:
+                    print(f'🔴Retrying range read of {url} (attempt {attempt + 2}/{max_retries})')
+                else:
+                    print(f'🔴 error reading range {offset}+{length} of {url}: {e}')
+                    raise OSError(errno.EIO, str(e))
+
+    def remember(self, key, data):
+        if len(data) > self.memory:
+            return
+        old = self.recent.pop(key, None)
+        if old is not None:
+            self.recent_bytes -= len(old)
+        self.recent[key] = data
+        self.recent_bytes += len(data)
+        while self.recent_bytes > self.memory:
+            _, old = self.recent.popitem(last=False)
+            self.recent_bytes -= len(old)
+
+    def worker(self):
+        while True:
+            fetch = self.queue.get()
+            source, url = fetch.obj
+            try:
+                if fetch.blocks == [None]:
+                    fetch.data = self.read_range(source, url, 0, None)
+                else:
+                    fetch.data = self.read_range(source, url, fetch.blocks[0] * self.block_size,
+                                                 len(fetch.blocks) * self.block_size)
+            except OSError as e:
+                fetch.error = e
+            with self.lock:
+                running = self.inflight[fetch.obj]
+                for i in fetch.blocks:
+                    del running[i]
+                if not running:
+                    del self.inflight[fetch.obj]
+                if fetch.data is not None:
+                    for i, data in self.split(fetch).items():
+                        self.remember(fetch.obj + (i,), data)
+            fetch.done.set()
+
+    def serve_forever(self):
+        from ffbox.mount import ensure_pool_connections
+        ensure_pool_connections(self.workers)
+        for _ in range(self.workers):
+            threading.Thread(target=self.worker, daemon=True).start()
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    request = json.loads(line)
+                    if request.get('op') == 'stats':
+                        self.wfile.write(json.dumps(daemon.stats).encode('utf-8') + b'\n')
+                        continue
+                    try:
+                        data = daemon.get_range(request['mount'], request['source'], request['url'],
+                                                request['offset'], request['length'])
+                    except OSError as e:
+                        self.wfile.write(json.dumps({'errno': e.errno or errno.EIO, 'error': str(e)}).encode('utf-8') + b'\n')
+                        continue
+                    self.wfile.write(json.dumps({'length': len(data)}).encode('utf-8') + b'\n')
+                    self.wfile.write(data)
+
+        with socketserver.ThreadingUnixStreamServer(self.socket_path, Handler) as server:
+            server.daemon_threads = True
+            print(f'🦄 ffbox daemon serving on {self.socket_path} with {self.workers} workers')
+            server.serve_forever()
+
+class DaemonClient:
+    """Fetches byte ranges through the node's FetchDaemon, one connection per mount thread"""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, mount_id=None):
+        self.socket_path = socket_path
+        self.mount_id = mount_id or str(os.getpid())
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socket_path)
+            conn = (sock, sock.makefile('rb'))
+            self.local.conn = conn
+        return conn
+
+    def close_connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+            self.local.conn = None
+
+    def request(self, request):
+        try:
+            sock, reader = self.connection()
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            header = json.loads(reader.readline() or b'null')
+            if header is None:
+                raise ConnectionError('daemon closed the connection')
+            data = reader.read(header['length']) if 'length' in header else None
+            if data is not None and len(data) != header['length']:
+                raise ConnectionError('daemon closed the connection mid reply')
+        except (OSError, ValueError) as e:
+            # A daemon restart leaves a dead connection behind, the next request reconnects
+            self.close_connection()
+            raise OSError(errno.EIO, f'ffbox daemon: {e}')
+        if 'errno' in header:
+            raise OSError(header['errno'], header['error'])
+        return header, data
+
+    def get_range(self, source, url, offset, length):
+        header, data = self.request({'mount': self.mount_id, 'source': source, 'url': url, 'offset': offset, 'length': length})
+        return data
+
+    def stats(self):
+        header, _ = self.request({'op': 'stats'})
+        return header
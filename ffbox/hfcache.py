@@ -0,0 +1,81 @@
+import os
+import re
+import fcntl
+import shutil
+from urllib.parse import quote
+
+FICLONE = 0x40049409  # linux ioctl, share the extents of a file on btrfs/xfs instead of copying
+SNAPSHOT_RE = re.compile(r'/(models|datasets|spaces)--([^/]+)/snapshots/([^/]+)/(.+)$')
+BLOB_RE = re.compile(r'/(models|datasets|spaces)--([^/]+)/blobs/([^/]+)$')
+MAX_LINK_HOPS = 40
+
+def hub_cache_dir():
+    """The hub cache of huggingface_hub, HF_HUB_CACHE or HF_HOME/hub"""
+    if os.environ.get('HF_HUB_CACHE'):
+        return os.environ['HF_HUB_CACHE']
+    hf_home = os.environ.get('HF_HOME', os.path.join(os.path.expanduser('~'), '.cache', 'huggingface'))
+    return os.path.join(hf_home, 'hub')
+
+def hub_endpoint():
+    return os.environ.get('HF_ENDPOINT', 'https://huggingface.co').rstrip('/')
+
+def hf_origin(path: str):
+    """(hf attrs, path in the repo) of a file that links into a hub cache snapshot, None for other files.
+
+    The project can link the file itself or any folder above it into snapshots/<revision>/, the
+    snapshot file links on to blobs/<blob>. hf_repo follows the hub url paths: 'org/name' for
+    models, 'datasets/org/name' and 'spaces/org/name' for the others.
+    """
+    for _ in range(MAX_LINK_HOPS):
+        # Resolve the folders but not the file, the snapshot path carries the revision and repo path
+        snapshot_path = os.path.join(os.path.realpath(os.path.dirname(path)), os.path.basename(path))
+        match = SNAPSHOT_RE.search(snapshot_path)
+        if match is not None:
+            break
+        if not os.path.islink(snapshot_path):
+            return None
+        path = os.path.join(os.path.dirname(snapshot_path), os.readlink(snapshot_path))
+    else:
+        return None
+    blob = BLOB_RE.search(os.path.realpath(snapshot_path))
+    if blob is None:
+        return None  # a plain copy in the snapshot, no blob to point at
+    repo_type, name, revision, repo_path = match.groups()
+    repo = name.replace('--', '/')
+    if repo_type != 'models':
+        repo = f'{repo_type}/{repo}'
+    return {'hf_repo': repo, 'hf_revision': revision, 'hf_blob': blob.group(3)}, repo_path
+
+def hub_blob_path(hf_repo: str, hf_blob: str, hub_dir=None) -> str:
+    parts = hf_repo.split('/')
+    repo_type = 'models'
+    if parts[0] in ('datasets', 'spaces'):
+        repo_type, parts = parts[0], parts[1:]
+    return os.path.join(hub_dir or hub_cache_dir(), f"{repo_type}--{'--'.join(parts)}", 'blobs', hf_blob)
+
+def hub_url(hf_repo: str, hf_revision: str, repo_path: str) -> str:
+    return f'{hub_endpoint()}/{hf_repo}/resolve/{hf_revision}/{quote(repo_path)}'
+
+def reflink(src: str, dest: str) -> bool:
+    try:
+        with open(src, 'rb') as s, open(dest, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dest):
+            os.unlink(dest)
+        return False
+
+def link_blob(blob_path: str, dest: str) -> bool:
+    """Swap dest for the hub blob, a hardlink, else a reflink, else a local copy; False without the blob"""
+    tmp_path = f'{dest}.ffbox_hf_tmp'
+    try:
+        os.link(blob_path, tmp_path)
+    except FileNotFoundError:
+        return False
+    except OSError:
+        # The hub cache is on another filesystem or doesn't allow links to its files
+        if not reflink(blob_path, tmp_path):
+            shutil.copyfile(blob_path, tmp_path)
+    os.replace(tmp_path, dest)
+    return True
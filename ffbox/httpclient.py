@@ -0,0 +1,257 @@
+import os
+import time
+import threading
+import http.client
+import http.server
+from functools import partial
+from collections import defaultdict
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse, urljoin, quote
+
+DEFAULT_HTTP_CONNECTIONS = 64  # idle keep-alive connections kept per host
+HTTP_TIMEOUT = 60
+HTTP_CHUNK_SIZE = 1024 * 1024  # bytes held in memory at once while streaming a range into a file
+MAX_REDIRECTS = 5
+REDIRECT_TTL = 600  # seconds a resolved location is reused, signed CDN urls of the hub last about an hour
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+STALE_STATUSES = (403, 404, 410)  # an expired signed location, resolve the original url again
+
+def is_http_url(url: str) -> bool:
+    return url.startswith(('http://', 'https://'))
+
+def hf_token_hosts():
+    # The hub token only goes to the hub itself, never to the CDN hosts it redirects to
+    endpoint = os.environ.get('HF_ENDPOINT', 'https://huggingface.co')
+    return {urlparse(endpoint).netloc, 'huggingface.co'}
+
+class ConnectionPool:
+    """Keep-alive connections per (scheme, host), so ranged reads of the same file reuse one TCP+TLS session"""
+
+    def __init__(self, max_idle=DEFAULT_HTTP_CONNECTIONS, timeout=HTTP_TIMEOUT):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.idle = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def get(self, scheme, netloc):
+        """(connection, reused), a reused connection may have been closed by the server meanwhile"""
+        with self.lock:
+            if self.idle[(scheme, netloc)]:
+                return self.idle[(scheme, netloc)].pop(), True
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return connection_class(netloc, timeout=self.timeout), False
+
+    def put(self, scheme, netloc, connection):
+        with self.lock:
+            if len(self.idle[(scheme, netloc)]) < self.max_idle:
+                self.idle[(scheme, netloc)].append(connection)
+                return
+        connection.close()
+
+class HttpClient:
+    """NsClient over plain HTTP(S) range requests, e.g. https://huggingface.co/<repo>/resolve/<rev>/<file>.
+
+    Relative paths are resolved against the mounted url, full http(s) urls from dir meta are used
+    as they are. Redirects are followed and the final location is cached for REDIRECT_TTL seconds,
+    so every block of a hub file goes straight to the CDN instead of bouncing through the hub.
+    """
+
+    def __init__(self, url: str, max_connections=DEFAULT_HTTP_CONNECTIONS):
+        self.root = url
+        self.pool = ConnectionPool(max_connections)
+        self.redirects = {}  # url -> (final location, resolved at)
+        self.redirects_lock = threading.Lock()
+        self.token = os.environ.get('HF_TOKEN') or os.environ.get('HUGGING_FACE_HUB_TOKEN')
+        self.token_hosts = hf_token_hosts()
+
+    def url_for(self, relpath: str) -> str:
+        if is_http_url(relpath):
+            return relpath
+        return f"{self.root.rstrip('/')}/{quote(relpath.lstrip('/'))}"
+
+    def location(self, url):
+        with self.redirects_lock:
+            cached = self.redirects.get(url)
+            if cached is not None and time.time() - cached[1] < REDIRECT_TTL:
+                return cached[0]
+            self.redirects.pop(url, None)
+        return url
+
+    def remember_location(self, url, location):
+        if location != url:
+            with self.redirects_lock:
+                self.redirects[url] = (location, time.time())
+
+    def forget_location(self, url):
+        with self.redirects_lock:
+            self.redirects.pop(url, None)
+
+    def send(self, method, target, headers):
+        parsed = urlparse(target)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        headers = dict(headers)
+        if self.token and parsed.netloc in self.token_hosts:
+            headers['Authorization'] = f'Bearer {self.token}'
+        while True:
+            connection, reused = self.pool.get(parsed.scheme, parsed.netloc)
+            try:
+                connection.request(method, path, headers=headers)
+                return connection, connection.getresponse()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                if not reused:
+                    raise
+                # The server dropped the idle keep-alive connection, go again on a fresh one
+
+    def release(self, target, connection, response):
+        # Only a fully read response leaves the connection ready for the next request
+        parsed = urlparse(target)
+        if response.isclosed() and not response.will_close:
+            self.pool.put(parsed.scheme, parsed.netloc, connection)
+        else:
+            connection.close()
+
+    @contextmanager
+    def request(self, method, relpath, headers=None):
+        """Response to method on relpath after redirects, the caller reads the body inside the with block"""
+        url = self.url_for(relpath)
+        target = self.location(url)
+        cached = target != url
+        headers = headers or {}
+        for _ in range(MAX_REDIRECTS + 1):
+            connection, response = self.send(method, target, headers)
+            if response.status in REDIRECT_STATUSES:
+                response.read()
+                self.release(target, connection, response)
+                target = urljoin(target, response.getheader('Location'))
+                continue
+            if response.status in STALE_STATUSES and cached:
+                # The cached location expired early, resolve again from the original url
+                response.read()
+                self.release(target, connection, response)
+                self.forget_location(url)
+                target, cached = url, False
+                continue
+            try:
+                if response.status in (404, 410):
+                    raise FileNotFoundError(relpath)
+                # 416 is a range past the end of the object, left to read_range
+                if response.status >= 400 and response.status != 416:
+                    raise IOError(f'{method} {target} failed with HTTP {response.status}')
+                self.remember_location(url, target)
+                yield response
+            finally:
+                self.release(target, connection, response)
+            return
+        raise IOError(f'too many redirects for {url}')
+
+    def get_object(self, relpath: str):
+        return self.get_binary(relpath).decode('utf-8')
+
+    def get_binary(self, relpath: str):
+        with self.request('GET', relpath) as response:
+            return response.read()
+
+    def get_range(self, relpath: str, offset: int, length: int):
+        chunks = []
+        self.read_range(relpath, offset, length, chunks.append)
+        return b''.join(chunks)
+
+    def read_into(self, relpath: str, fd: int, offset: int, length: int, fd_offset: int):
+        written = [0]
+
+        def write(chunk):
+            os.pwrite(fd, chunk, fd_offset + written[0])
+            written[0] += len(chunk)
+        self.read_range(relpath, offset, length, write)
+        return written[0]
+
+    def read_range(self, relpath, offset, length, write):
+        headers = {'Range': f'bytes={offset}-{offset + length - 1}'}
+        with self.request('GET', relpath, headers) as response:
+            if response.status == 416:
+                # Range past the end of the object, S3 and files return nothing there as well
+                response.read()
+                return
+            if response.status == 200 and offset:
+                raise IOError(f'{relpath} does not support range requests')
+            # A 200 from offset 0 is the whole file, only the asked length is read
+            remaining = length
+            while remaining:
+                chunk = response.read(min(HTTP_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                write(chunk)
+                remaining -= len(chunk)
+
+    def head(self, relpath: str):
+        with self.request('HEAD', relpath) as response:
+            response.read()
+            last_modified = response.getheader('Last-Modified')
+            return {
+                'size': int(response.getheader('Content-Length', 0)),
+                'mtime': parsedate_to_datetime(last_modified).timestamp() if last_modified else 0,
+            }
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Static files with single range support, a local stand-in for the hub or any CDN"""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) or not os.path.exists(path):
+            self.send_error(404)
+            return None
+        f = open(path, 'rb')
+        size = os.fstat(f.fileno()).st_size
+        start, end = 0, size - 1
+        ranged = self.headers.get('Range', '').startswith('bytes=')
+        if ranged:
+            first, _, last = self.headers['Range'][len('bytes='):].partition('-')
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if start >= size:
+                f.close()
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+        self.send_response(206 if ranged else 200)
+        if ranged:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Last-Modified', self.date_time_string(int(os.path.getmtime(path))))
+        self.end_headers()
+        f.seek(start)
+        self.remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        while self.remaining:
+            chunk = source.read(min(HTTP_CHUNK_SIZE, self.remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            self.remaining -= len(chunk)
+
+def serve(directory, port=8000, host='127.0.0.1'):
+    """Serve directory with range requests, e.g. an ffpush'ed image to mount over http"""
+    server = http.server.ThreadingHTTPServer((host, port), partial(RangeRequestHandler, directory=directory))
+    print(f'🚀 serving {directory} with range requests on http://{host}:{server.server_address[1]}')
+    return server
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve a folder with range requests for testing the http backend')
+    parser.add_argument('directory', help='Folder to serve')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--host', default='127.0.0.1')
+    args = parser.parse_args()
+    serve(args.directory, args.port, args.host).serve_forever()
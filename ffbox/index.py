@@ -0,0 +1,141 @@
+import os
+import mmap
+import struct
+
+INDEX_FILE = '.ffbox_index'  # whole-tree metadata index, next to the root .ffbox_dir_meta.json
+
+# Layout: header, fixed-size records sorted by (parent, name), then one blob of interned strings.
+# String fields of a record are (offset, length) pairs into the blob; size is -1 for folders.
+# Version 2 records add the pack url of small packed files and their (offset, length) in the pack,
+# -1 when the file is its own object. Version 3 records add the compression of the stored object,
+# version 4 records the hub repo, revision and blob of files pushed from a Hugging Face hub cache.
+HEADER = struct.Struct('<8sII')
+RECORD_V1 = struct.Struct('<8Iqdd')
+RECORD_V2 = struct.Struct('<8Iqdd2Iqq')
+RECORD_V3 = struct.Struct('<8Iqdd2Iqq2I')
+RECORD = struct.Struct('<8Iqdd2Iqq8I')
+MAGIC = b'FFBXIDX4'
+RECORDS = {b'FFBXIDX1': RECORD_V1, b'FFBXIDX2': RECORD_V2, b'FFBXIDX3': RECORD_V3, MAGIC: RECORD}
+
+def encode(s: str) -> bytes:
+    return s.encode('utf-8', 'surrogateescape')
+
+def write_index(entries, out_path: str):
+    """Write (parent, name, attr) entries, attr shaped like a .ffbox_dir_meta.json value, to out_path.
+
+    parent is the folder path relative to the image root without slashes at the ends, '' for the root.
+    """
+    rows = sorted(((encode(parent), encode(name), attr) for parent, name, attr in entries),
+                  key=lambda row: (row[0], row[1]))
+    blob = bytearray()
+    interned = {}
+
+    def intern(value: bytes):
+        if value not in interned:
+            interned[value] = len(blob)
+            blob.extend(value)
+        return interned[value], len(value)
+
+    records = bytearray()
+    for parent, name, attr in rows:
+        size = attr.get('size')
+        records += RECORD.pack(
+            *intern(parent), *intern(name),
+            *intern(encode(attr.get('url') or '')), *intern(encode(attr.get('sha256') or '')),
+            -1 if size is None else size,
+            attr.get('mtime') or 0.0,
+            attr.get('ctime') or 0.0,
+            *intern(encode(attr.get('pack') or '')),
+            attr.get('pack_offset', -1),
+            attr.get('pack_length', -1),
+            *intern(encode(attr.get('compression') or '')),
+            *intern(encode(attr.get('hf_repo') or '')),
+            *intern(encode(attr.get('hf_revision') or '')),
+            *intern(encode(attr.get('hf_blob') or '')),
+        )
+    tmp_path = f'{out_path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(rows), 0))
+        f.write(records)
+        f.write(blob)
+    os.replace(tmp_path, out_path)
+
+class TreeIndex:
+    """Read-only, mmap-backed view of an index written by write_index."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, _ = HEADER.unpack_from(self.mm, 0)
+        if magic not in RECORDS:
+            raise ValueError(f'{path} is not an ffbox index')
+        # Images pushed by older versions keep working
+        self.record_struct = RECORDS[magic]
+        self.blob_offset = HEADER.size + self.count * self.record_struct.size
+
+    def string(self, offset: int, length: int) -> bytes:
+        start = self.blob_offset + offset
+        return self.mm[start:start + length]
+
+    def record(self, i: int):
+        return self.record_struct.unpack_from(self.mm, HEADER.size + i * self.record_struct.size)
+
+    def key(self, i: int):
+        record = self.record(i)
+        return self.string(record[0], record[1]), self.string(record[2], record[3])
+
+    def bisect_left(self, key):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def attr(self, record):
+        size = record[8]
+        attr = {
+            'url': self.string(record[4], record[5]).decode('utf-8', 'surrogateescape'),
+            'mtime': record[9],
+            'ctime': record[10],
+        }
+        if size >= 0:
+            attr['size'] = size
+            if record[7]:
+                attr['sha256'] = self.string(record[6], record[7]).decode('utf-8')
+            if len(record) > 11 and record[12]:
+                attr['pack'] = self.string(record[11], record[12]).decode('utf-8', 'surrogateescape')
+                attr['pack_offset'] = record[13]
+                attr['pack_length'] = record[14]
+            if len(record) > 15 and record[16]:
+                attr['compression'] = self.string(record[15], record[16]).decode('utf-8')
+            if len(record) > 17 and record[22]:
+                attr['hf_repo'] = self.string(record[17], record[18]).decode('utf-8')
+                attr['hf_revision'] = self.string(record[19], record[20]).decode('utf-8')
+                attr['hf_blob'] = self.string(record[21], record[22]).decode('utf-8')
+        return attr
+
+    def lookup(self, parent: str, name: str):
+        key = (encode(parent), encode(name))
+        i = self.bisect_left(key)
+        if i < self.count and self.key(i) == key:
+            return self.attr(self.record(i))
+        return None
+
+    def children(self, parent: str):
+        """Entries of one folder, shaped like its .ffbox_dir_meta.json"""
+        parent_key = encode(parent)
+        children = {}
+        i = self.bisect_left((parent_key, b''))
+        while i < self.count:
+            record = self.record(i)
+            if self.string(record[0], record[1]) != parent_key:
+                break
+            children[self.string(record[2], record[3]).decode('utf-8', 'surrogateescape')] = self.attr(record)
+            i += 1
+        return children
+
+    def close(self):
+        self.mm.close()
@@ -0,0 +1,83 @@
+import threading
+from collections import defaultdict
+
+class Fetch:
+    """One fetch in flight, every requester of its blocks waits on it instead of fetching again"""
+
+    def __init__(self, key, blocks, traffic):
+        self.key = key  # the object, a path of the mount
+        self.blocks = blocks
+        self.traffic = traffic  # traffic class it queues in, promoted to 'foreground' when an application read waits
+        self.done = threading.Event()
+        self.error = None
+
+class InflightTable:
+    """Fetches in flight keyed by object and block, so overlapping requests share one download.
+
+    claim() splits the blocks a requester needs into ones it has to fetch itself, registered here
+    until finish(), and fetches already running that it waits for. A foreground requester waiting
+    on a prefetch promotes it: the fetch switches to the foreground class, and if it is still
+    queued for a prefetch slot it is woken to take a foreground one instead.
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.fetches = defaultdict(dict)  # key -> {block: Fetch}
+        self.lock = threading.Lock()
+        self.joined = 0  # requests served by a fetch somebody else started
+        self.promotions = 0
+
+    def claim(self, key, blocks, traffic, has, blocks_per_part):
+        """(fetches to run, fetches to wait for) covering blocks, has(i) tells blocks already cached"""
+        mine = []
+        waits = set()
+        with self.lock:
+            running = self.fetches[key]
+            for i in blocks:
+                if has(i):
+                    continue
+                fetch = running.get(i)
+                if fetch is not None:
+                    waits.add(fetch)
+                elif mine and mine[-1].blocks[-1] == i - 1 and len(mine[-1].blocks) < blocks_per_part:
+                    mine[-1].blocks.append(i)
+                    running[i] = mine[-1]
+                else:
+                    mine.append(Fetch(key, [i], traffic))
+                    running[i] = mine[-1]
+            self.joined += len(waits)
+        if traffic == 'foreground':
+            for fetch in waits:
+                self.promote(fetch)
+        return mine, waits
+
+    def promote(self, fetch):
+        with self.lock:
+            if fetch.traffic == 'foreground' or fetch.done.is_set():
+                return
+            previous, fetch.traffic = fetch.traffic, 'foreground'
+            self.promotions += 1
+        self.controller.wake(previous)
+
+    def promote_key(self, key):
+        """A foreground request is about to wait for the whole object, promote every fetch of it"""
+        with self.lock:
+            fetches = set(self.fetches.get(key, {}).values())
+        for fetch in fetches:
+            self.promote(fetch)
+
+    def finish(self, fetch, error=None):
+        with self.lock:
+            running = self.fetches[fetch.key]
+            for i in fetch.blocks:
+                if running.get(i) is fetch:
+                    del running[i]
+            if not running:
+                del self.fetches[fetch.key]
+        fetch.error = error
+        fetch.done.set()
+
+    def stats(self):
+        with self.lock:
+            in_flight = len({id(fetch) for running in self.fetches.values() for fetch in running.values()})
+        return {'in_flight': in_flight, 'joined': self.joined, 'promotions': self.promotions}
@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+
+class Entry:
+    """Metadata of one remote file or folder, size is None for folders, pack is set for small packed files"""
+    __slots__ = ('size', 'mtime', 'ctime', 'url', 'sha256', 'pack', 'compression', 'hf')
+
+    def __init__(self, size, mtime, ctime, url, sha256=None, pack=None, compression=None, hf=None):
+        self.size = size
+        self.mtime = mtime
+        self.ctime = ctime
+        self.url = url
+        self.sha256 = sha256
+        self.pack = pack  # url of the pack object holding the file
+        self.compression = compression  # the stored object is made of compressed blocks, size is the raw size
+        self.hf = hf  # (repo, revision, blob) of files pushed from a Hugging Face hub cache
+
+    @property
+    def is_dir(self):
+        return self.size is None
+
+    @classmethod
+    def from_attr(cls, attr):
+        # attr is shaped like a .ffbox_dir_meta.json value
+        return cls(attr.get('size'), attr.get('mtime') or 0.0, attr.get('ctime') or 0.0, attr.get('url'), attr.get('sha256'),
+                   attr.get('pack'), attr.get('compression'),
+                   (attr['hf_repo'], attr.get('hf_revision'), attr['hf_blob']) if attr.get('hf_blob') else None)
+
+class MetaTree:
+    """In-memory inode table of the remote image, answers getattr/readdir without touching the cache dir.
+
+    Folders are keyed by their path relative to the image root ('' for the root). With a whole-tree
+    TreeIndex every lookup is answered straight from the mmapped index, otherwise folders are filled
+    one by one from their listing the first time they are visited.
+    """
+
+    def __init__(self):
+        self.index = None
+        self.folders = {}  # folder -> {name: Entry}
+        self.lock = threading.Lock()
+
+    def is_loaded(self, folder: str) -> bool:
+        return self.index is not None or folder in self.folders
+
+    def add_folder(self, folder: str, children: dict):
+        with self.lock:
+            self.folders[folder] = children
+
+    def lookup(self, folder: str, name: str):
+        if self.index is not None:
+            attr = self.index.lookup(folder, name)
+            return Entry.from_attr(attr) if attr is not None else None
+        children = self.folders.get(folder)
+        if children is None:
+            return None
+        return children.get(name)
+
+    def children(self, folder: str):
+        if self.index is not None:
+            return {name: Entry.from_attr(attr) for name, attr in self.index.children(folder).items()}
+        return self.folders.get(folder, {})
+
+class NegativeCache:
+    """Bounded set of (folder, name) lookups known to miss, so import probe storms skip the tree and the disk"""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+
+    def __contains__(self, key):
+        if key in self.entries:
+            self.hits += 1
+            return True
+        return False
+
+    def add(self, key):
+        with self.lock:
+            self.entries[key] = None
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def discard_tree(self, folder: str):
+        # A directory appeared at folder, lookups at or under it may hit now
+        prefix = folder + '/'
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == folder or key[0].startswith(prefix)]:
+                del self.entries[key]
@@ -0,0 +1,178 @@
+import time
+import json
+import threading
+import http.server
+from collections import defaultdict
+
+DEFAULT_METRICS_HOST = '127.0.0.1'
+STATS_FILE = '/.ffbox_stats'  # virtual file at the root of every mount, a json snapshot of the metrics
+STATS_SNAPSHOT_TTL = 1.0  # seconds an open reuses the snapshot its lookup rendered, so the size matches
+HISTOGRAM_BUCKETS = 26  # powers of two from 1us, the last bucket holds everything beyond ~33s
+QUANTILES = (0.5, 0.9, 0.99)
+
+# name -> (type, label, help) of every metric the mount keeps, in exposition order
+FAMILIES = {
+    'fuse_op_seconds': ('histogram', 'op', 'FUSE operations served, by operation'),
+    'fuse_op_errors_total': ('counter', 'op', 'FUSE operations that returned an error'),
+    'backend_request_seconds': ('histogram', 'source', 'Range and object requests, by where they were served from'),
+    'backend_errors_total': ('counter', 'source', 'Requests that failed, retried ones included'),
+    'fetched_bytes_total': ('counter', 'source', 'Bytes fetched, by where they were served from'),
+    'served_bytes_total': ('counter', None, 'Bytes returned to applications by read'),
+    'cache_hits_total': ('counter', 'op', 'Opens and reads served from the cache dir without fetching'),
+    'cache_misses_total': ('counter', 'op', 'Opens and reads that had to fetch first'),
+    'queue_depth': ('gauge', 'queue', 'Requests in flight or waiting, by queue'),
+    'concurrency_limit': ('gauge', 'traffic', 'Requests in flight allowed per traffic class'),
+}
+
+class Histogram:
+    """Latencies in power of two buckets from 1us, observe() is one bit_length and three adds"""
+
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.sum_ns = 0
+        self.lock = threading.Lock()
+
+    def observe(self, elapsed_ns: int):
+        bucket = min((elapsed_ns >> 10).bit_length(), HISTOGRAM_BUCKETS - 1)
+        with self.lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.sum_ns += elapsed_ns
+
+    @staticmethod
+    def bound(bucket: int) -> float:
+        # Upper bound in seconds, bucket 0 is everything under ~1us
+        return (1 << (bucket + 10)) / 1e9
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the quantile, at most 2x off
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return self.bound(bucket)
+        return 0.0
+
+    def summary(self):
+        with self.lock:
+            summary = {'count': self.count, 'mean_ms': round(self.sum_ns / self.count / 1e6, 3) if self.count else 0.0}
+            for q in QUANTILES:
+                summary[f'p{int(q * 100)}_ms'] = round(self.quantile(q) * 1000, 3)
+        return summary
+
+class Metrics:
+    """Counters, latency histograms and gauges of one mount, each family has at most one label.
+
+    Gauges are callables returning {label: value}, evaluated only when the metrics are read.
+    """
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.counters = defaultdict(int)  # (name, label value) -> count
+        self.histograms = defaultdict(Histogram)  # (name, label value) -> Histogram
+        self.gauges = {}  # name -> callable
+        self.lock = threading.Lock()
+
+    def count(self, name, label=None, value=1):
+        with self.lock:
+            self.counters[(name, label)] += value
+
+    def observe(self, name, label, elapsed_ns):
+        self.histograms[(name, label)].observe(elapsed_ns)
+
+    def gauge(self, name, values):
+        self.gauges[name] = values
+
+    def snapshot(self):
+        """{family: {label: value}} with histograms summarized, the content of the stats file"""
+        snapshot = {'uptime_s': round(time.time() - self.start_time, 1)}
+        with self.lock:
+            counters = list(self.counters.items())
+        for (name, label), value in counters:
+            snapshot.setdefault(name, {})[label or 'total'] = value
+        for (name, label), histogram in list(self.histograms.items()):
+            snapshot.setdefault(name, {})[label or 'total'] = histogram.summary()
+        for name, values in self.gauges.items():
+            snapshot[name] = values()
+        return snapshot
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition of every family"""
+        with self.lock:
+            counters = list(self.counters.items())
+        histograms = list(self.histograms.items())
+        lines = []
+        for name, (kind, label_name, help_text) in FAMILIES.items():
+            lines.append(f'# HELP ffbox_{name} {help_text}')
+            lines.append(f'# TYPE ffbox_{name} {kind}')
+            if kind == 'counter':
+                for (family, label), value in counters:
+                    if family == name:
+                        lines.append(f'ffbox_{name}{labels(label_name, label)} {value}')
+            elif kind == 'gauge':
+                values = self.gauges.get(name)
+                for label, value in (values() if values else {}).items():
+                    lines.append(f'ffbox_{name}{labels(label_name, label)} {value}')
+            else:
+                for (family, label), histogram in histograms:
+                    if family == name:
+                        lines.extend(histogram_lines(name, label_name, label, histogram))
+        return '\n'.join(lines) + '\n'
+
+def labels(label_name, label, extra=''):
+    pairs = [f'{label_name}="{label}"'] if label_name and label is not None else []
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def histogram_lines(name, label_name, label, histogram):
+    with histogram.lock:
+        counts, count, sum_ns = list(histogram.counts), histogram.count, histogram.sum_ns
+    lines = []
+    cumulative = 0
+    for bucket, bucket_count in enumerate(counts[:-1]):
+        cumulative += bucket_count
+        le = 'le="%g"' % Histogram.bound(bucket)
+        lines.append(f'ffbox_{name}_bucket{labels(label_name, label, le)} {cumulative}')
+    le = 'le="+Inf"'
+    lines.append(f'ffbox_{name}_bucket{labels(label_name, label, le)} {count}')
+    lines.append(f'ffbox_{name}_sum{labels(label_name, label)} {sum_ns / 1e9}')
+    lines.append(f'ffbox_{name}_count{labels(label_name, label)} {count}')
+    return lines
+
+def render_stats(snapshot) -> bytes:
+    return (json.dumps(snapshot, indent=2) + '\n').encode('utf-8')
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    metrics = None  # set on the subclass serve_metrics creates
+    tracer = None
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/trace' and self.tracer is not None:
+            # The trace so far, without waiting for the unmount
+            body, content_type = self.tracer.export(), 'application/json'
+        elif path in ('/', '/metrics'):
+            body, content_type = self.metrics.prometheus().encode('utf-8'), 'text/plain; version=0.0.4'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scraped every few seconds, not worth a line each
+
+def serve_metrics(metrics, port, host=DEFAULT_METRICS_HOST, tracer=None):
+    """Prometheus endpoint of metrics on a background thread, and /trace with a tracer, returns the server"""
+    handler = type('BoundMetricsHandler', (MetricsHandler,), {'metrics': metrics, 'tracer': tracer})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='ffbox-metrics', daemon=True).start()
+    print(f'📈 serving metrics on http://{host}:{port}/metrics')
+    return server
@@ -10,16 +10,38 @@ import threading
 import boto3
 from botocore import UNSIGNED
 from botocore.client import Config
-from urllib.parse import urlparse
+from urllib.parse import urlparse, quote
 from fuse import FUSE, FuseOSError, Operations, fuse_get_context
 from collections import defaultdict
 import traceback
 from botocore.exceptions import ClientError
-from queue import Queue
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
 from boto3.s3.transfer import TransferConfig
 import time
+from ffbox.blockmap import BlockMap
+from ffbox.transfer import RangedDownloader, DEFAULT_PART_SIZE, DEFAULT_CONCURRENCY
+from contextlib import nullcontext, contextmanager
+from ffbox.cas import ContentStore, CAS_DIR, hash_file, break_link, is_sha256
+from ffbox.index import TreeIndex, INDEX_FILE, write_index
+from ffbox.metatree import MetaTree, Entry, NegativeCache
+from ffbox.prefetch import PrefetchScheduler, parse_read_order, profile_entries, READ_ORDER_LOG, DEFAULT_PREFETCH_WORKERS, DEFAULT_PREFETCH_DISTANCE
+from ffbox.cache import CacheManager
+from ffbox.httpclient import HttpClient, is_http_url, DEFAULT_HTTP_CONNECTIONS
+from ffbox.aiofetch import FetchEngine, Presigner, DEFAULT_ASYNC_CONNECTIONS, DEFAULT_WARM_CONNECTIONS
+from ffbox.concurrency import ConcurrencyController, DEFAULT_MAX_LIMIT
+from ffbox.inflight import InflightTable
+from ffbox.metrics import Metrics, STATS_FILE, STATS_SNAPSHOT_TTL, render_stats, serve_metrics
+from ffbox.tracer import Tracer, TRACE_FILE
+from ffbox.hfcache import hf_origin, hub_blob_path, hub_cache_dir, hub_url, link_blob
+from ffbox.pack import plan_packs, write_pack, read_pack_manifest, PACK_DIR, DEFAULT_PACK_FILE_SIZE
+from ffbox.compress import choose_compression, compress_file, BlockTable, TABLE_PREFIX_SIZE, MIN_SAVING
+from ffbox.upload import UploadPipeline, DEFAULT_UPLOAD_WORKERS, DEFAULT_BYTES_IN_FLIGHT
+from ffbox.peer import PeerServer, PeerClient, DEFAULT_PEER_PORT, DEFAULT_PEER_HOST
+from ffbox.daemon import FetchDaemon, DaemonClient, DEFAULT_SOCKET, DEFAULT_DAEMON_WORKERS, DEFAULT_DAEMON_MEMORY, DEFAULT_DAEMON_BLOCK_SIZE
+from ffbox.recorder import AccessRecorder, read_profile, profile_to_read_order, PROFILE_FILE, RECORDED_PROFILE_FILE, RECORDED_READ_ORDER_FILE, OPS as RECORDED_OPS
+import stat
+import tempfile
 
 aws_access_key = os.getenv('AWS_ACCESS_KEY_ID')
 aws_secret_key = os.getenv('AWS_SECRET_ACCESS_KEY')
@@ -34,11 +56,23 @@ else:
     s3_client = boto3.client('s3', config=config)
 
 META_DIR = '.ffbox_noot'
+LOCAL_PATHS_FILE = 'local_paths'  # in META_DIR, one path per line, the paths changed through the mount so far
 DIR_META_FILE = '.ffbox_dir_meta.json'
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024  # 8MB, unit of on-demand range fetches in lazy mode
+NEGATIVE_TIMEOUT = 60  # seconds the kernel remembers a missing path before asking the mount again
+IMMUTABLE_TIMEOUT = 24 * 3600  # attr/entry/negative timeouts of immutable mounts, pushed images never change
 
 uid = os.getuid()
 gid = os.getgid()
 
+def ensure_pool_connections(max_connections: int):
+    # Parallel ranged downloads need at least one pooled connection per request in flight
+    global s3_client
+    if s3_client.meta.config.max_pool_connections < max_connections:
+        s3_client = boto3.client('s3', config=s3_client.meta.config.merge(Config(max_pool_connections=max_connections)))
+
+STREAM_CHUNK_SIZE = 1024 * 1024  # bytes held in memory at once while streaming a range into a file
+
 class NsClient: # Network storage client
     def __init__(self, url: str):
         self.root = url
@@ -46,6 +80,22 @@ class NsClient: # Network storage client
     def get_object(self, relpath: str) -> str:
         raise Exception('Please implement me!')
 
+    def get_range(self, relpath: str, offset: int, length: int) -> bytes:
+        raise Exception('Please implement me!')
+
+    def get_binary(self, relpath: str) -> bytes:
+        raise Exception('Please implement me!')
+
+    def head(self, relpath: str) -> dict:
+        # {'size', 'mtime'} of an object, FileNotFoundError when there is no such object
+        raise Exception('Please implement me!')
+
+    def read_into(self, relpath: str, fd: int, offset: int, length: int, fd_offset: int) -> int:
+        # Write [offset, offset + length) of the object into fd at fd_offset, returns the bytes written
+        data = self.get_range(relpath, offset, length)
+        os.pwrite(fd, data, fd_offset)
+        return len(data)
+
 nsclient:NsClient = None
 
 class S3Client(NsClient):
@@ -55,13 +105,89 @@ class S3Client(NsClient):
         self.bucket = parsed_url.netloc
         self.prefix = parsed_url.path.strip('/')  # Remove both leading and trailing slashes
 
+    def bucket_key(self, relpath: str):
+        # relpath is either relative to the mounted prefix or a full s3:// url from dir meta
+        if relpath.startswith('s3://'):
+            parsed_url = urlparse(relpath)
+            return parsed_url.netloc, parsed_url.path.lstrip('/')
+        return self.bucket, f'{self.prefix}/{relpath}'.lstrip('/')
+
     def get_object(self, relpath: str): 
+        bucket, key = self.bucket_key(relpath)
         response = s3_client.get_object(
-            Bucket=self.bucket,
-            Key=f'{self.prefix}/{relpath}'
+            Bucket=bucket,
+            Key=key
         )
         return response['Body'].read().decode('utf-8')
 
+    def get_binary(self, relpath: str):
+        bucket, key = self.bucket_key(relpath)
+        response = s3_client.get_object(
+            Bucket=bucket,
+            Key=key
+        )
+        return response['Body'].read()
+
+    def get_range(self, relpath: str, offset: int, length: int):
+        bucket, key = self.bucket_key(relpath)
+        response = s3_client.get_object(
+            Bucket=bucket,
+            Key=key,
+            Range=f'bytes={offset}-{offset + length - 1}'
+        )
+        return response['Body'].read()
+
+    def head(self, relpath: str):
+        bucket, key = self.bucket_key(relpath)
+        try:
+            response = s3_client.head_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NotFound', 'NoSuchKey'):
+                raise FileNotFoundError(relpath)
+            raise
+        return {'size': response['ContentLength'], 'mtime': response['LastModified'].timestamp()}
+
+    def read_into(self, relpath: str, fd: int, offset: int, length: int, fd_offset: int):
+        bucket, key = self.bucket_key(relpath)
+        response = s3_client.get_object(
+            Bucket=bucket,
+            Key=key,
+            Range=f'bytes={offset}-{offset + length - 1}'
+        )
+        # Stream the body in chunks instead of building the whole part in memory
+        written = 0
+        for chunk in response['Body'].iter_chunks(STREAM_CHUNK_SIZE):
+            os.pwrite(fd, chunk, fd_offset + written)
+            written += len(chunk)
+        return written
+
+class AsyncS3Client(S3Client):
+    """S3Client whose range reads go through the asyncio FetchEngine over presigned urls"""
+
+    def __init__(self, url: str, engine: FetchEngine):
+        super().__init__(url)
+        self.engine = engine
+        self.presigner = Presigner(lambda: s3_client)
+
+    def presigned_url(self, relpath: str):
+        return self.presigner.url(*self.bucket_key(relpath))
+
+    def get_range(self, relpath: str, offset: int, length: int):
+        return self.engine.get_range(self.presigned_url(relpath), offset, length)
+
+    def read_into(self, relpath: str, fd: int, offset: int, length: int, fd_offset: int):
+        # The loop only moves bytes, the calling thread writes them so disk writes never stall other fetches
+        return NsClient.read_into(self, relpath, fd, offset, length, fd_offset)
+
+    def get_binary(self, relpath: str):
+        return self.engine.get(self.presigned_url(relpath))
+
+    def warm(self, count):
+        # Resolve the bucket endpoint and open connections before the application starts reading
+        start_time = time.time()
+        opened = self.engine.warm(self.presigned_url(DIR_META_FILE), count)
+        print(f'🔥 opened {opened} connections to the bucket in {time.time() - start_time:.3f} seconds')
+
 class PathClient(NsClient):
     def __init__(self, url: str):
         super().__init__(url)
@@ -72,78 +198,386 @@ class PathClient(NsClient):
             content = file.read()
         return content
 
+    def get_binary(self, relpath: str):
+        with open(os.path.join(self.source, relpath), 'rb') as file:
+            content = file.read()
+        return content
+
+    def get_range(self, relpath: str, offset: int, length: int):
+        fd = os.open(os.path.join(self.source, relpath), os.O_RDONLY)
+        try:
+            return os.pread(fd, length, offset)
+        finally:
+            os.close(fd)
+
+    def head(self, relpath: str):
+        stats = os.stat(os.path.join(self.source, relpath))
+        return {'size': stats.st_size, 'mtime': stats.st_mtime}
+
+    def read_into(self, relpath: str, fd: int, offset: int, length: int, fd_offset: int):
+        src_fd = os.open(os.path.join(self.source, relpath), os.O_RDONLY)
+        try:
+            written = 0
+            while written < length:
+                try:
+                    # In-kernel copy, the data never reaches python
+                    n = os.copy_file_range(src_fd, fd, length - written, offset + written, fd_offset + written)
+                except (AttributeError, OSError):
+                    # No copy_file_range on this platform or between these filesystems
+                    chunk = os.pread(src_fd, min(STREAM_CHUNK_SIZE, length - written), offset + written)
+                    n = os.pwrite(fd, chunk, fd_offset + written) if chunk else 0
+                if n == 0:
+                    break  # end of the source file
+                written += n
+            return written
+        finally:
+            os.close(src_fd)
+
+# Dir meta urls are relative to the mount or absolute s3:// and http(s):// urls, an image on S3 can
+# point at model files on the hub and the other way round, so absolute urls pick their client by scheme
+http_client = HttpClient('')
+s3_url_client = S3Client('s3://')
+
+def client_for(url: str):
+    if is_http_url(url) and not is_http_url(nsclient.root):
+        return http_client
+    if url.startswith('s3://') and not nsclient.root.startswith('s3://'):
+        return s3_url_client
+    return nsclient
+
 class Passthrough(Operations):
-    def __init__(self, root, mountpoint, s3_url = None, is_ffbox_folder = False):
+    def __init__(self, root, mountpoint, s3_url = None, is_ffbox_folder = False, lazy = False, block_size = DEFAULT_BLOCK_SIZE,
+                 part_size = DEFAULT_PART_SIZE, concurrency = DEFAULT_CONCURRENCY, cas_dir = None, immutable = False,
+                 verbose = False):
         self.root = root
         self.mountpoint = mountpoint
         self.s3_url = s3_url
         self.is_ffbox_folder = is_ffbox_folder
+        self.lazy = lazy  # open returns the sparse placeholder right away, read fetches missing blocks
+        self.immutable = immutable  # read-only mount, the kernel caches attributes, entries and pages
+        self.verbose = verbose  # a line per FUSE call and block fetch, too slow to leave on under load
+        self.block_size = block_size
+        self.block_maps = {}  # path -> BlockMap of a partially cached file, persisted under META_DIR
+        self.block_maps_lock = threading.Lock()
+        # Ranged parts are whole blocks so that every finished part can be recorded in the block map
+        self.blocks_per_part = max(1, part_size // block_size)
+        # concurrency is where the foreground limit starts, the controller moves it with what the link sustains
+        self.controller = ConcurrencyController({'foreground': concurrency})
+        self.downloader = RangedDownloader(self.blocks_per_part * block_size, self.controller.maximum)
+        self.inflight = InflightTable(self.controller)  # block fetches in flight, overlapping requests join them
+        self.traffic = threading.local()  # .name is 'prefetch' on prefetch workers, fetches count as foreground otherwise
+        self.content_store = ContentStore(cas_dir) if cas_dir else None
+        self.hf_hub_dir = hub_cache_dir()  # blobs of the node's Hugging Face hub cache are linked instead of fetched
+        self.open_handles = defaultdict(int)  # path -> file handles currently open on the cache file
+        self.index = None  # whole-tree TreeIndex, per-folder meta json is the fallback for old images
+        self.tree = MetaTree()  # remote files and folders, served without materializing them in the cache dir
+        self.local_paths = self.load_local_paths()  # paths created, changed or removed through the mount, the cache dir is authoritative
+        self.local_paths_lock = threading.Lock()
+        self.mount_time = time.time()
+        self.negative = NegativeCache()  # (folder, name) lookups that are known to miss
+        self.backend_calls = 0
+        self.metrics = Metrics()  # read through STATS_FILE in the mount and the metrics port
+        self.metrics.gauge('queue_depth', self.queue_depths)
+        self.metrics.gauge('concurrency_limit', lambda: {name: self.controller.limit(name) for name in self.controller.limits})
+        self.stats_snapshot = (0.0, b'')  # (rendered at, content) of the last lookup of STATS_FILE
+        self.stats_files = {}  # fh -> content of an open STATS_FILE
+        self.prefetcher = None  # PrefetchScheduler warming the read order log, when background pulling is on
+        self.recorder = None  # AccessRecorder of every lookup, open and read, when recording a profile
+        self.tracer = None  # Tracer of FUSE requests, fetches and prefetch, when tracing
+        self.cache = None  # CacheManager keeping the cache dir under a byte budget, when one is set
+        self.daemon = None  # DaemonClient of the node's fetch daemon, range reads go through it when set
+        self.peers = None  # PeerClient of other nodes, asked for ranges before the backend
+        self.peer_keys = {}  # absolute url -> path of the files this mount can serve to peers
+        self.block_tables = {}  # path -> BlockTable of files stored compressed
+        self.handles_lock = threading.Lock()
         parsed_url = urlparse(s3_url)
         self.bucket = parsed_url.netloc
         self.prefix = parsed_url.path.strip('/')  # Remove both leading and trailing slashes
         self.locks = defaultdict(threading.Lock)  # Automatically create a lock for each new file path
         self.cached_dir = set()
+        self.store_linked = set()  # paths linked from the content store by this mount, they took no new space
         print(f'init bucket: {self.bucket}')
         print(f'init prefix: {self.prefix}')
 
-    def start_background_pulling(self):
-        # Start a new thread to read from the S3 URL's read_order.log
-        threading.Thread(target=self.read_log_and_spawn_threads, daemon=True).start()
+    def start_background_pulling(self, workers=DEFAULT_PREFETCH_WORKERS, distance=DEFAULT_PREFETCH_DISTANCE):
+        self.prefetcher = PrefetchScheduler(self.prefetch_entry, workers=workers, distance=distance)
+        # Fetch the profile off the mount thread, then warm entries in recorded order
+        threading.Thread(target=self.load_read_order, daemon=True).start()
 
-    def read_log_and_spawn_threads(self):
-        # Download the log file from the S3 URL
-        log_key = f"{self.prefix}/.ffbox/read_order.log"
+    def read_order_entries(self):
+        # A recorded access profile knows byte ranges, the read order log only knows paths
         try:
-            response = s3_client.get_object(Bucket=self.bucket, Key=log_key)
-            log_content = response['Body'].read().decode('utf-8')
-            log_lines = log_content.splitlines()
-            print(f'🦄 bg thread finished reading log file')
-            # Create a queue and populate it with log lines
-            task_queue = Queue()
-            for line in log_lines:
-                task_queue.put(line)
-            print(f'🦄 bg thread finished populating queue')
-            # Function for threads to consume tasks from the queue
-            def worker():
-                while not task_queue.empty():
-                    line = task_queue.get()
-                    try:
-                        self.handle_file_operation(line)
-                    except Exception as e:
-                        print(f'🦄🟠 bg thread error handling file operation: {e}')
-                    # finally:
-                    #     task_queue.task_done()
-
-            # Spawn 200 threads
-            threads = []
-            for _ in range(200):
-                thread = threading.Thread(target=worker, daemon=True)
-                thread.start()
-                threads.append(thread)
-
-            # Wait for all tasks to be completed
-            # task_queue.join()
-
-        except self.s3_client.exceptions.NoSuchKey:
-            print(f"Log file {log_key} does not exist in bucket {self.bucket}.")
+            profile_path = os.path.join(self.root, META_DIR, 'access_profile.bin')
+            os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+            with open(profile_path, 'wb') as f:
+                f.write(nsclient.get_binary(PROFILE_FILE))
+            return profile_entries(read_profile(profile_path), self.block_size)
+        except Exception as e:
+            print(f"🦄 no access profile, falling back to the read order log: {e}")
+        try:
+            log_content = nsclient.get_object(READ_ORDER_LOG)
+        except Exception as e:
+            print(f"🦄 no read order log: {e}")
+            return []
+        return [('/' + rel_path.rstrip('/'), (operation, '/' + rel_path.rstrip('/'), 0, 0))
+                for operation, rel_path in parse_read_order(log_content)]
+
+    def load_read_order(self):
+        entries = self.read_order_entries()
+        if not entries:
+            return
+        self.prefetcher.add((order, key, payload) for order, (key, payload) in enumerate(entries))
+        self.prefetcher.start()
+        print(f'🦄 prefetching {len(entries)} entries')
+
+    def prefetch_entry(self, key, payload):
+        self.traffic.name = 'prefetch'
+        try:
+            with self.trace('prefetch', 'prefetch', key=key):
+                self.prefetch_payload(payload)
+        finally:
+            self.traffic.name = 'foreground'
+
+    def prefetch_payload(self, payload):
+        operation, path, offset, length = payload
+        entry = self.remote_entry(path)
+        if entry is None:
+            return
+        if entry.is_dir:
+            self.load_folder(path.strip('/'))
+        elif self.lazy and not entry.pack and operation in ('open', 'read'):
+            # Profiles know which blocks were read, lazy mounts only warm those
+            with self.locks[path]:
+                if self.is_file_cached(path):
+                    return
+                self.materialize(path, entry)
+                if self.link_local_copy(path, entry):
+                    return
+            if operation == 'read':
+                with self.holding(path):
+                    self.fetch_blocks(path, offset, length, entry.size)
+        elif operation in ('openat', 'open', 'read') and not self.is_file_cached(path):
+            print(f'🦄 prefetching {path}')
+            self.ensure_cached(path, entry)
+
+    def start_cache_manager(self, budget, cache_dir):
+        # The budget is the node's, cache_dir holds every image mounted from it and the content store
+        self.cache = CacheManager(budget, self.evict_file, root=cache_dir, store=self.content_store)
+        # Scanning a large cache dir and fetching the hot set stay off the mount thread
+        threading.Thread(target=self.load_cache_state, daemon=True).start()
+
+    def load_cache_state(self):
+        self.cache.pin(path for key, (operation, path, offset, length) in self.read_order_entries())
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root and META_DIR in dirnames:
+                dirnames.remove(META_DIR)
+            for filename in filenames:
+                try:
+                    st = os.lstat(os.path.join(dirpath, filename))
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_atime, '/' + os.path.relpath(os.path.join(dirpath, filename), self.root), st.st_blocks * 512))
+        # Least recently used first, the same order touch keeps afterwards
+        for atime, path, size in sorted(files):
+            self.cache.track(path, size)
+        self.cache.measure()
+        print(f'🦄 node cache holds {self.cache.used} of {self.cache.budget} bytes, {len(self.cache.pinned)} paths of this image pinned')
+        self.cache.check()
+        self.cache.start()
+
+    def touch_cache(self, path):
+        if self.cache is None:
+            return
+        try:
+            # Allocated blocks, sparse placeholders only count what was fetched
+            size = os.stat(self._full_path(path)).st_blocks * 512
+        except FileNotFoundError:
+            return
+        # Content linked from the store was counted when it was fetched, the link adds no bytes
+        self.cache.touch(path, 0 if path in self.store_linked else size)
+
+    def evict_file(self, path):
+        # Drop one cached image file, it is fetched again from the image on the next access. Returns
+        # the bytes that freed on disk, None when the file has to stay
+        if path in self.local_paths:
+            return None
+        entry = self.remote_entry(path)
+        if entry is None or entry.is_dir:
+            return None
+        lock = self.locks[path]
+        if not lock.acquire(blocking=False):
+            return None  # being fetched right now
+        try:
+            full_path = self._full_path(path)
+            # open counts its handle before touching the file, so a file seen closed here stays closed
+            with self.handles_lock:
+                if self.open_handles.get(path, 0) > 0:
+                    return None
+                try:
+                    xattrs = os.listxattr(full_path)
+                    st = os.lstat(full_path)
+                except FileNotFoundError:
+                    return 0
+                # Only copies the mount fetched itself, never files created or changed locally by an earlier mount
+                if 'user.is_local' in xattrs:
+                    return None
+                hub_link = self.is_hub_link(entry, st)
+                if 'user.is_complete' not in xattrs and not hub_link and not os.path.exists(self.block_map_path(path)):
+                    return None
+                # Content linked from the store or the hub carries the xattrs of the first image that cached it,
+                # or none at all, so the content hash tells whether the copy is the one the tree names
+                if entry.sha256:
+                    if not hub_link and ('user.sha256' not in xattrs or os.getxattr(full_path, 'user.sha256').decode('utf-8') != entry.sha256):
+                        return None
+                elif entry.url and ('user.url' not in xattrs or os.getxattr(full_path, 'user.url').decode('utf-8') != entry.url):
+                    return None
+                self.cached_dir.discard(path)
+                self.store_linked.discard(path)
+                with self.block_maps_lock:
+                    block_map = self.block_maps.pop(path, None)
+                os.unlink(full_path)
+            links = 0 if hub_link else st.st_nlink - 1  # the hub blob is outside the cache dir and its budget
+            # The content store's link would keep the data on disk, drop it too once no other image uses it
+            if links == 1 and self.content_store is not None and self.content_store.has(entry.sha256):
+                store_st = os.lstat(self.content_store.path(entry.sha256))
+                if (store_st.st_dev, store_st.st_ino) == (st.st_dev, st.st_ino) and self.content_store.remove(entry.sha256):
+                    links = 0
+            if block_map is not None:
+                block_map.remove()
+            elif os.path.exists(self.block_map_path(path)):
+                os.unlink(self.block_map_path(path))
+            print(f'🧹 evicted {path}')
+            return st.st_blocks * 512 if links == 0 else 0
+        finally:
+            lock.release()
+
+    def is_hub_link(self, entry, st):
+        # A hardlink of the node's hub cache blob, see link_from_hf_cache
+        if entry.hf is None:
+            return False
+        repo, revision, blob = entry.hf
+        try:
+            return os.path.samestat(st, os.stat(hub_blob_path(repo, blob, self.hf_hub_dir)))
+        except OSError:
+            return False
+
+    @contextmanager
+    def holding(self, path):
+        # Counts as an open handle, the cache manager never evicts a file while it is held
+        with self.handles_lock:
+            self.open_handles[path] += 1
+        try:
+            yield
+        finally:
+            self.drop_handle(path)
+
+    def drop_handle(self, path):
+        with self.handles_lock:
+            self.open_handles[path] -= 1
+            if self.open_handles[path] <= 0:
+                del self.open_handles[path]
+
+    def foreground(self, path):
+        # Application requests go ahead of background prefetch
+        if self.prefetcher is None:
+            return nullcontext()
+        return self.prefetcher.foreground(path)
+
+    def load_index(self):
+        # One fetch at mount time answers every later folder lookup
+        index_path = os.path.join(self.root, META_DIR, 'index')
+        try:
+            content = nsclient.get_binary(INDEX_FILE)
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            with open(f'{index_path}.tmp', 'wb') as f:
+                f.write(content)
+            os.replace(f'{index_path}.tmp', index_path)
+            self.index = TreeIndex(index_path)
+            self.tree.index = self.index
+            print(f'🦄 loaded tree index with {self.index.count} entries')
         except Exception as e:
-            print(f"Error downloading log file: {e}")
-
-    def handle_file_operation(self, log_entry):
-        # Parse the log entry and perform the corresponding file operation
-        if log_entry.startswith("openat"):
-            rel_path = log_entry.split(" ")[1]
-            abs_path = os.path.join(self.mountpoint, rel_path)
-            print(f'🦄 bg thread opening file {abs_path}')
-            os.open(abs_path,  os.O_RDONLY)
-            # self.open(f'/{rel_path}',  os.O_RDONLY)
-        elif log_entry.startswith("newfstatat") or log_entry.startswith("stat") or log_entry.startswith("lsstat"):
-            rel_path = log_entry.split(" ")[1]
-            abs_path = os.path.join(self.mountpoint, rel_path)
-            print(f'🦄 bg thread getting attributes of {abs_path}')
-            os.lstat(abs_path)
-            # print(f'🦄 bg thread getting attributes of {rel_path}')
-            # self.getattr(f'/{rel_path}')
+            print(f'🟠 no tree index, falling back to per-folder meta: {e}')
+
+    def start_recording(self, profile_path):
+        self.recorder = AccessRecorder(profile_path)
+        print(f'🦄 recording accesses to {profile_path}')
+
+    def start_tracing(self, trace_path):
+        self.tracer = Tracer(trace_path)
+        print(f'🦄 tracing to {trace_path}')
+
+    def trace(self, name, cat, **args):
+        return nullcontext() if self.tracer is None else self.tracer.span(name, cat, **args)
+
+    def queue_depths(self):
+        depths = {}
+        for name, limit in self.controller.limits.items():
+            depths[f'{name}_in_flight'] = limit.in_flight
+            depths[f'{name}_waiting'] = limit.waiting
+        depths['fetches_in_flight'] = self.inflight.stats()['in_flight']
+        if self.prefetcher is not None:
+            depths['prefetch_queued'] = len(self.prefetcher.queue)
+        depths['open_files'] = len(self.open_handles)
+        return depths
+
+    def stats_content(self, fresh=False):
+        # A lookup renders the snapshot and the open right after it reuses it, so the file has the size the kernel saw
+        rendered_at, content = self.stats_snapshot
+        if fresh or time.time() - rendered_at > STATS_SNAPSHOT_TTL:
+            snapshot = self.metrics.snapshot()
+            snapshot['concurrency'] = self.controller.stats()
+            snapshot['inflight'] = self.inflight.stats()
+            snapshot['backend_calls'] = self.backend_calls
+            snapshot['negative_hits'] = self.negative.hits
+            if self.peers is not None:
+                snapshot['peers'] = {'hits': self.peers.hits, 'misses': self.peers.misses}
+            content = render_stats(snapshot)
+            self.stats_snapshot = (time.time(), content)
+        return content
+
+    @contextmanager
+    def timed(self, source, name, **args):
+        # One request to source in the backend latency histogram and the trace, failed ones counted apart
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        except BaseException:
+            self.metrics.count('backend_errors_total', source)
+            args['failed'] = True
+            raise
+        finally:
+            elapsed_ns = time.perf_counter_ns() - start_ns
+            self.metrics.observe('backend_request_seconds', source, elapsed_ns)
+            if self.tracer is not None:
+                self.tracer.record(f'{source} {name}', 'backend', start_ns, elapsed_ns, args)
+
+    def __call__(self, op, *args):
+        start_ns = time.perf_counter_ns()
+        try:
+            result = super().__call__(op, *args)
+        except BaseException as e:
+            elapsed_ns = time.perf_counter_ns() - start_ns
+            self.metrics.observe('fuse_op_seconds', op, elapsed_ns)
+            self.metrics.count('fuse_op_errors_total', op)
+            if self.tracer is not None:
+                self.tracer.fuse(op, args, start_ns, elapsed_ns, fuse_get_context()[2], getattr(e, 'errno', None) or 'error')
+            raise
+        elapsed_ns = time.perf_counter_ns() - start_ns
+        self.metrics.observe('fuse_op_seconds', op, elapsed_ns)
+        if self.tracer is not None:
+            # The context pid is the id of the calling application thread
+            self.tracer.fuse(op, args, start_ns, elapsed_ns, fuse_get_context()[2])
+        if self.recorder is None or op not in RECORDED_OPS:
+            return result
+        offset, length = 0, 0
+        if op == 'read':
+            length, offset = args[1], args[2]
+        elif op == 'getattr':
+            length = -1 if stat.S_ISDIR(result['st_mode']) else result['st_size']
+        # FUSE reports the id of the calling application thread as the context pid
+        self.recorder.record(op, args[0], start_ns, elapsed_ns, offset, length, fuse_get_context()[2])
+        return result
 
     # Helpers
     # =======
@@ -167,84 +601,344 @@ class Passthrough(Operations):
             key += '/'
         return key
 
-    def cloud_getattr(self, path):
-        parent_path = os.path.dirname(path)
-        print(f'checking parent: {parent_path}')
-        if self.is_folder_cached(parent_path):
-            raise FuseOSError(errno.ENOENT)
-        print(f'🟠 cloud getting attributes of {path}', f'parent: {parent_path}')
-        self.cloud_readdir(parent_path)
-
+    def cloud_url(self, path):
+        # ffbox folders carry the object url in their meta, plain buckets mirror the path
+        if self.is_ffbox_folder:
+            return self.mounted_url(path, self.remote_entry(path).url)
+        return path.strip('/')
+
+    def mounted_url(self, path, url, target=None):
+        # Metas hold the urls of the push or deploy, an image copied to an http host keeps its layout
+        # under the mounted url. url is the meta url of path, target another url of the image (a pack)
+        target = target or url
+        if not is_http_url(self.s3_url) or is_http_url(target):
+            return target
+        origin = url.rstrip('/')
+        suffix = path.strip('/')
+        if suffix:
+            if not origin.endswith('/' + suffix):
+                return target
+            origin = origin[:-len(suffix) - 1]
+        if target != origin and not target.startswith(origin + '/'):
+            return target
+        return f"{self.s3_url.rstrip('/')}/{quote(target[len(origin):].lstrip('/'))}"
+
+    def cloud_read_range(self, path, offset, length):
+        url = self.cloud_url(path)
+        if self.peers is not None:
+            # Another node may already hold the range, identical content is found by hash across images
+            with self.timed('peer', 'range', path=path, offset=offset, length=length):
+                data = self.peers.get_range(self.peer_key(path), self.content_hash(path), offset, length)
+            if data is not None:
+                self.metrics.count('fetched_bytes_total', 'peer', len(data))
+                return data
+        entry = self.remote_entry(path)
+        if entry is not None and entry.compression:
+            return self.read_compressed_range(path, url, offset, length)
+        return self.read_stored_range(path, url, offset, length)
+
+    def read_compressed_range(self, path, url, offset, length):
+        # Only the compressed blocks covering the range are fetched, then decompressed before caching
+        table = self.block_tables.get(path)
+        if table is None:
+            prefix = self.read_stored_range(path, url, 0, TABLE_PREFIX_SIZE)
+            table_size = BlockTable.table_size(prefix)
+            if table_size > len(prefix):
+                prefix += self.read_stored_range(path, url, len(prefix), table_size - len(prefix))
+            table = self.block_tables[path] = BlockTable.parse(prefix)
+        first, last, stored_offset, stored_length = table.span(offset, length)
+        stored = self.read_stored_range(path, url, stored_offset, stored_length)
+        return table.decompress(first, last, stored, offset, length)
+
+    def cloud_read_into(self, path, fd, offset, length):
+        # Write a range of path into fd at the same offset, plain backend reads stream without
+        # building the part in memory; peers, the daemon and compressed objects hand back bytes
+        entry = self.remote_entry(path)
+        if self.peers is not None or self.daemon is not None or (entry is not None and entry.compression):
+            os.pwrite(fd, self.cloud_read_range(path, offset, length), offset)
+            return
+        url = self.cloud_url(path)
+
+        def read_into():
+            written = client_for(url).read_into(url, fd, offset, length, offset)
+            if written != length:
+                raise IOError(f'short read, {written} of {length} bytes')
+        self.with_retries(path, offset, length, read_into)
+        self.metrics.count('fetched_bytes_total', 'backend', length)
+
+    def read_stored_range(self, path, url, offset, length):
+        if self.daemon is not None:
+            # The node daemon shares the fetch with other mounts of the same image and retries itself
+            self.backend_calls += 1
+            try:
+                with self.timed('daemon', 'range', path=path, offset=offset, length=length):
+                    data = self.daemon.get_range(self.s3_url, url, offset, length)
+            except OSError as e:
+                print(f'🔴 error reading range {offset}+{length} of {path} through the daemon: {e}')
+                raise FuseOSError(e.errno or errno.EIO)
+            self.metrics.count('fetched_bytes_total', 'daemon', len(data))
+            return data
+        data = self.with_retries(path, offset, length, lambda: client_for(url).get_range(url, offset, length))
+        self.metrics.count('fetched_bytes_total', 'backend', len(data))
+        return data
+
+    def read_stored_object(self, path, url):
+        # A whole object, packs, through the daemon when there is one like the ranges of files
+        if self.daemon is not None:
+            self.backend_calls += 1
+            try:
+                with self.timed('daemon', 'object', path=path, url=url):
+                    data = self.daemon.get_range(self.s3_url, url, 0, None)
+            except OSError as e:
+                print(f'🔴 error reading {url} through the daemon: {e}')
+                raise FuseOSError(e.errno or errno.EIO)
+            self.metrics.count('fetched_bytes_total', 'daemon', len(data))
+            return data
+        data = self.with_retries(path, 0, None, lambda: client_for(url).get_binary(url))
+        self.metrics.count('fetched_bytes_total', 'backend', len(data))
+        return data
+
+    def with_retries(self, path, offset, length, read):
+        max_retries = 3
+        for attempt in range(max_retries):
+            try:
+                self.backend_calls += 1
+                with self.timed('backend', 'range', path=path, offset=offset, length=length, attempt=attempt + 1):
+                    return read()
+            except Exception as e:
+                if isinstance(e, FileNotFoundError) or \
+                        isinstance(e, ClientError) and e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                    print("🔴 read range The object does not exist.")
+                    raise FuseOSError(errno.ENOENT)
+                if attempt < max_retries - 1:
+                    print(f'🔴Retrying range read of {path} (attempt {attempt + 2}/{max_retries})')
+                else:
+                    print(f'🔴 error reading range {offset}+{length} of {path}: {e}')
+                    raise FuseOSError(errno.EIO)
+
+    def block_map_path(self, path):
+        return os.path.join(self.root, META_DIR, 'blocks', path.lstrip('/'))
+
+    def get_block_map(self, path, size):
+        with self.block_maps_lock:
+            block_map = self.block_maps.get(path)
+            if block_map is None:
+                block_map = BlockMap(self.block_map_path(path), size, self.block_size)
+                self.block_maps[path] = block_map
+            return block_map
+
+    def fetch_blocks(self, path, offset, length, size):
+        # False when every block was already cached
+        end = min(offset + length, size)
+        if end <= offset:
+            return False
+        block_map = self.get_block_map(path, size)
+        first, last = offset // self.block_size, (end - 1) // self.block_size
+        if not block_map.missing(first, last):
+            return False
+        full_path = self._full_path(path)
+        # Parts run on pool threads, the traffic class is the one of the thread asking
+        traffic = getattr(self.traffic, 'name', 'foreground')
 
-    def cloud_readdir(self, parent_path):
+        def fetch_part(fetch):
+            error = None
+            try:
+                part_offset = fetch.blocks[0] * self.block_size
+                part_length = min((fetch.blocks[-1] + 1) * self.block_size, size) - part_offset
+                if self.verbose:
+                    print(f'🟠 cloud fetching blocks {fetch.blocks[0]}-{fetch.blocks[-1]} of {path} ({part_length} bytes)')
+                # The span includes the wait for a slot, the backend span inside it is the request itself
+                with self.trace('fetch blocks', 'fetch', path=path, blocks=f'{fetch.blocks[0]}-{fetch.blocks[-1]}',
+                                traffic=fetch.traffic):
+                    with self.controller.slot(fetch.traffic, part_length, fetch):
+                        self.cloud_read_into(path, write_fd, part_offset, part_length)
+                    # The bits are written right away, the data has to reach the disk first or a crash
+                    # leaves blocks marked present that read back as zeros. Once per part, not per block
+                    os.fdatasync(write_fd)
+                for i in fetch.blocks:
+                    block_map.add(i)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                self.inflight.finish(fetch, error)
+
+        while True:
+            # Contiguous missing blocks are fetched as parts in parallel, blocks another request is
+            # already fetching are waited for instead, promoting that fetch when this one is foreground
+            mine, waits = self.inflight.claim(path, block_map.missing(first, last), traffic, block_map.has,
+                                              self.blocks_per_part)
+            if not mine and not waits:
+                break
+            if mine:
+                try:
+                    write_fd = os.open(full_path, os.O_WRONLY)
+                    try:
+                        # Application reads get their own workers, they never queue behind prefetch parts
+                        self.downloader.map(fetch_part, mine, traffic)
+                    finally:
+                        os.close(write_fd)
+                finally:
+                    # Fetches that never ran, the open or a submit failed, still release their waiters
+                    for fetch in mine:
+                        if not fetch.done.is_set():
+                            self.inflight.finish(fetch, FuseOSError(errno.EIO))
+            # A fetch of somebody else that failed leaves its blocks missing, the next round claims them
+            for fetch in waits:
+                with self.trace('wait for fetch', 'wait', path=path, blocks=f'{fetch.blocks[0]}-{fetch.blocks[-1]}',
+                                traffic=fetch.traffic):
+                    fetch.done.wait()
+        if block_map.is_complete():
+            self.mark_file_cached(path)
+        self.touch_cache(path)
+        return True
+
+    def split_path(self, path):
+        # '/a/b/c' -> ('a/b', 'c'), '/c' -> ('', 'c')
+        return os.path.split(path.strip('/'))
+
+    def remote_entry(self, path):
+        # Remote metadata of path, None when the image has no such entry or it was changed locally
+        if path == '/' or path in self.local_paths:
+            return None
+        folder, name = self.split_path(path)
+        self.load_folder(folder)
+        return self.tree.lookup(folder, name)
+
+    def load_folder(self, folder):
+        if not self.tree.is_loaded(folder):
+            with self.locks[f'/{folder}']:
+                if not self.tree.is_loaded(folder):
+                    self.cloud_readdir(folder)
+
+    def entry_attr(self, entry):
+        mtime = entry.mtime or self.mount_time
+        ctime = entry.ctime or self.mount_time
+        if entry.is_dir:
+            return {'st_mode': stat.S_IFDIR | 0o755, 'st_nlink': 2, 'st_size': 4096,
+                    'st_atime': mtime, 'st_mtime': mtime, 'st_ctime': ctime, 'st_uid': uid, 'st_gid': gid}
+        return {'st_mode': stat.S_IFREG | 0o644, 'st_nlink': 1, 'st_size': entry.size,
+                'st_atime': mtime, 'st_mtime': mtime, 'st_ctime': ctime, 'st_uid': uid, 'st_gid': gid}
+
+    def materialize(self, path, entry):
+        # Files only reach the cache dir once their content is needed, as a sparse placeholder
+        full_path = self._full_path(path)
+        if not entry.is_dir:
+            self.peer_keys[self.peer_key(path)] = path
+        if os.path.exists(full_path):
+            return
+        if entry.is_dir:
+            os.makedirs(full_path, exist_ok=True)
+            return
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as f:
+            f.truncate(entry.size)  # Create sparse file of exact size
+        # Set file attributes
+        os.utime(full_path, (entry.mtime, entry.mtime))
+        if entry.url:
+            os.setxattr(full_path, 'user.url', entry.url.encode('utf-8'))
+        if entry.sha256:
+            os.setxattr(full_path, 'user.sha256', entry.sha256.encode('utf-8'))
+
+    def check_writable(self):
+        # Every change through the mount goes through mark_local or localize
+        if self.immutable:
+            raise FuseOSError(errno.EROFS)
+
+    def load_local_paths(self):
+        # Changes outlive the mount, after a remount the tree must not answer for them again
+        try:
+            with open(os.path.join(self.root, META_DIR, LOCAL_PATHS_FILE), encoding='utf-8', errors='surrogateescape') as f:
+                return set(line.rstrip('\n') for line in f if line.strip())
+        except FileNotFoundError:
+            return set()
+
+    def mark_local(self, path):
+        self.check_writable()
+        with self.local_paths_lock:
+            if path not in self.local_paths:
+                local_paths_path = os.path.join(self.root, META_DIR, LOCAL_PATHS_FILE)
+                os.makedirs(os.path.dirname(local_paths_path), exist_ok=True)
+                with open(local_paths_path, 'a', encoding='utf-8', errors='surrogateescape') as f:
+                    f.write(path + '\n')
+                self.local_paths.add(path)
+        self.negative.discard(self.split_path(path))
+
+    def materialize_parent(self, path):
+        # New entries can land in remote folders that only exist in the tree so far
+        os.makedirs(os.path.dirname(self._full_path(path)), exist_ok=True)
+
+    def localize(self, path):
+        # Make the local copy of path authoritative before it is changed through the mount
+        self.check_writable()
+        entry = self.remote_entry(path)
+        if entry is not None:
+            if entry.is_dir:
+                self.materialize(path, entry)
+            else:
+                self.ensure_cached(path, entry)
+                with self.locks[path]:
+                    # The copy may be a hardlink of the content store or a hub cache blob, which share the
+                    # inode's data, mode, owner, times and xattrs, give it its own before changing any of them
+                    break_link(self._full_path(path))
+                    self.store_linked.discard(path)  # its own copy now, the next touch counts it
+                    # Changed copies of image files must survive cache eviction, also after a remount
+                    os.setxattr(self._full_path(path), 'user.is_local', b'1')
+        self.mark_local(path)
+
+    def cloud_readdir(self, folder):
         if self.is_ffbox_folder:
             try:
-                url = os.getxattr(self._full_path(parent_path), 'user.url').decode('utf-8').rstrip('/')
-                print('🟠 cloud cloud_readdir of',parent_path, url)
-                json_str = nsclient.get_object(f'{url}/{DIR_META_FILE}')
+                if folder == '':
+                    url = nsclient.root.rstrip('/')
+                else:
+                    folder_entry = self.remote_entry(f'/{folder}')
+                    if folder_entry is None or not folder_entry.is_dir:
+                        # Not a remote folder, remember that so later lookups don't ask again
+                        self.tree.add_folder(folder, {})
+                        return
+                    url = self.mounted_url(f'/{folder}', folder_entry.url).rstrip('/')
+                print('🟠 cloud cloud_readdir of', folder, url)
+                self.backend_calls += 1
+                with self.timed('backend', 'folder meta', path=f'/{folder}'):
+                    json_str = client_for(url).get_object(f'{url}/{DIR_META_FILE}')
                 response = json.loads(json_str)
-                print('🟠 cloud getting folder meta.json of', response)
-                for file_name in response:
-                    print('filename', file_name, 'parentpath',parent_path)
-                    attr = response[file_name]
-                    size = attr.get('size')
-                    ctime = attr.get('ctime')
-                    url = attr.get('url')
-                    if url is None:
-                        print('🔴 error getting url of file {parent_path}/{file_name}')
+                children = {}
+                for file_name, attr in response.items():
+                    if attr.get('url') is None:
+                        print(f'🔴 error getting url of file {folder}/{file_name}')
                         continue
-                    if ctime is None:
-                        ctime = time.time()
-                    mtime = attr.get('mtime')
-                    if mtime is None:
-                        mtime = time.time()
-                    if size is None: # is folder
-                        os.makedirs(os.path.join(self.root, parent_path, file_name), exist_ok=True)
-                    else: # is file 
-                        # Create a sparse file of the same size as the S3 object
-                        file_path = os.path.join(self.root, parent_path, file_name)
-                        print('creating sparse file', file_path)
-                        if not os.path.exists(file_path):
-                            with open(file_path, 'wb') as f:
-                                f.truncate(size)  # Create sparse file of exact size
-                            # Set file attributes
-                            os.utime(file_path, (mtime, mtime))
-                            os.setxattr(file_path, 'user.url', url.encode('utf-8'))
+                    children[file_name] = Entry.from_attr(attr)
+                self.tree.add_folder(folder, children)
             except Exception as e:
-                print(f'🔴 error getting folder meta.json of {parent_path}: {e}')
+                print(f'🔴 error getting folder meta.json of {folder}: {e}')
                 raise FuseOSError(errno.ENOENT)
         else:
-            response = s3_client.list_objects_v2(
-                Bucket=self.bucket,
-                Prefix=self.cloud_folder_key(parent_path),
-                Delimiter='/'  # This makes the operation more efficient for folders
-            )
+            self.backend_calls += 1
+            with self.timed('backend', 'list', path=f'/{folder}'):
+                response = s3_client.list_objects_v2(
+                    Bucket=self.bucket,
+                    Prefix=self.cloud_folder_key(folder),
+                    Delimiter='/'  # This makes the operation more efficient for folders
+                )
 
             if response.get('IsTruncated'):
-                print(f"🔴Warning: Directory listing for {parent_path} is truncated!")
+                print(f"🔴Warning: Directory listing for {folder} is truncated!")
 
+            children = {}
             # Add directories (common prefixes) to dirents
-            parent_path = parent_path.lstrip('/')
             for common_prefix in response.get('CommonPrefixes', []):
                 dir_name = common_prefix['Prefix'].rstrip('/').split('/')[-1]
-                os.makedirs(os.path.join(self.root, parent_path, dir_name), exist_ok=True)
+                children[dir_name] = Entry(None, 0.0, 0.0, None)
 
             # Add files to dirents
             for obj in response.get('Contents', []):
                 file_name = obj['Key'].split('/')[-1]
-                # Create an empty placeholder file with the attributes
-                file_path = os.path.join(self.root, parent_path, file_name)
-                if not os.path.exists(file_path):
-                    # Create a sparse file of the same size as the S3 object
-                    with open(file_path, 'wb') as f:
-                        f.truncate(obj['Size'])  # Create sparse file of exact size
-                    # Set file attributes
-                    os.utime(file_path, (obj['LastModified'].timestamp(), obj['LastModified'].timestamp()))
-        # mark this path as completed cached
-        self.mark_folder_cached(parent_path)   
-
-
-    def is_folder_cached(self, path):
+                last_modified = obj['LastModified'].timestamp()
+                children[file_name] = Entry(obj['Size'], last_modified, last_modified, None)
+            self.tree.add_folder(folder, children)
+
+    def is_file_cached(self, path):
         if path in self.cached_dir:
             return True
         try:
@@ -254,63 +948,206 @@ class Passthrough(Operations):
             # If the xattr does not exist, proceed with downloading
             return False
     
-    def mark_folder_cached(self, path):
-        os.setxattr(self._full_path(path), 'user.is_complete', b'1')
+    def mark_file_cached(self, path, verified=False, hub_blob=False):
+        # verified when the content came from the content store or a blob named by its sha256. A hub blob
+        # is the user's own file, it is only linked: no xattrs, no content store link
+        content_hash = self.content_hash(path)
+        if content_hash and not verified and hash_file(self._full_path(path)) != content_hash:
+            # Backends and peers are trusted for sizes only, the node-wide store must only get what the meta names
+            print(f'🔴 {path} does not match its sha256 {content_hash}, dropping the fetched content')
+            self.discard_content(path)
+            raise FuseOSError(errno.EIO)
+        if not hub_blob:
+            os.setxattr(self._full_path(path), 'user.is_complete', b'1')
         self.cached_dir.add(path)
-    
-    def is_file_cached(self, path):
-        if path in self.cached_dir:
-            return True
+        with self.block_maps_lock:
+            block_map = self.block_maps.pop(path, None)
+        if block_map is not None:
+            block_map.remove()
+        if self.content_store and content_hash and not hub_blob:
+            try:
+                self.content_store.publish(self._full_path(path), content_hash)
+            except OSError as e:
+                print(f'🟠 failed to publish {path} to content store: {e}')
+
+    def discard_content(self, path):
+        # Back to a sparse placeholder of the same inode, open handles read zeros until the blocks are fetched again
+        with self.block_maps_lock:
+            block_map = self.block_maps.get(path)
+        if block_map is not None:
+            block_map.clear()
+        full_path = self._full_path(path)
+        size = os.path.getsize(full_path)
+        os.truncate(full_path, 0)
+        os.truncate(full_path, size)
+
+    def peer_key(self, path):
+        # Urls of the tree can be relative to the mounted url, peers only know absolute ones
+        url = self.cloud_url(path)
+        if '://' in url or url.startswith('/'):
+            return url
+        return f"{self.s3_url.rstrip('/')}/{url}"
+
+    def read_cached(self, url, sha256, offset, length):
+        # A range for a peer, only from content that is cached here and unchanged from the image
+        if sha256 is not None and not is_sha256(sha256):
+            return None
+        if self.content_store is not None and sha256 and self.content_store.has(sha256):
+            full_path = self.content_store.path(sha256)
+        else:
+            path = self.peer_keys.get(url)
+            if path is None or path in self.local_paths:
+                return None
+            full_path = self._full_path(path)
+            if not self.is_file_cached(path):
+                block_map = self.block_maps.get(path)
+                if block_map is None or length <= 0:
+                    return None
+                if block_map.missing(offset // self.block_size, (offset + length - 1) // self.block_size):
+                    return None
         try:
-            is_complete = os.getxattr(self._full_path(path), 'user.is_complete')
-            return is_complete == b'1'
+            if 'user.is_local' in os.listxattr(full_path):
+                return None
+            fd = os.open(full_path, os.O_RDONLY)
         except OSError:
-            # If the xattr does not exist, proceed with downloading
+            return None
+        try:
+            data = os.pread(fd, length, offset)
+        finally:
+            os.close(fd)
+        return data if len(data) == length else None
+
+    def content_hash(self, path):
+        # Only unmodified image files are shared through the content store
+        entry = self.remote_entry(path)
+        return entry.sha256 if entry is not None else None
+
+    def link_local_copy(self, path, entry, held=0):
+        # Serve content that is already on this node, held is the handles of path the caller opened itself
+        return self.link_from_content_store(path, held) or self.link_from_hf_cache(path, entry, held)
+
+    def link_from_content_store(self, path, held=0):
+        # Serve content another image already fetched, only when nobody else holds the placeholder open
+        content_hash = self.content_hash(path)
+        if not self.content_store or not content_hash or self.open_handles.get(path, 0) > held:
             return False
-    
-    def mark_file_cached(self, path):
-        os.setxattr(self._full_path(path), 'user.is_complete', b'1')
-        self.cached_dir.add(path)
+        if not self.content_store.link_into(content_hash, self._full_path(path)):
+            return False
+        print(f'🟢 {path} served from content store {content_hash}')
+        self.store_linked.add(path)
+        self.mark_file_cached(path, verified=True)
+        return True
+
+    def link_from_hf_cache(self, path, entry, held=0):
+        # Files pushed from a hub cache are often still in this node's one from earlier jobs
+        if entry is None or entry.hf is None or self.open_handles.get(path, 0) > held:
+            return False
+        repo, revision, blob = entry.hf
+        blob_path = hub_blob_path(repo, blob, self.hf_hub_dir)
+        try:
+            if os.path.getsize(blob_path) != entry.size:
+                return False
+        except OSError:
+            return False
+        # LFS blobs are named by their sha256, a mismatch is another file under the same name
+        if entry.sha256 and len(blob) == 64 and blob != entry.sha256:
+            return False
+        # Small files are git blobs named by their sha1, those are hashed before they are trusted
+        if entry.sha256 and blob != entry.sha256 and hash_file(blob_path) != entry.sha256:
+            return False
+        if not link_blob(blob_path, self._full_path(path)):
+            return False
+        print(f'🟢 {path} served from hugging face cache {repo}@{revision}')
+        # After a remount is_file_cached doesn't know a hardlink, the next access links the blob again.
+        # Reflinks and copies are files of their own
+        hub_blob = self.is_hub_link(entry, os.stat(self._full_path(path)))
+        self.mark_file_cached(path, verified=True, hub_blob=hub_blob)
+        return True
 
     # Filesystem methods
     # ==================
 
     def access(self, path, mode):
+        if path == STATS_FILE:
+            if mode & (os.W_OK | os.X_OK):
+                raise FuseOSError(errno.EACCES)
+            return
+        if self.split_path(path) in self.negative:
+            raise FuseOSError(errno.ENOENT)
+        if mode & os.W_OK and self.immutable:
+            raise FuseOSError(errno.EROFS)
+        entry = self.remote_entry(path)
+        if entry is not None:
+            if mode & os.X_OK and not entry.is_dir:
+                raise FuseOSError(errno.EACCES)
+            return
         full_path = self._full_path(path)
         if not os.access(full_path, mode):
             raise FuseOSError(errno.EACCES)
 
     def chmod(self, path, mode):
+        self.localize(path)
         full_path = self._full_path(path)
         return os.chmod(full_path, mode)
 
     def chown(self, path, uid, gid):
+        self.localize(path)
         full_path = self._full_path(path)
         return os.chown(full_path, uid, gid)
 
     def getattr(self, path, fh=None):
-        print(f'👇getting attribute of {path}')
-        full_path = self._full_path(path)
-
-        with self.locks[path]:
-            if not os.path.exists(full_path):
-                self.cloud_getattr(path)
-            st = os.lstat(full_path)
-            return dict((key, getattr(st, key)) for key in ('st_atime', 'st_ctime',
-                        'st_gid', 'st_mode', 'st_mtime', 'st_nlink', 'st_size', 'st_uid'))
+        if self.verbose:
+            print(f'👇getting attribute of {path}')
+        if path == STATS_FILE:
+            now = time.time()
+            return {'st_mode': stat.S_IFREG | 0o444, 'st_nlink': 1, 'st_size': len(self.stats_content(fresh=True)),
+                    'st_atime': now, 'st_mtime': now, 'st_ctime': now, 'st_uid': uid, 'st_gid': gid}
+        # Import probes ask for many paths that don't exist, answer repeated misses before any lookup
+        key = self.split_path(path)
+        if key in self.negative:
+            raise FuseOSError(errno.ENOENT)
+        entry = self.remote_entry(path)
+        if entry is not None:
+            return self.entry_attr(entry)
+        try:
+            st = os.lstat(self._full_path(path))
+        except FileNotFoundError:
+            # The folder listing is complete, so the miss stays a miss until something is created here
+            if path not in self.local_paths and self.tree.is_loaded(key[0]):
+                self.negative.add(key)
+            raise FuseOSError(errno.ENOENT)
+        return dict((key, getattr(st, key)) for key in ('st_atime', 'st_ctime',
+                    'st_gid', 'st_mode', 'st_mtime', 'st_nlink', 'st_size', 'st_uid'))
 
     def readdir(self, path, fh):
-        print(f'👇reading directory {path}')
-        if not self.is_folder_cached(path):
-            with self.locks[path]:
-                self.cloud_readdir(path)
-        yield '.'
-        yield '..'
-        # Add more entries as needed
-        for entry in os.listdir(self._full_path(path)):
-            yield entry
+        if self.verbose:
+            print(f'👇reading directory {path}')
+        # A list, not a generator, so the listing is built within the timed call and errors count
+        names = ['.', '..']
+        seen = set()
+        entry = self.remote_entry(path)
+        if path == '/' or (entry is not None and entry.is_dir):
+            folder = path.strip('/')
+            self.load_folder(folder)
+            for name in self.tree.children(folder):
+                if f'{path.rstrip("/")}/{name}' not in self.local_paths:
+                    seen.add(name)
+                    names.append(name)
+        full_path = self._full_path(path)
+        if os.path.isdir(full_path):
+            # Files created locally, and remote files that were materialized or changed
+            for name in os.listdir(full_path):
+                if path == '/' and name == META_DIR:
+                    continue
+                if name not in seen:
+                    names.append(name)
+        elif entry is None and path != '/':
+            raise FuseOSError(errno.ENOENT)
+        return names
+
     def readlink(self, path):
-        print('👇 reading link', path)
+        if self.verbose:
+            print('👇 reading link', path)
         pathname = os.readlink(self._full_path(path))
         if pathname.startswith("/"):
             # Path name is absolute, sanitize it.
@@ -319,14 +1156,36 @@ class Passthrough(Operations):
             return pathname
 
     def mknod(self, path, mode, dev):
+        self.mark_local(path)
+        self.materialize_parent(path)
         return os.mknod(self._full_path(path), mode, dev)
 
     def rmdir(self, path):
+        self.check_writable()
+        entry = self.remote_entry(path)
+        if entry is not None:
+            if not entry.is_dir:
+                raise FuseOSError(errno.ENOTDIR)
+            # Remote children may have no local copy yet, os.rmdir alone would remove the folder
+            folder = path.strip('/')
+            self.load_folder(folder)
+            if any(f'{path}/{name}' not in self.local_paths for name in self.tree.children(folder)):
+                raise FuseOSError(errno.ENOTEMPTY)
         full_path = self._full_path(path)
-        return os.rmdir(full_path)
+        try:
+            os.rmdir(full_path)
+        except FileNotFoundError:
+            # Remote folders that were never materialized only need to be hidden
+            if entry is None:
+                raise
+        self.mark_local(path)
 
     def mkdir(self, path, mode):
-        print(f'👇making directory {path}')
+        if self.verbose:
+            print(f'👇making directory {path}')
+        self.mark_local(path)
+        self.negative.discard_tree(path.strip('/'))
+        self.materialize_parent(path)
         return os.mkdir(self._full_path(path), mode)
 
     def statfs(self, path):
@@ -337,89 +1196,197 @@ class Passthrough(Operations):
             'f_frsize', 'f_namemax'))
 
     def unlink(self, path):
-        return os.unlink(self._full_path(path))
+        entry = self.remote_entry(path)
+        self.mark_local(path)
+        self.cached_dir.discard(path)
+        try:
+            return os.unlink(self._full_path(path))
+        except FileNotFoundError:
+            # Remote files that were never materialized only need to be hidden
+            if entry is None:
+                raise
 
     def symlink(self, name, target):
+        self.mark_local(name)
+        self.negative.discard_tree(name.strip('/'))  # the link can point at a directory
+        self.materialize_parent(name)
         return os.symlink(target, self._full_path(name))
 
     def rename(self, old, new):
-        return os.rename(self._full_path(old), self._full_path(new))
+        entry = self.remote_entry(old)
+        if entry is not None and entry.is_dir:
+            # Remote folders only partly exist in the cache, let mv fall back to copying
+            raise FuseOSError(errno.EXDEV)
+        self.localize(old)
+        self.mark_local(new)
+        self.materialize_parent(new)
+        self.cached_dir.discard(old)
+        os.rename(self._full_path(old), self._full_path(new))
+        # A renamed directory brings its whole subtree to new
+        self.negative.discard_tree(new.strip('/'))
 
     def link(self, target, name):
+        self.localize(name)
+        self.mark_local(target)
+        self.materialize_parent(target)
         return os.link(self._full_path(name), self._full_path(target))
 
     def utimens(self, path, times=None):
+        self.localize(path)
         return os.utime(self._full_path(path), times)
 
     # File methods
     # ============
 
     def open(self, path, flags):
-        print(f'👇opening file {path}')
-        
-        if self.is_file_cached(path):
-            return os.open(self._full_path(path), flags)
-
+        if self.verbose:
+            print(f'👇opening file {path}')
+        if path == STATS_FILE:
+            if flags & (os.O_WRONLY | os.O_RDWR):
+                raise FuseOSError(errno.EACCES)
+            # A real fd as the handle, so it never collides with the ones of cached files. Immutable
+            # mounts keep the pages of the first read in the kernel, the metrics port stays current there
+            fh = os.open(os.devnull, os.O_RDONLY)
+            self.stats_files[fh] = self.stats_content()
+            return fh
+        # Count the handle first, the cache manager must not evict the file while it is being opened
+        with self.handles_lock:
+            self.open_handles[path] += 1
+        try:
+            with self.foreground(path):
+                fd = self.fetch_and_open(path, flags)
+        except BaseException:
+            self.drop_handle(path)
+            raise
+        self.touch_cache(path)
+        return fd
+
+    def fetch_and_open(self, path, flags):
+        full_path = self._full_path(path)
+        if flags & (os.O_WRONLY | os.O_RDWR):
+            self.localize(path)
+            return os.open(full_path, flags)
+
+        entry = self.remote_entry(path)
+        if entry is None or self.is_file_cached(path):
+            if entry is not None:
+                self.metrics.count('cache_hits_total', 'open')
+            return os.open(full_path, flags)
+
+        if self.lazy and not entry.pack:
+            # Blocks are fetched on demand in read, the sparse placeholder already has the right size
+            with self.locks[path]:
+                self.materialize(path, entry)
+                # The handle of this open is already counted
+                if not self.link_local_copy(path, entry, held=1) and not self.is_file_cached(path):
+                    self.get_block_map(path, entry.size)
+            return os.open(full_path, flags)
+
+        self.metrics.count('cache_misses_total', 'open')
+        # Without held the open's own handle made the placeholder look busy and the store never linked
+        self.ensure_cached(path, entry, held=1)
+        return os.open(full_path, flags)
+
+    def ensure_cached(self, path, entry, held=0):
+        if getattr(self.traffic, 'name', 'foreground') == 'foreground':
+            # The lock may be held by a prefetch of path, let its fetches jump the prefetch queue
+            self.inflight.promote_key(path)
         # Acquire the lock to download the file
         with self.locks[path]:
             # Double-check if the file was downloaded while waiting for the lock
             if self.is_file_cached(path):
-                return os.open(self._full_path(path), flags)
-                
+                return
+            self.materialize(path, entry)
+            if self.link_local_copy(path, entry, held):
+                return
+            if entry.pack:
+                self.fetch_pack(path, entry)
+                return
+
             full_path = self._full_path(path)
             try:
-                # cloud_url = f's3://{self.bucket}/{self.cloud_object_key(path)}'
-                print(f'🟠 cloud open file {path}, downloading to {full_path}')
-                # Attempt download with retries
-                max_retries = 3
-                for attempt in range(max_retries):
-                    try:
-                        s3_client.download_file(
-                            self.bucket,
-                            self.cloud_object_key(path),
-                            full_path
-                        )
-                        # self.download_file(cloud_url, full_path)
-
-                        print(f'🟢 Download successful to {full_path}')
-                        break  # Exit retry loop on success
-                        
-                    except Exception as e:
-                        if isinstance(e, ClientError) and e.response['Error']['Code'] == '404':
-                            print("🔴 open The object does not exist.")
-                            raise FuseOSError(errno.ENOENT)
-                        # Clean up partial download
-                        if os.path.exists(full_path):
-                            os.unlink(full_path)
-                        if attempt < max_retries - 1:
-                            print(f'🔴Retrying download (attempt {attempt + 2}/{max_retries})')
-                        else:
-                            raise FuseOSError(errno.EIO)  # Raise error after final attempt
-                    
+                # Fetch the missing blocks of the sparse placeholder with parallel ranged requests,
+                # a partially cached file resumes where it stopped instead of starting from zero
+                print(f'🟠 cloud open file {path}, downloading {entry.size} bytes to {full_path}')
+                self.fetch_blocks(path, 0, entry.size, entry.size)
+                if not self.is_file_cached(path):
+                    # Empty files have no blocks to fetch
+                    self.mark_file_cached(path)
                 print(f'🔵 downloaded to {full_path}')
-                
-                # Mark as cached
-                self.mark_file_cached(path)
-                    
-                return os.open(full_path, flags)
-                
+            except FuseOSError:
+                raise
             except Exception as e:
                 print(f'🔴 error downloading to {full_path}: {e}')
                 traceback.print_exc()
-                # Clean up any partial downloads
-                if os.path.exists(full_path):
-                    os.unlink(full_path)
                 raise FuseOSError(errno.EIO)
-                
+
+    def fetch_pack(self, path, entry):
+        # One request brings path and every small file packed with it, called holding locks[path]
+        with self.locks[('pack', entry.pack)]:
+            if self.is_file_cached(path):
+                return  # filled by another open of the same pack
+            if self.peers is not None and entry.size:
+                # A node that opened the file has it unpacked, by hash or by url like any other file
+                with self.timed('peer', 'range', path=path, offset=0, length=entry.size):
+                    data = self.peers.get_range(self.peer_key(path), self.content_hash(path), 0, entry.size)
+                if data is not None:
+                    self.metrics.count('fetched_bytes_total', 'peer', len(data))
+                    self.fill_from_pack(path, entry, data)
+                    return
+            print(f'🟠 cloud fetching pack {entry.pack} for {path}')
+            pack_url = self.mounted_url(path, entry.url, entry.pack)
+            content = memoryview(self.read_stored_object(path, pack_url))
+            filled = 0
+            for rel_path, offset, length in read_pack_manifest(content):
+                member = '/' + rel_path
+                if member == path:
+                    self.fill_from_pack(member, entry, content[offset:offset + length])
+                    filled += 1
+                    continue
+                # Other members only when nobody is working on them, waiting for their lock could deadlock
+                lock = self.locks[member]
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    member_entry = self.remote_entry(member)
+                    if member_entry is not None and member_entry.pack == entry.pack and not self.is_file_cached(member):
+                        self.fill_from_pack(member, member_entry, content[offset:offset + length])
+                        filled += 1
+                except FuseOSError:
+                    pass  # failed its hash, fetched again when it is opened
+                finally:
+                    lock.release()
+            print(f'🔵 filled {filled} files from pack {entry.pack}')
+
+    def fill_from_pack(self, path, entry, data):
+        self.materialize(path, entry)
+        full_path = self._full_path(path)
+        with open(full_path, 'r+b') as f:
+            f.write(data)
+        os.utime(full_path, (entry.mtime, entry.mtime))
+        self.mark_file_cached(path)
+
     def read(self, path, length, offset, fh):
-        print(f'👇reading file {path}')
-        # Check file download status
-        with self.locks[path]:
-            os.lseek(fh, offset, os.SEEK_SET)
-            return os.read(fh, length)
+        if self.verbose:
+            print(f'👇reading file {path}')
+        if path == STATS_FILE:
+            return self.stats_files[fh][offset:offset + length]
+        # Lazily opened remote files keep a block map until every block is cached
+        block_map = self.block_maps.get(path)
+        fetched = False
+        if block_map is not None:
+            with self.foreground(path):
+                fetched = self.fetch_blocks(path, offset, length, block_map.size)
+        data = os.pread(fh, length, offset)
+        self.metrics.count('cache_misses_total' if fetched else 'cache_hits_total', 'read')
+        self.metrics.count('served_bytes_total', None, len(data))
+        return data
 
     def create(self, path, mode, fi=None):
-        print('👇 creating file')
+        if self.verbose:
+            print('👇 creating file')
+        self.mark_local(path)
+        self.materialize_parent(path)
         with self.locks[path]:
             uid, gid, pid = fuse_get_context()
             full_path = self._full_path(path)
@@ -428,33 +1395,62 @@ class Passthrough(Operations):
             return fd
 
     def write(self, path, buf, offset, fh):
-        print('👇 writing file')
+        if self.verbose:
+            print('👇 writing file')
         with self.locks[path]:
             os.lseek(fh, offset, os.SEEK_SET)
             return os.write(fh, buf)
 
     def truncate(self, path, length, fh=None):
-        print('👇 truncating file')
+        if self.verbose:
+            print('👇 truncating file')
+        self.localize(path)
         with self.locks[path]:
             full_path = self._full_path(path)
             with open(full_path, 'r+') as f:
                 f.truncate(length)
 
     def flush(self, path, fh):
-        print('👇 flushing file')
+        if self.verbose:
+            print('👇 flushing file')
         with self.locks[path]:
             return os.fsync(fh)
 
     def release(self, path, fh):
-        print('👇 releasing file')
+        if self.verbose:
+            print('👇 releasing file')
+        if self.stats_files.pop(fh, None) is not None:
+            os.close(fh)
+            return
+        self.drop_handle(path)
         with self.locks[path]:
-            return os.close(fh)
+            os.close(fh)
+        # Writes through the mount change how much the file takes in the cache
+        if path in self.local_paths:
+            self.touch_cache(path)
 
     def fsync(self, path, fdatasync, fh):
-        print('👇 fsyncing file')
+        if self.verbose:
+            print('👇 fsyncing file')
         with self.locks[path]:
             return self.flush(path, fh)
 
+    def destroy(self, path):
+        print(f'🦄 backend calls: {self.backend_calls}, negative lookup hits: {self.negative.hits}, '
+              f'negative entries: {len(self.negative.entries)}')
+        if self.peers is not None:
+            print(f'🦄 peer hits: {self.peers.hits}, peer misses: {self.peers.misses}')
+        print(f'🦄 concurrency: {self.controller.stats()}, in-flight fetches: {self.inflight.stats()}')
+        if self.recorder is not None:
+            self.recorder.close()
+            read_order_path = os.path.join(os.path.dirname(self.recorder.path), RECORDED_READ_ORDER_FILE)
+            profile_to_read_order(self.recorder.path, read_order_path)
+            print(f'🦄 access profile saved to {self.recorder.path}, read order to {read_order_path}')
+            print(f'🦄 run `ffbox profile publish {self.root} <image dir>` to add them to the image, then push it')
+        if self.tracer is not None:
+            self.tracer.save()
+            print(f'🦄 trace of {len(self.tracer.events)} events saved to {self.tracer.path}, open it in chrome://tracing or ui.perfetto.dev')
+
 
 def check_upload_complete(local_dir, s3_url):
     # TODO: to be implemented
@@ -484,6 +1480,13 @@ config = TransferConfig(
     max_concurrency=10,  # Max parallel uploads
     use_threads=True  # Use threading for faster uploads
 )
+def index_rows(local_dir, root, children_stats):
+    # (parent, name, attr) rows of the whole-tree index for one folder
+    parent = os.path.relpath(root, local_dir)
+    if parent == '.':
+        parent = ''
+    return [(parent, name, attr) for name, attr in children_stats.items()]
+
 def ffdeploy_path(local_dir:str):
     start_time = time.time()
     local_dir = os.path.expanduser(local_dir)
@@ -498,6 +1501,8 @@ def ffdeploy_path(local_dir:str):
             if file == DIR_META_FILE:
                 print(f'🔴 .ffbox_dir_meta.json is a reserved file name')
                 continue
+            if file == INDEX_FILE and root == local_dir:
+                continue
             child_path = os.path.join(root, file)
             stats = os.stat(child_path)
             rel_path = os.path.relpath(child_path, local_dir)
@@ -506,6 +1511,7 @@ def ffdeploy_path(local_dir:str):
                 "mtime": stats.st_mtime,   # Last modified time
                 "ctime": stats.st_atime,    # Creation time
                 "url": child_path,
+                "sha256": hash_file(child_path),  # Content hash, lets mounts share identical files
             }
 
         for d in dirs:
@@ -521,20 +1527,88 @@ def ffdeploy_path(local_dir:str):
         with open(json_path, 'w') as f:
             json.dump(children_stats, f)
         print(f'👇 saved {idx + 1}/{folder_count} {json_path}')
+        index_entries.extend(index_rows(local_dir, root, children_stats))
 
     # Collect all directories using os.walk so we can process them concurrently
     directories = list(os.walk(local_dir))
     folder_count = len(directories)
+    index_entries = []
     with ThreadPoolExecutor(max_workers=20) as executor:
         futures = [executor.submit(upload_meta, root, dirs, files, idx, folder_count)
             for idx, (root, dirs, files) in enumerate(directories)]
         for future in as_completed(futures):
             # This will re-raise any exceptions thrown in upload_meta
             future.result()
+    write_index(index_entries, os.path.join(local_dir, INDEX_FILE))
+    print(f'👇 saved tree index with {len(index_entries)} entries')
     end_time = time.time()
     print(f'👇 folder count: {folder_count}')
     print(f'👇 time taken: {end_time - start_time} seconds')
-def ffpush(local_dir, s3_url):
+def previous_push_index(s3_bucket_name, s3_prefix, tmp_dir):
+    # Tree index of the last push, None for a first push or for images pushed before the index existed
+    key = '/'.join([x for x in [s3_prefix, INDEX_FILE] if x != ''])
+    index_path = os.path.join(tmp_dir, f'previous{INDEX_FILE}')
+    try:
+        s3_client.download_file(s3_bucket_name, key, index_path)
+        return TreeIndex(index_path)
+    except (ClientError, ValueError) as e:
+        print(f'🟠 no tree index of a previous push, uploading everything: {e}')
+        return None
+
+def is_same_listing(children_stats, previous_children):
+    # ctime is the local atime, it changes on every read and mounts don't depend on it
+    if children_stats.keys() != previous_children.keys():
+        return False
+    for name, attr in children_stats.items():
+        previous = previous_children[name]
+        if attr.get('url') != previous.get('url'):
+            return False
+        if attr.get('dir'):
+            if 'size' in previous:
+                return False
+        elif (attr['size'], attr['mtime'], attr['sha256']) != (previous.get('size'), previous.get('mtime'), previous.get('sha256')):
+            return False
+        elif (attr.get('pack'), attr.get('pack_offset'), attr.get('pack_length'), attr.get('compression')) != \
+                (previous.get('pack'), previous.get('pack_offset'), previous.get('pack_length'), previous.get('compression')):
+            return False
+        elif (attr.get('hf_repo'), attr.get('hf_revision'), attr.get('hf_blob')) != \
+                (previous.get('hf_repo'), previous.get('hf_revision'), previous.get('hf_blob')):
+            return False
+    return True
+
+def build_packs(local_dir, s3_bucket_name, s3_prefix, out_dir, pack_file_size=DEFAULT_PACK_FILE_SIZE, hf_reference=False):
+    # Bundle small files into pack objects, returns ({rel_path: pack attrs}, [(pack path, object key)])
+    small_files = []
+    for root, dirs, files in os.walk(local_dir):
+        for file in files:
+            rel_path = os.path.relpath(os.path.join(root, file), local_dir)
+            # Reserved files and the profile under .ffbox/ are read by name, they stay objects of their own
+            if file == DIR_META_FILE or rel_path == INDEX_FILE or rel_path.startswith('.ffbox/'):
+                continue
+            if hf_reference and hf_origin(os.path.join(root, file)) is not None:
+                continue  # served by the hub, not stored in the image
+            size = os.path.getsize(os.path.join(root, file))
+            if size <= pack_file_size:
+                small_files.append((rel_path, size))
+    read_order = {}
+    read_order_path = os.path.join(local_dir, READ_ORDER_LOG)
+    if os.path.exists(read_order_path):
+        with open(read_order_path) as f:
+            entries = parse_read_order(f.read())
+        read_order = {rel_path: i for i, (operation, rel_path) in enumerate(entries)}
+    packed = {}
+    packs = []
+    for members in plan_packs(small_files, read_order=read_order):
+        pack_path, sha256, locations = write_pack(local_dir, members, out_dir)
+        object_key = '/'.join([x for x in [s3_prefix, PACK_DIR, f'{sha256}.pack'] if x != ''])
+        packs.append((pack_path, object_key))
+        for rel_path, (offset, length) in locations.items():
+            packed[rel_path] = {'pack': f's3://{s3_bucket_name}/{object_key}', 'pack_offset': offset, 'pack_length': length}
+    print(f'👇 packed {len(packed)} small files into {len(packs)} packs')
+    return packed, packs
+
+def ffpush(local_dir, s3_url, force=False, workers=DEFAULT_UPLOAD_WORKERS, bytes_in_flight=DEFAULT_BYTES_IN_FLIGHT,
+           pack=False, pack_file_size=DEFAULT_PACK_FILE_SIZE, compress=False, hf_reference=False):
     print(f'pushing from {local_dir} to s3 {s3_url}')
     if not aws_access_key or not aws_secret_key:
         print(f'🔴 no aws credentials found, please set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY')
@@ -551,26 +1625,80 @@ def ffpush(local_dir, s3_url):
     s3_bucket_name = s3_prefix.split('/')[0]
     s3_prefix = '/'.join(s3_prefix.split('/')[1:])
     
-    # Local helper function to upload metadata for one directory
-    def upload_meta(root, dirs, files, idx, folder_count):
+    # Local helper function to list one directory, its files and meta go up through the pipeline
+    def upload_meta(root, dirs, files):
         children_stats = {}
+        uploads = []
+        parent = os.path.relpath(root, local_dir)
+        previous_children = previous.children('' if parent == '.' else parent) if previous is not None else {}
         for file in files:
             if file == DIR_META_FILE:
                 print(f'🔴 .ffbox_dir_meta.json is a reserved file name')
                 continue
+            if file == INDEX_FILE and root == local_dir:
+                continue
             child_path = os.path.join(root, file)
             stats = os.stat(child_path)
             rel_path = os.path.relpath(child_path, local_dir)
             object_key = f'{s3_prefix}/{rel_path}'.strip('/')
+            url = f's3://{s3_bucket_name}/{object_key}'
+            previous_attr = previous_children.get(file) or {}
+            # Files linked from a Hugging Face hub cache snapshot, mounts link them from their own hub cache
+            hf_attrs, repo_path = hf_origin(child_path) or ({}, None)
+            if (previous_attr.get('sha256') and previous_attr.get('size') == stats.st_size
+                    and previous_attr.get('mtime') == stats.st_mtime):
+                sha256 = previous_attr['sha256']  # untouched since the last push, no need to read it again
+            elif len(hf_attrs.get('hf_blob', '')) == 64:
+                sha256 = hf_attrs['hf_blob']  # LFS blobs are named by their sha256
+            else:
+                sha256 = hash_file(child_path)
+            if hf_reference and hf_attrs:
+                url = hub_url(hf_attrs['hf_repo'], hf_attrs['hf_revision'], repo_path)
             children_stats[file] = {
                 "size": stats.st_size,           # Size in bytes
                 "mtime": stats.st_mtime,   # Last modified time
                 "ctime": stats.st_atime,    # Creation time
-                "url": f's3://{s3_bucket_name}/{object_key}',
+                "url": url,
+                "sha256": sha256,  # Content hash, lets mounts share identical files
+                **hf_attrs,
             }
-            print(f'👇 uploading {idx + 1}/{folder_count} {child_path} to s3://{s3_bucket_name}')
-
-            s3_client.upload_file(child_path, s3_bucket_name, object_key, Config=config)
+            if hf_reference and hf_attrs:
+                # Mounts read it from the hub, nothing to upload
+                continue
+            if rel_path in packed:
+                # Stored in a pack, the pack upload is all this file needs
+                children_stats[file].update(packed[rel_path])
+                pack_upload = pack_uploads.get(packed[rel_path]['pack'])
+                if pack_upload is not None:
+                    uploads.append(pack_upload)
+                continue
+            # Unchanged content stays as stored, raw objects are fine for compressed pushes too
+            if (previous_attr.get('url') == url and previous_attr.get('sha256') == sha256
+                    and previous_attr.get('size') == stats.st_size and not previous_attr.get('pack')
+                    and (compress or not previous_attr.get('compression'))):
+                if previous_attr.get('compression'):
+                    children_stats[file]['compression'] = previous_attr['compression']
+                with push_stats_lock:
+                    push_stats['skipped'] += 1
+                continue
+            compression = choose_compression(rel_path, stats.st_size) if compress else None
+            if compression:
+                fd, stored_path = tempfile.mkstemp(dir=tmp_dir, suffix='.ffbz')
+                os.close(fd)
+                stored_size = compress_file(child_path, stored_path)
+                if stored_size <= stats.st_size * (1 - MIN_SAVING):
+                    children_stats[file]['compression'] = compression
+                    upload = pipeline.submit(stored_path, s3_bucket_name, object_key, stored_size)
+                    pipeline.when_done([upload], lambda stored_path=stored_path: os.unlink(stored_path))
+                    uploads.append(upload)
+                    with push_stats_lock:
+                        push_stats['uploaded'] += 1
+                        push_stats['saved'] += stats.st_size - stored_size
+                    continue
+                os.unlink(stored_path)  # barely compressible, stored raw
+            uploads.append(pipeline.submit(child_path, s3_bucket_name, object_key, stats.st_size))
+            with push_stats_lock:
+                push_stats['uploaded'] += 1
 
         for d in dirs:
             if d == DIR_META_FILE:
@@ -583,30 +1711,96 @@ def ffpush(local_dir, s3_url):
                 "dir": True,
                 "url": f's3://{s3_bucket_name}/{object_key}',
             }
+        index_entries.extend(index_rows(local_dir, root, children_stats))
+        # A folder that was pushed before and didn't change keeps its meta as is
+        was_pushed = previous is not None and (parent == '.' or previous.lookup(*os.path.split(parent)) is not None)
+        if was_pushed and is_same_listing(children_stats, previous_children):
+            return
         rel_path = os.path.relpath(root, local_dir)
         if rel_path == '.':
             rel_path = ''
         key = '/'.join([x for x in [s3_prefix, rel_path, DIR_META_FILE] if x != ''])
-        print(f'👇 putting meta to s3://{s3_bucket_name}/{key}')
-        s3_client.put_object(
-            Bucket=s3_bucket_name, 
-            Key=key, 
-            Body=json.dumps(children_stats)
-        )
 
-    # Collect all directories using os.walk so we can process them concurrently
-    directories = list(os.walk(local_dir))
-    folder_count = len(directories)
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        futures = [executor.submit(upload_meta, root, dirs, files, idx, folder_count)
-            for idx, (root, dirs, files) in enumerate(directories)]
-        for future in as_completed(futures):
-            # This will re-raise any exceptions thrown in upload_meta
-            future.result()
+        def put_meta():
+            # Only once every child is up, so a mount never sees a meta pointing at a missing object
+            print(f'👇 putting meta to s3://{s3_bucket_name}/{key}')
+            s3_client.put_object(
+                Bucket=s3_bucket_name, 
+                Key=key, 
+                Body=json.dumps(children_stats)
+            )
+            with push_stats_lock:
+                push_stats['metas'] += 1
+        pipeline.when_done(uploads, put_meta)
+
+    index_entries = []
+    push_stats = {'uploaded': 0, 'skipped': 0, 'metas': 0, 'saved': 0}
+    push_stats_lock = threading.Lock()
+    folder_count = 0
+    ensure_pool_connections(DEFAULT_MAX_LIMIT + 20)
+    pipeline = UploadPipeline(s3_client, workers=workers, bytes_in_flight=bytes_in_flight)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Compare against the last push so only new and changed files are uploaded
+        previous = None if force else previous_push_index(s3_bucket_name, s3_prefix, tmp_dir)
+        packed, pack_uploads = {}, {}
+        if pack:
+            packed, packs = build_packs(local_dir, s3_bucket_name, s3_prefix, tmp_dir, pack_file_size, hf_reference)
+            for pack_path, object_key in packs:
+                # Packs are named by content, an unchanged set of small files is already up
+                if not force and object_exists(s3_bucket_name, object_key):
+                    continue
+                pack_uploads[f's3://{s3_bucket_name}/{object_key}'] = pipeline.submit(
+                    pack_path, s3_bucket_name, object_key, os.path.getsize(pack_path))
+        try:
+            # Folders are listed and hashed on 20 workers as the walk finds them, their files all
+            # go into the one upload pipeline
+            with ThreadPoolExecutor(max_workers=20) as executor:
+                futures = []
+                for root, dirs, files in os.walk(local_dir):
+                    futures.append(executor.submit(upload_meta, root, dirs, files))
+                    folder_count += 1
+                for future in as_completed(futures):
+                    # This will re-raise any exceptions thrown in upload_meta
+                    future.result()
+            pipeline.join()
+        finally:
+            if previous is not None:
+                previous.close()
+        index_path = os.path.join(tmp_dir, INDEX_FILE)
+        write_index(index_entries, index_path)
+        key = '/'.join([x for x in [s3_prefix, INDEX_FILE] if x != ''])
+        print(f'👇 putting tree index with {len(index_entries)} entries to s3://{s3_bucket_name}/{key}')
+        s3_client.upload_file(index_path, s3_bucket_name, key, Config=config)
     end_time = time.time()
+    print(f'👇 uploaded {push_stats["uploaded"]} files, skipped {push_stats["skipped"]} unchanged files, '
+          f'wrote {push_stats["metas"]} of {folder_count} folder metas, compression saved {push_stats["saved"]} bytes')
     print(f'👇 folder count: {folder_count}')
     print(f'👇 time taken: {end_time - start_time} seconds')
         
+def ffpublish_profile(cache_path, local_dir):
+    # Copy the profile a --record mount left in its cache dir into the image, the next push ships it
+    recorded = os.path.join(cache_path, META_DIR, RECORDED_PROFILE_FILE)
+    if not os.path.exists(recorded):
+        print(f'🔴 no recorded profile in {cache_path}, mount with --record and unmount first')
+        return
+    for name, dest in ((RECORDED_PROFILE_FILE, PROFILE_FILE), (RECORDED_READ_ORDER_FILE, READ_ORDER_LOG)):
+        src = os.path.join(cache_path, META_DIR, name)
+        if not os.path.exists(src):
+            continue
+        dest_path = os.path.join(local_dir, dest)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        shutil.copyfile(src, dest_path)
+        print(f'🟢 {src} -> {dest_path}')
+
+def object_exists(bucket, key):
+    try:
+        s3_client.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NotFound'):
+            return False
+        raise e
+
 def check_is_ffbox_folder(url: str):
     url = url.strip(' ').rstrip('/')
     print('checking url is ffbox folder', url)
@@ -626,11 +1820,23 @@ def check_is_ffbox_folder(url: str):
                 return False
             else:
                 raise e
+    if is_http_url(url):
+        try:
+            nsclient.head(f'{url}/{DIR_META_FILE}')
+            return True
+        except FileNotFoundError:
+            return False
     if url.startswith('/'):
         print('2222 metafile', os.path.join(url, DIR_META_FILE))
         return os.path.exists(os.path.join(url, DIR_META_FILE))
     return False
-def ffmount(url:str, mountpoint, cache_dir=None, foreground=True, clean_cache=False):
+def ffmount(url:str, mountpoint, cache_dir=None, foreground=True, clean_cache=False, lazy=False, block_size=DEFAULT_BLOCK_SIZE,
+            part_size=DEFAULT_PART_SIZE, concurrency=DEFAULT_CONCURRENCY, negative_timeout=NEGATIVE_TIMEOUT,
+            immutable=False, prefetch=False, prefetch_workers=DEFAULT_PREFETCH_WORKERS, prefetch_distance=DEFAULT_PREFETCH_DISTANCE,
+            record=False, cache_size=None, daemon_socket=None, peer_port=None, peers=None,
+            peer_host=DEFAULT_PEER_HOST, peer_token=None,
+            async_fetch=False, async_connections=DEFAULT_ASYNC_CONNECTIONS, warm_connections=DEFAULT_WARM_CONNECTIONS,
+            metrics_port=None, verbose=False, trace=False):
     fake_path = os.path.abspath(mountpoint)
     global nsclient
     if cache_dir is None:
@@ -644,10 +1850,17 @@ def ffmount(url:str, mountpoint, cache_dir=None, foreground=True, clean_cache=Fa
         real_path = os.path.join(cache_dir, mountpoint)
     elif url.startswith('s3://'):
         print('is s3 ')
-        nsclient = S3Client(url)
+        if async_fetch:
+            nsclient = AsyncS3Client(url, FetchEngine(async_connections))
+        else:
+            nsclient = S3Client(url)
         s3_bucket_name = '/'.join(url.split('://')[1:])
         print(f's3 bucket name: {s3_bucket_name}')
         real_path = os.path.join(cache_dir, s3_bucket_name)
+    elif is_http_url(url):
+        print('is http source')
+        nsclient = HttpClient(url, max_connections=max(concurrency, DEFAULT_HTTP_CONNECTIONS))
+        real_path = os.path.join(cache_dir, url.split('://')[1].strip('/'))
     else:
         raise Exception('Network storage type not supported!')
         
@@ -662,6 +1875,9 @@ def ffmount(url:str, mountpoint, cache_dir=None, foreground=True, clean_cache=Fa
     # check if the s3 folder is a ffbox folder
     is_ffbox_folder = check_is_ffbox_folder(url)
     print(f'🦄 is ffbox meta folder:', is_ffbox_folder)
+    if is_http_url(url) and not is_ffbox_folder:
+        # Plain http has no listing, the folder meta is the only way to know what is in there
+        raise Exception(f'{url} has no {DIR_META_FILE}, only pushed ffbox folders can be mounted over http')
     os.setxattr(real_path, 'user.url', url.rstrip('/').encode('utf-8'))
 
     if clean_cache and os.path.exists(real_path):
@@ -670,9 +1886,41 @@ def ffmount(url:str, mountpoint, cache_dir=None, foreground=True, clean_cache=Fa
     os.makedirs(real_path, exist_ok=True)
 
     print(f"real storage path: {real_path}, fake storage path: {fake_path}")
-    passthru = Passthrough(real_path, fake_path, url, is_ffbox_folder)
-    # passthru.start_background_pulling()
-    FUSE(passthru, fake_path, foreground=foreground)
+    ensure_pool_connections(DEFAULT_MAX_LIMIT)
+    if isinstance(nsclient, AsyncS3Client) and warm_connections:
+        nsclient.warm(warm_connections)
+    passthru = Passthrough(real_path, fake_path, url, is_ffbox_folder, lazy=lazy, block_size=block_size,
+                           part_size=part_size, concurrency=concurrency, cas_dir=os.path.join(cache_dir, CAS_DIR),
+                           immutable=immutable, verbose=verbose)
+    if trace:
+        passthru.start_tracing(os.path.join(real_path, META_DIR, TRACE_FILE))
+    if metrics_port:
+        serve_metrics(passthru.metrics, metrics_port, tracer=passthru.tracer)
+    if peer_port:
+        peer_server = PeerServer(peer_port, host=peer_host, token=peer_token)
+        peer_server.add_mount(passthru)
+        peer_server.start()
+    if peers:
+        passthru.peers = PeerClient(peers, token=peer_token)
+    if daemon_socket:
+        passthru.daemon = DaemonClient(daemon_socket, mount_id=f'{os.getpid()}:{fake_path}')
+    if is_ffbox_folder:
+        passthru.load_index()
+    if prefetch:
+        passthru.start_background_pulling(workers=prefetch_workers, distance=prefetch_distance)
+    if cache_size:
+        passthru.start_cache_manager(cache_size, cache_dir)
+    if record:
+        # Kept out of the image's own .ffbox, which the mount serves from the image
+        passthru.start_recording(os.path.join(real_path, META_DIR, RECORDED_PROFILE_FILE))
+    if immutable:
+        # Pushed images never change: keep attributes, entries and file pages in the kernel so warm
+        # stat and read calls are served at native speed without reaching python
+        FUSE(passthru, fake_path, foreground=foreground, ro=True, kernel_cache=True,
+             attr_timeout=IMMUTABLE_TIMEOUT, entry_timeout=IMMUTABLE_TIMEOUT, negative_timeout=IMMUTABLE_TIMEOUT)
+        return
+    # Let the kernel remember misses too, so repeated probes of missing paths never reach python
+    FUSE(passthru, fake_path, foreground=foreground, negative_timeout=negative_timeout)
 
 def main():
     import argparse
@@ -681,16 +1929,59 @@ def main():
 
     # Mount command
     parser_mount = subparsers.add_parser("mount", help="Mount an S3 bucket to a local directory")
-    parser_mount.add_argument("s3_url", help="URL of the S3 bucket")
+    parser_mount.add_argument("s3_url", help="URL of the S3 bucket, a local folder or an http(s) url of a pushed folder")
     parser_mount.add_argument("mountpoint", help="Local directory to mount the S3 bucket to")
     parser_mount.add_argument("--clean", action="store_true", help="Clean the cache directory before mounting")
     parser_mount.add_argument("--cache-dir", help="Cache directory to use")
+    parser_mount.add_argument("--lazy", action="store_true", help="Fetch file blocks on read instead of downloading whole files on open")
+    parser_mount.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="Block size in bytes for lazy range fetches")
+    parser_mount.add_argument("--part-size", type=int, default=DEFAULT_PART_SIZE, help="Size in bytes of each parallel ranged request")
+    parser_mount.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Ranged requests in flight per mount to start from, adjusted as the mount measures throughput and latency")
+    parser_mount.add_argument("--negative-timeout", type=float, default=NEGATIVE_TIMEOUT, help="Seconds the kernel caches lookups of missing paths")
+    parser_mount.add_argument("--immutable", action="store_true", help="Read-only mount with long kernel attribute, entry and page caching")
+    parser_mount.add_argument("--prefetch", action="store_true", help="Prefetch files in the order of the image's .ffbox/read_order.log")
+    parser_mount.add_argument("--prefetch-workers", type=int, default=DEFAULT_PREFETCH_WORKERS, help="Background prefetch workers")
+    parser_mount.add_argument("--prefetch-distance", type=int, default=DEFAULT_PREFETCH_DISTANCE, help="Read order entries prefetch may run ahead of the application")
+    parser_mount.add_argument("--record", action="store_true", help=f"Record every lookup, open and read into {META_DIR}/{RECORDED_PROFILE_FILE} of the cache dir, `ffbox profile publish` copies it into the image")
+    parser_mount.add_argument("--cache-size", type=float, help="Cache budget in GB of the whole cache dir, shared by every image mounted from it and the content store, least recently used files are evicted beyond it")
+    parser_mount.add_argument("--daemon", nargs="?", const=DEFAULT_SOCKET, help="Fetch through the node's ffbox daemon listening on this socket")
+    parser_mount.add_argument("--peer-port", type=int, nargs="?", const=DEFAULT_PEER_PORT, help="Serve cached ranges to other nodes on this port")
+    parser_mount.add_argument("--peer-host", default=DEFAULT_PEER_HOST, help="Interface the peer server listens on, the cluster interface to serve other nodes")
+    parser_mount.add_argument("--peer-token", help="Shared token peers must present, defaults to FFBOX_PEER_TOKEN, required off localhost")
+    parser_mount.add_argument("--peers", help="Comma separated host:port of peer nodes to ask before the backend")
+    parser_mount.add_argument("--async-fetch", action="store_true", help="Fetch S3 ranges on an asyncio engine over presigned urls")
+    parser_mount.add_argument("--async-connections", type=int, default=DEFAULT_ASYNC_CONNECTIONS, help="Requests in flight on the async engine")
+    parser_mount.add_argument("--warm-connections", type=int, default=DEFAULT_WARM_CONNECTIONS, help="Connections the async engine opens at mount time")
+    parser_mount.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics of the mount on this local port")
+    parser_mount.add_argument("--verbose", action="store_true", help="Log every FUSE call and block fetch, slow under load")
+    parser_mount.add_argument("--trace", action="store_true", help=f"Trace FUSE requests, fetches and prefetch into {META_DIR}/{TRACE_FILE} of the cache dir (Chrome trace format) at unmount, also served on the metrics port at /trace")
+
+    # Daemon command
+    parser_daemon = subparsers.add_parser("daemon", help="Run the node-wide fetch daemon shared by all mounts")
+    parser_daemon.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket to listen on")
+    parser_daemon.add_argument("--workers", type=int, default=DEFAULT_DAEMON_WORKERS, help="Backend fetches in flight for the whole node")
+    parser_daemon.add_argument("--memory", type=int, default=DEFAULT_DAEMON_MEMORY // 1024 // 1024, help="MB of recently fetched ranges kept in memory")
+    parser_daemon.add_argument("--block-size", type=int, default=DEFAULT_DAEMON_BLOCK_SIZE, help="Bytes per block, overlapping ranges of any mount share the fetches of their blocks")
 
     # Push command
     parser_push = subparsers.add_parser("push", help="Push a local directory to an S3 bucket")
     parser_push.add_argument("local_dir", help="Local directory containing files to push")
     parser_push.add_argument("s3_url", help="S3 URL to push files to")
+    parser_push.add_argument("--force", action="store_true", help="Upload every file, even the ones unchanged since the last push")
+    parser_push.add_argument("--pack", action="store_true", help="Bundle small files into pack objects, in read order when .ffbox/read_order.log exists")
+    parser_push.add_argument("--pack-file-size", type=int, default=DEFAULT_PACK_FILE_SIZE, help="Largest file in bytes that is packed")
+    parser_push.add_argument("--compress", action="store_true", help="Store compressible files as independently compressed blocks")
+    parser_push.add_argument("--hf-reference", action="store_true", help="Point files linked from a Hugging Face hub cache at the hub instead of uploading them")
+    parser_push.add_argument("--workers", type=int, default=DEFAULT_UPLOAD_WORKERS, help="Part uploads in flight to start from, adjusted as the push measures throughput")
+    parser_push.add_argument("--bytes-in-flight", type=int, default=DEFAULT_BYTES_IN_FLIGHT // 1024 // 1024, help="MB read but not uploaded yet")
     
+    # Profile command
+    parser_profile = subparsers.add_parser("profile", help="Manage access profiles recorded with mount --record")
+    profile_subparsers = parser_profile.add_subparsers(dest="profile_command")
+    parser_publish = profile_subparsers.add_parser("publish", help=f"Copy the recorded profile and read order into {PROFILE_FILE} and {READ_ORDER_LOG} of an image, push or deploy it afterwards")
+    parser_publish.add_argument("cache_path", help="Cache dir of the recorded mount, the real storage path the mount printed")
+    parser_publish.add_argument("local_dir", help="Local directory of the image to push")
+
     # Deploy path command
     parser_deploy = subparsers.add_parser("deploy", help="Deploy a network directory")
     parser_deploy.add_argument("local_dir", help="Local directory containing files to push")
@@ -698,9 +1989,25 @@ def main():
     args = parser.parse_args()
 
     if args.command == "mount":
-        ffmount(args.s3_url, args.mountpoint, cache_dir=args.cache_dir, clean_cache=args.clean)
+        ffmount(args.s3_url, args.mountpoint, cache_dir=args.cache_dir, clean_cache=args.clean,
+                lazy=args.lazy, block_size=args.block_size, part_size=args.part_size, concurrency=args.concurrency,
+                negative_timeout=args.negative_timeout, immutable=args.immutable, prefetch=args.prefetch,
+                prefetch_workers=args.prefetch_workers, prefetch_distance=args.prefetch_distance, record=args.record,
+                cache_size=int(args.cache_size * 1024 ** 3) if args.cache_size else None, daemon_socket=args.daemon,
+                peer_port=args.peer_port, peers=args.peers.split(',') if args.peers else None,
+                peer_host=args.peer_host, peer_token=args.peer_token,
+                async_fetch=args.async_fetch, async_connections=args.async_connections,
+                warm_connections=args.warm_connections, metrics_port=args.metrics_port, verbose=args.verbose,
+                trace=args.trace)
+    elif args.command == "daemon":
+        FetchDaemon(args.socket, workers=args.workers, memory=args.memory * 1024 * 1024,
+                    block_size=args.block_size).serve_forever()
     elif args.command == "push":
-        ffpush(args.local_dir, args.s3_url)
+        ffpush(args.local_dir, args.s3_url, force=args.force, workers=args.workers,
+               bytes_in_flight=args.bytes_in_flight * 1024 * 1024, pack=args.pack, pack_file_size=args.pack_file_size,
+               compress=args.compress, hf_reference=args.hf_reference)
+    elif args.command == "profile" and args.profile_command == "publish":
+        ffpublish_profile(args.cache_path, args.local_dir)
     elif args.command == "deploy":
         ffdeploy_path(args.local_dir)
     else:
@@ -0,0 +1,67 @@
+import os
+import json
+import struct
+import hashlib
+
+PACK_DIR = '.ffbox_packs'  # pack objects live here, next to the root .ffbox_dir_meta.json
+DEFAULT_PACK_FILE_SIZE = 64 * 1024  # files up to this size are packed
+DEFAULT_PACK_SIZE = 16 * 1024 * 1024  # target size of one pack object
+
+# Layout: u32 manifest length, the manifest as json, then the data of every member back to back.
+# The manifest is a list of [path relative to the image root, offset in the pack, length].
+MANIFEST_LENGTH = struct.Struct('<I')
+
+def plan_packs(files, pack_size=DEFAULT_PACK_SIZE, read_order=None):
+    """Group (rel_path, size) small files into packs of about pack_size bytes.
+
+    Files in read_order (rel_path -> position) come first in that order so a cold start reads the
+    packs front to back, the rest follow sorted by path so unchanged trees give identical packs.
+    """
+    read_order = read_order or {}
+    ordered = sorted(files, key=lambda f: (read_order.get(f[0], len(read_order)), f[0]))
+    packs = []
+    current, current_size = [], 0
+    for rel_path, size in ordered:
+        if current and current_size + size > pack_size:
+            packs.append(current)
+            current, current_size = [], 0
+        current.append(rel_path)
+        current_size += size
+    if current:
+        packs.append(current)
+    return packs
+
+def write_pack(local_dir, members, out_dir):
+    """Write the pack of members to out_dir, returns (path, sha256, {rel_path: (offset, length)})"""
+    datas = []
+    for rel_path in members:
+        with open(os.path.join(local_dir, rel_path), 'rb') as f:
+            datas.append(f.read())
+    # Offsets depend on the manifest length, which depends on the offsets: lay the data out
+    # relative to the end of the manifest, then shift once the manifest size is known
+    relative = []
+    position = 0
+    for rel_path, data in zip(members, datas):
+        relative.append((rel_path, position, len(data)))
+        position += len(data)
+    manifest = b''
+    data_start = MANIFEST_LENGTH.size
+    while True:
+        locations = [[rel_path, data_start + offset, length] for rel_path, offset, length in relative]
+        encoded = json.dumps(locations).encode('utf-8')
+        if MANIFEST_LENGTH.size + len(encoded) == data_start:
+            manifest = encoded
+            break
+        data_start = MANIFEST_LENGTH.size + len(encoded)
+    content = MANIFEST_LENGTH.pack(len(manifest)) + manifest + b''.join(datas)
+    sha256 = hashlib.sha256(content).hexdigest()
+    pack_path = os.path.join(out_dir, f'{sha256}.pack')
+    with open(pack_path, 'wb') as f:
+        f.write(content)
+    return pack_path, sha256, {rel_path: (offset, length) for rel_path, offset, length in locations}
+
+def read_pack_manifest(content: bytes):
+    """[(rel_path, offset, length)] of a pack fetched whole"""
+    (manifest_length,) = MANIFEST_LENGTH.unpack_from(content, 0)
+    manifest = json.loads(bytes(content[MANIFEST_LENGTH.size:MANIFEST_LENGTH.size + manifest_length]))
+    return [(rel_path, offset, length) for rel_path, offset, length in manifest]
@@ -0,0 +1,145 @@
+import os
+import hmac
+import time
+import random
+import threading
+import http.client
+from urllib.parse import urlencode, urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_PEER_PORT = 7341
+DEFAULT_PEER_HOST = '127.0.0.1'  # peers on other nodes need an explicit cluster interface
+TOKEN_HEADER = 'X-Ffbox-Token'
+TOKEN_ENV = 'FFBOX_PEER_TOKEN'  # shared by every node of the cluster
+LOOPBACK_HOSTS = ('127.0.0.1', '::1', 'localhost')
+PEER_TIMEOUT = 2  # seconds, a slow peer is worse than going to the backend
+PEER_BACKOFF = 30  # seconds an unreachable peer is skipped
+
+# Ranges are served from what the node already has cached, the server never fetches on behalf of a peer:
+#   GET /range?url=<absolute url>&sha256=<hash> with a `Range: bytes=<first>-<last>` header
+#   and the cluster's shared token in X-Ffbox-Token
+# The content store is tried by hash first, then the file of that url in the node's mounts, which may be
+# partially cached. The answer is 206, or 404 when the range isn't cached here.
+
+class PeerServer:
+    """Exposes the ranges the mounts of this node have cached to the other nodes"""
+
+    def __init__(self, port=DEFAULT_PEER_PORT, host=DEFAULT_PEER_HOST, token=None):
+        self.port = port
+        self.host = host
+        self.token = token if token is not None else os.environ.get(TOKEN_ENV)
+        if not self.token and host not in LOOPBACK_HOSTS:
+            raise ValueError(f'serving peers on {host} needs a shared token, set {TOKEN_ENV} or --peer-token')
+        self.mounts = []  # Passthrough objects, each answers read_cached(url, sha256, offset, length)
+        self.served = 0
+
+    def add_mount(self, mount):
+        self.mounts.append(mount)
+
+    def read_cached(self, url, sha256, offset, length):
+        for mount in self.mounts:
+            data = mount.read_cached(url, sha256, offset, length)
+            if data is not None:
+                return data
+        return None
+
+    def start(self):
+        peer_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, peers reuse connections for every block
+
+            def do_GET(self):
+                if peer_server.token and not hmac.compare_digest(
+                        self.headers.get(TOKEN_HEADER, '').encode('utf-8'), peer_server.token.encode('utf-8')):
+                    return self.reply(403)
+                parsed = urlparse(self.path)
+                if parsed.path != '/range':
+                    return self.reply(404)
+                query = parse_qs(parsed.query)
+                url = query.get('url', [''])[0]
+                sha256 = query.get('sha256', [None])[0]
+                byte_range = parse_range(self.headers.get('Range'))
+                if byte_range is None:
+                    return self.reply(416)
+                data = peer_server.read_cached(url, sha256, *byte_range)
+                if data is None:
+                    return self.reply(404)
+                peer_server.served += 1
+                self.reply(206, data)
+
+            def reply(self, status, data=b''):
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # one line per block is far too chatty
+
+        server = ThreadingHTTPServer((self.host, self.port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f'🦄 serving cached ranges to peers on {self.host}:{server.server_address[1]}')
+        return server
+
+def parse_range(header):
+    # 'bytes=<first>-<last>' -> (offset, length)
+    if not header or not header.startswith('bytes='):
+        return None
+    try:
+        first, last = header[len('bytes='):].split('-')
+        offset = int(first)
+        length = int(last) - offset + 1
+    except ValueError:
+        return None
+    return (offset, length) if length > 0 else None
+
+class PeerClient:
+    """Asks peer nodes for a range before it is fetched from the backend"""
+
+    def __init__(self, peers, token=None):
+        self.peers = list(peers)  # 'host:port'
+        self.token = token if token is not None else os.environ.get(TOKEN_ENV)
+        self.down_until = {}  # peer -> time it is tried again
+        self.local = threading.local()  # per thread keep-alive connection per peer
+        self.hits = 0
+        self.misses = 0
+
+    def connection(self, peer):
+        connections = getattr(self.local, 'connections', None)
+        if connections is None:
+            connections = self.local.connections = {}
+        if peer not in connections:
+            host, port = peer.rsplit(':', 1)
+            connections[peer] = http.client.HTTPConnection(host, int(port), timeout=PEER_TIMEOUT)
+        return connections[peer]
+
+    def get_range(self, url, sha256, offset, length):
+        """Bytes of the range from the first peer that has it cached, None when no peer does"""
+        query = {'url': url, 'sha256': sha256} if sha256 else {'url': url}
+        path = f'/range?{urlencode(query)}'
+        headers = {'Range': f'bytes={offset}-{offset + length - 1}'}
+        if self.token:
+            headers[TOKEN_HEADER] = self.token
+        now = time.time()
+        # Start at a random peer so 40 replicas don't all hammer the first one in the list
+        start = random.randrange(len(self.peers)) if self.peers else 0
+        for peer in self.peers[start:] + self.peers[:start]:
+            if self.down_until.get(peer, 0) > now:
+                continue
+            try:
+                conn = self.connection(peer)
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                print(f'🟠 peer {peer} unreachable, skipping it for {PEER_BACKOFF}s: {e}')
+                self.connection(peer).close()
+                self.down_until[peer] = now + PEER_BACKOFF
+                continue
+            if response.status == 206 and len(data) == length:
+                self.hits += 1
+                return data
+        self.misses += 1
+        return None
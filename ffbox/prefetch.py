@@ -0,0 +1,135 @@
+import heapq
+import threading
+from contextlib import contextmanager
+
+READ_ORDER_LOG = '.ffbox/read_order.log'
+DEFAULT_PREFETCH_WORKERS = 16
+DEFAULT_PREFETCH_DISTANCE = 256  # profile entries prefetch may run ahead of the application
+
+def parse_read_order(content: str):
+    """Unique (operation, relative path) entries of a read_order.log, in recorded order.
+
+    Folders end with '/'. A path that is both stat'ed and opened keeps its first position
+    and is reported as opened, opening is the more expensive operation to warm.
+    """
+    entries = {}
+    for line in content.splitlines():
+        line = line.strip()
+        if ' ' not in line:
+            continue
+        operation, rel_path = line.split(' ', 1)
+        if operation in ('open', 'openat'):
+            entries[rel_path] = 'openat'
+        elif rel_path not in entries:
+            entries[rel_path] = operation
+    return [(operation, rel_path) for rel_path, operation in entries.items()]
+
+def profile_entries(events, block_size: int):
+    """Unique (operation, path, offset, length) entries of an access profile, in first-touch order.
+
+    Reads are split into blocks so prefetch warms exactly the byte ranges the application used,
+    opens only warm the whole file when the mount isn't lazy.
+    """
+    entries = {}
+    for event in events:
+        op, path = event['op'], event['path']
+        if op == 'read':
+            first_block = event['offset'] // block_size
+            last_block = (event['offset'] + max(event['length'], 1) - 1) // block_size
+            for i in range(first_block, last_block + 1):
+                entries.setdefault(f'{path}#{i}', ('read', path, i * block_size, block_size))
+        elif op == 'open':
+            entries.setdefault(path, ('open', path, 0, 0))
+        elif op == 'readdir' or (op == 'getattr' and event['length'] < 0):
+            entries.setdefault(path, ('stat', path, 0, 0))
+    return list(entries.items())
+
+class PrefetchScheduler:
+    """Warms items in recorded access order on a bounded pool of background workers.
+
+    Items are (order, key, payload) where order is the position in the profile. Workers only start
+    items up to `distance` entries past the furthest position the application has reached, and
+    never start background work while a foreground request is running.
+    """
+
+    def __init__(self, fetch, workers=DEFAULT_PREFETCH_WORKERS, distance=DEFAULT_PREFETCH_DISTANCE):
+        self.fetch = fetch  # fetch(key, payload), runs on a worker thread
+        self.workers = workers
+        self.distance = distance  # None lets prefetch run arbitrarily far ahead
+        self.queue = []  # heap of (order, key, payload)
+        self.orders = {}  # key -> order, to follow the application through the profile
+        self.position = 0
+        self.foreground_active = 0
+        self.running = 0
+        self.stopped = False
+        self.cond = threading.Condition()
+        self.threads = []
+
+    def add(self, items):
+        with self.cond:
+            for order, key, payload in items:
+                self.orders[key] = order
+                heapq.heappush(self.queue, (order, key, payload))
+            self.cond.notify_all()
+
+    def start(self):
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self.worker, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+    def touch(self, key):
+        # The application reached key, let prefetch move its window forward
+        order = self.orders.get(key)
+        if order is not None and order > self.position:
+            with self.cond:
+                self.position = max(self.position, order)
+                self.cond.notify_all()
+
+    @contextmanager
+    def foreground(self, key=None):
+        """Wrap application requests, background workers hold off while any is running"""
+        if key is not None:
+            self.touch(key)
+        with self.cond:
+            self.foreground_active += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.foreground_active -= 1
+                if self.foreground_active == 0:
+                    self.cond.notify_all()
+
+    def ready(self):
+        if self.stopped or not self.queue or self.foreground_active:
+            return False
+        return self.distance is None or self.queue[0][0] <= self.position + self.distance
+
+    def worker(self):
+        while True:
+            with self.cond:
+                while not self.ready():
+                    if self.stopped or (not self.queue and not self.running):
+                        self.cond.notify_all()
+                        return
+                    self.cond.wait()
+                order, key, payload = heapq.heappop(self.queue)
+                self.running += 1
+            try:
+                self.fetch(key, payload)
+            except Exception as e:
+                print(f'🦄🟠 prefetch of {key} failed: {e}')
+            finally:
+                with self.cond:
+                    self.running -= 1
+                    self.cond.notify_all()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
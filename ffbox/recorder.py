@@ -0,0 +1,89 @@
+import os
+import struct
+import threading
+import time
+
+PROFILE_FILE = '.ffbox/access_profile.bin'  # in the image, next to .ffbox/read_order.log
+RECORDED_PROFILE_FILE = 'recorded_access_profile.bin'  # in the cache's meta dir, pushed once copied to PROFILE_FILE
+RECORDED_READ_ORDER_FILE = 'recorded_read_order.log'  # the paths of the recording, in .ffbox/read_order.log format
+
+# A profile is a magic header followed by records, each starting with its kind byte:
+# PATH records give a path an id the first time it is seen, EVENT records reference that id.
+MAGIC = b'FFBXPRF1'
+PATH = struct.Struct('<BIH')  # kind, path id, path byte length, followed by the path
+EVENT = struct.Struct('<BIqqqqI')  # kind, path id, start ns since recording began, offset, length, elapsed ns, tid
+KIND_PATH = 0
+OPS = {'getattr': 1, 'open': 2, 'read': 3, 'readdir': 4}
+OP_NAMES = {code: name for name, code in OPS.items()}
+
+class AccessRecorder:
+    """Appends every lookup, open, read and readdir the mount serves to a compact binary profile.
+
+    For getattr the length is the file size, or -1 for folders, so replays know what to warm.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, 'wb', buffering=1024 * 1024)
+        self.file.write(MAGIC)
+        self.path_ids = {}
+        self.lock = threading.Lock()
+        self.start_ns = time.perf_counter_ns()
+
+    def record(self, op: str, path: str, start_ns: int, elapsed_ns: int, offset=0, length=0, tid=0):
+        with self.lock:
+            path_id = self.path_ids.get(path)
+            if path_id is None:
+                path_id = len(self.path_ids)
+                self.path_ids[path] = path_id
+                encoded = path.encode('utf-8', 'surrogateescape')
+                self.file.write(PATH.pack(KIND_PATH, path_id, len(encoded)) + encoded)
+            self.file.write(EVENT.pack(OPS[op], path_id, start_ns - self.start_ns, offset, length, elapsed_ns, tid))
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def read_profile(path: str):
+    """Yield the events of a profile as dicts, in recorded order"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    if content[:len(MAGIC)] != MAGIC:
+        raise ValueError(f'{path} is not an ffbox access profile')
+    paths = {}
+    pos = len(MAGIC)
+    while pos < len(content):
+        kind = content[pos]
+        if kind == KIND_PATH:
+            if pos + PATH.size > len(content):
+                break
+            _, path_id, length = PATH.unpack_from(content, pos)
+            pos += PATH.size
+            paths[path_id] = content[pos:pos + length].decode('utf-8', 'surrogateescape')
+            pos += length
+        else:
+            if pos + EVENT.size > len(content):
+                break  # truncated by a crash while recording
+            op, path_id, start_ns, offset, length, elapsed_ns, tid = EVENT.unpack_from(content, pos)
+            pos += EVENT.size
+            yield {'op': OP_NAMES[op], 'path': paths[path_id], 'start_ns': start_ns, 'offset': offset,
+                   'length': length, 'elapsed_ns': elapsed_ns, 'tid': tid}
+
+def profile_to_read_order(profile_path: str, output_file_path: str):
+    """Write the read_order.log equivalent of a profile, for tools that only understand paths"""
+    output_line_set = set()
+    with open(output_file_path, 'w') as output_file:
+        for event in read_profile(profile_path):
+            rel_path = event['path'].lstrip('/')
+            if event['op'] == 'open':
+                output_line = f'openat {rel_path}'
+            elif event['op'] == 'readdir':
+                output_line = f'openat {rel_path}/'
+            elif event['op'] == 'getattr':
+                output_line = f'stat {rel_path}/' if event['length'] < 0 else f'stat {rel_path}'
+            else:
+                continue
+            if rel_path and output_line not in output_line_set:
+                output_file.write(output_line + '\n')
+                output_line_set.add(output_line)
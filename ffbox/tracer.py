@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+TRACE_FILE = 'trace.json'  # in the cache's meta dir, next to the recorded access profile
+DEFAULT_MAX_EVENTS = 1000000  # spans kept, later ones are dropped and counted
+
+def proc_field(pid, name):
+    try:
+        with open(f'/proc/{pid}/{name}') as f:
+            return f.read()
+    except OSError:
+        return None
+
+class Tracer:
+    """Spans of a mount in Chrome trace-event format, for chrome://tracing or Perfetto.
+
+    FUSE requests are drawn on the lanes of the application threads that made them, as reported
+    by fuse_get_context, grouped under their process. Backend fetches, waits on fetches of other
+    requests and prefetch run on the mount's own threads under the mount process, so a stall in
+    the application lines up with the fetch it was waiting for.
+    """
+
+    def __init__(self, path, max_events=DEFAULT_MAX_EVENTS):
+        self.path = path
+        self.max_events = max_events
+        self.start_ns = time.perf_counter_ns()
+        self.events = []
+        self.dropped = 0
+        self.pid = os.getpid()
+        self.threads = {}  # tid -> pid of every thread seen, with a name event for each
+        self.lock = threading.Lock()
+        self.metadata('process_name', self.pid, None, 'ffbox mount')
+
+    def metadata(self, kind, pid, tid, name):
+        event = {'name': kind, 'ph': 'M', 'pid': pid, 'args': {'name': name}}
+        if tid is not None:
+            event['tid'] = tid
+        self.events.append(event)
+
+    def application_pid(self, tid):
+        # Called holding the lock, /proc is read once per application thread
+        pid = self.threads.get(tid)
+        if pid is not None:
+            return pid
+        status = proc_field(tid, 'status') or ''
+        pid = next((int(line.split()[1]) for line in status.splitlines() if line.startswith('Tgid:')), tid)
+        if pid != self.pid and pid not in self.threads.values():
+            self.metadata('process_name', pid, None, (proc_field(pid, 'comm') or str(pid)).strip())
+        self.threads[tid] = pid
+        self.metadata('thread_name', pid, tid, (proc_field(tid, 'comm') or str(tid)).strip())
+        return pid
+
+    def add(self, name, cat, start_ns, elapsed_ns, pid, tid, args):
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'ts': (start_ns - self.start_ns) / 1000,
+                 'dur': elapsed_ns / 1000, 'pid': pid, 'tid': tid, 'args': args}
+        with self.lock:
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+                return
+            if pid is None:
+                pid = event['pid'] = self.application_pid(tid)
+            elif tid not in self.threads:
+                self.threads[tid] = pid
+                self.metadata('thread_name', pid, tid, threading.current_thread().name)
+            self.events.append(event)
+
+    def fuse(self, op, args, start_ns, elapsed_ns, tid, error=None):
+        """One FUSE request, on the lane of the calling application thread"""
+        span_args = {'path': args[0]} if args and isinstance(args[0], str) else {}
+        if op == 'read':
+            span_args['length'], span_args['offset'] = args[1], args[2]
+        if error is not None:
+            span_args['error'] = error
+        span_args['mount_tid'] = threading.get_native_id()  # the mount thread serving it, whose spans it waited on
+        self.add(op, 'fuse', start_ns, elapsed_ns, None, tid, span_args)
+
+    def record(self, name, cat, start_ns, elapsed_ns, args):
+        """A span of the current mount thread"""
+        self.add(name, cat, start_ns, elapsed_ns, self.pid, threading.get_native_id(), args)
+
+    @contextmanager
+    def span(self, name, cat, **args):
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, cat, start_ns, time.perf_counter_ns() - start_ns, args)
+
+    def export(self) -> bytes:
+        with self.lock:
+            trace = {'traceEvents': list(self.events), 'displayTimeUnit': 'ms',
+                     'otherData': {'dropped_events': self.dropped}}
+        return json.dumps(trace).encode('utf-8')
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f'{self.path}.tmp', 'wb') as f:
+            f.write(self.export())
+        os.replace(f'{self.path}.tmp', self.path)
@@ -0,0 +1,58 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+DEFAULT_PART_SIZE = 16 * 1024 * 1024  # 16MB per ranged request
+DEFAULT_CONCURRENCY = 16  # ranged requests in flight per mount
+
+def split_ranges(offset: int, end: int, part_size: int):
+    """Split [offset, end) into (offset, length) parts of at most part_size bytes."""
+    return [(start, min(part_size, end - start)) for start in range(offset, end, part_size)]
+
+class RangedDownloader:
+    """Fetches many byte ranges of large objects at once over pools of worker threads, one per traffic class.
+
+    The worker count is the number of requests in flight, so the backend connection pool
+    (max_pool_connections for boto3) must be at least as large. Each traffic class queues in its
+    own pool, so parts of an application read never wait behind prefetch parts for a worker.
+    """
+
+    def __init__(self, part_size=DEFAULT_PART_SIZE, max_concurrency=DEFAULT_CONCURRENCY):
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.executors = {}  # traffic class -> ThreadPoolExecutor
+        self.lock = threading.Lock()
+
+    def executor(self, traffic):
+        with self.lock:
+            executor = self.executors.get(traffic)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix=f'ffbox-range-{traffic}')
+                self.executors[traffic] = executor
+            return executor
+
+    def map(self, fetch_part, parts, traffic='foreground'):
+        # A single part is fetched on the calling thread, there is nothing to overlap it with
+        if len(parts) == 1:
+            fetch_part(parts[0])
+            return
+        executor = self.executor(traffic)
+        futures = [executor.submit(fetch_part, part) for part in parts]
+        # Wait for every part before re-raising a failure, the caller closes the fd they write to
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    def download(self, read_range, fd: int, offset: int, length: int):
+        """Fetch [offset, offset + length) with read_range(offset, length) -> bytes and pwrite each part into fd."""
+        def fetch_part(part):
+            part_offset, part_length = part
+            data = read_range(part_offset, part_length)
+            os.pwrite(fd, data, part_offset)
+        self.map(fetch_part, split_ranges(offset, offset + length, self.part_size))
+
+    def shutdown(self):
+        with self.lock:
+            executors = list(self.executors.values())
+        for executor in executors:
+            executor.shutdown(wait=False)
@@ -0,0 +1,182 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ffbox.concurrency import ConcurrencyController
+
+DEFAULT_UPLOAD_WORKERS = 32  # part uploads in flight for the whole push to start from
+DEFAULT_BYTES_IN_FLIGHT = 1024 * 1024 * 1024  # read into memory but not uploaded yet
+MULTIPART_THRESHOLD = 64 * 1024 * 1024  # smaller files go up in a single PUT
+MIN_PART_SIZE = 16 * 1024 * 1024
+MAX_PARTS = 10000  # S3 limit of parts per multipart upload
+PROGRESS_INTERVAL = 5  # seconds between progress lines
+
+def part_size_for(size: int) -> int:
+    # Big enough that the largest file fits in MAX_PARTS, rounded up to whole MB
+    part_size = max(MIN_PART_SIZE, -(-size // MAX_PARTS))
+    return -(-part_size // (1024 * 1024)) * 1024 * 1024
+
+class UploadFile:
+    """One file of the push, done once its single PUT or every multipart part is uploaded"""
+
+    def __init__(self, local_path, bucket, key, size):
+        self.local_path = local_path
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.upload_id = None
+        self.etags = {}  # part number -> ETag
+        self.parts_left = 0
+        self.finished = False
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+class UploadPipeline:
+    """Uploads the files of a push from one global queue of parts on a shared pool of workers.
+
+    Every file is split into parts sized for it, and parts of all files are interleaved on the same
+    workers, so a folder of 200 shards keeps every worker busy. Submitting blocks while more than
+    bytes_in_flight bytes are queued or uploading, which keeps memory bounded however large the push.
+    The push limit of the controller, starting at workers, decides how many parts are uploading.
+    """
+
+    def __init__(self, client, workers=DEFAULT_UPLOAD_WORKERS, bytes_in_flight=DEFAULT_BYTES_IN_FLIGHT, controller=None):
+        self.client = client  # boto3 s3 client, its pool needs a connection per worker
+        self.bytes_in_flight = bytes_in_flight
+        self.controller = controller or ConcurrencyController({'push': workers})
+        self.executor = ThreadPoolExecutor(max_workers=self.controller.maximum, thread_name_prefix='ffbox-upload')
+        self.cond = threading.Condition()
+        self.queued_bytes = 0
+        self.pending = 0  # tasks submitted and not finished yet
+        self.errors = []
+        self.files_submitted = 0
+        self.files_done = 0
+        self.bytes_submitted = 0
+        self.bytes_done = 0
+        self.start_time = time.time()
+        self.stopped = threading.Event()
+        threading.Thread(target=self.report_progress, daemon=True).start()
+
+    def submit(self, local_path, bucket, key, size):
+        upload = UploadFile(local_path, bucket, key, size)
+        with self.cond:
+            self.files_submitted += 1
+            self.bytes_submitted += size
+        if size < MULTIPART_THRESHOLD:
+            upload.parts_left = 1
+            self.submit_part(upload, 0, 0, size)
+            return upload
+        part_size = part_size_for(size)
+        response = self.client.create_multipart_upload(Bucket=bucket, Key=key)
+        upload.upload_id = response['UploadId']
+        offsets = range(0, size, part_size)
+        upload.parts_left = len(offsets)
+        for part_number, offset in enumerate(offsets, start=1):
+            self.submit_part(upload, part_number, offset, min(part_size, size - offset))
+        return upload
+
+    def submit_part(self, upload, part_number, offset, length):
+        with self.cond:
+            # Backpressure on the walk, a single part larger than the budget still goes through alone
+            while self.queued_bytes and self.queued_bytes + length > self.bytes_in_flight:
+                self.cond.wait()
+            self.queued_bytes += length
+        self.run(self.upload_part, upload, part_number, offset, length)
+
+    def run(self, fn, *args):
+        with self.cond:
+            self.pending += 1
+        self.executor.submit(self.run_task, fn, *args)
+
+    def run_task(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f'🔴 upload task failed: {e}')
+            with self.cond:
+                self.errors.append(e)
+        finally:
+            with self.cond:
+                self.pending -= 1
+                self.cond.notify_all()
+
+    def upload_part(self, upload, part_number, offset, length):
+        try:
+            with open(upload.local_path, 'rb') as f:
+                data = os.pread(f.fileno(), length, offset)
+            with self.controller.slot('push', length):
+                if upload.upload_id is None:
+                    self.client.put_object(Bucket=upload.bucket, Key=upload.key, Body=data)
+                else:
+                    response = self.client.upload_part(Bucket=upload.bucket, Key=upload.key, UploadId=upload.upload_id,
+                                                       PartNumber=part_number, Body=data)
+                    upload.etags[part_number] = response['ETag']
+        except Exception:
+            if upload.upload_id is not None:
+                self.client.abort_multipart_upload(Bucket=upload.bucket, Key=upload.key, UploadId=upload.upload_id)
+            raise
+        finally:
+            with self.cond:
+                self.queued_bytes -= length
+                self.bytes_done += length
+                self.cond.notify_all()
+        with upload.lock:
+            upload.parts_left -= 1
+            if upload.parts_left:
+                return
+        if upload.upload_id is not None:
+            self.client.complete_multipart_upload(
+                Bucket=upload.bucket, Key=upload.key, UploadId=upload.upload_id,
+                MultipartUpload={'Parts': [{'PartNumber': n, 'ETag': etag} for n, etag in sorted(upload.etags.items())]})
+        with upload.lock:
+            upload.finished = True
+            callbacks = upload.callbacks
+        with self.cond:
+            self.files_done += 1
+        for callback in callbacks:
+            callback()
+
+    def when_done(self, uploads, callback):
+        """Run callback on a worker once every upload in uploads has finished, e.g. to write a folder meta"""
+        remaining = [0]
+        lock = threading.Lock()
+
+        def one_done():
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            self.run(callback)
+
+        # Count first, uploads can finish while callbacks are being attached
+        with lock:
+            for upload in uploads:
+                with upload.lock:
+                    if not upload.finished:
+                        remaining[0] += 1
+                        upload.callbacks.append(one_done)
+            if remaining[0]:
+                return
+        self.run(callback)
+
+    def progress(self):
+        elapsed = time.time() - self.start_time
+        return (f'{self.files_done}/{self.files_submitted} files, '
+                f'{self.bytes_done / 1024 ** 2:.0f}/{self.bytes_submitted / 1024 ** 2:.0f} MB, '
+                f'{self.bytes_done / 1024 ** 2 / max(elapsed, 1e-6):.1f} MB/s, '
+                f'{self.controller.limit("push")} parts in flight at most')
+
+    def report_progress(self):
+        while not self.stopped.wait(PROGRESS_INTERVAL):
+            print(f'👇 uploaded {self.progress()}')
+
+    def join(self):
+        """Wait for every submitted upload and callback, re-raising the first failure"""
+        with self.cond:
+            while self.pending:
+                self.cond.wait()
+        self.stopped.set()
+        self.executor.shutdown(wait=True)
+        print(f'👇 uploaded {self.progress()}')
+        if self.errors:
+            raise self.errors[0]
@@ -19,4 +19,7 @@ setup(
         'fusepy',
         'xattr',
     ],
+    extras_require={
+        'test': ['pytest'],  # tests/ also loads fusepy, which needs libfuse on the machine
+    },
 )
\ No newline at end of file
@@ -0,0 +1,43 @@
+import os
+import pytest
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+@pytest.fixture
+def image(tmp_path):
+    """A deployed local image: top.txt, sub/a.txt and a 3MB sub/big.bin, returns (folder, {path: content})"""
+    from ffbox import mount
+    folder = str(tmp_path / 'image')
+    files = {'/top.txt': b'top level\n', '/sub/a.txt': b'a' * 1000, '/sub/big.bin': os.urandom(3 * 1024 * 1024)}
+    for path, data in files.items():
+        write_file(folder + path, data)
+    mount.ffdeploy_path(folder)
+    return folder, files
+
+@pytest.fixture
+def mount_image(tmp_path):
+    """Factory of Passthrough mounts of an image folder or http url, each with its own cache and content store"""
+    from ffbox import mount
+    mounts = []
+
+    def make(url, name='node', **kwargs):
+        mount.nsclient = mount.HttpClient(url) if mount.is_http_url(url) else mount.PathClient(url)
+        kwargs.setdefault('cas_dir', str(tmp_path / name / mount.CAS_DIR))
+        passthru = mount.Passthrough(str(tmp_path / name / 'cache'), str(tmp_path / name / 'mnt'), url, True, **kwargs)
+        os.makedirs(passthru.root, exist_ok=True)
+        passthru.load_index()
+        mounts.append(passthru)
+        return passthru
+    yield make
+    for passthru in mounts:
+        passthru.downloader.shutdown()
+
+def read_file(passthru, path, size=1 << 30):
+    fh = passthru('open', path, os.O_RDONLY)
+    try:
+        return passthru('read', path, size, 0, fh)
+    finally:
+        passthru('release', path, fh)
@@ -0,0 +1,66 @@
+import os
+import shutil
+import pytest
+
+try:
+    from ffbox import mount
+except OSError:
+    pytest.skip('libfuse is not available', allow_module_level=True)
+
+from ffbox.cache import CacheManager, disk_usage
+from conftest import read_file
+
+def test_eviction_frees_the_content_store_copy(image, mount_image, tmp_path):
+    folder, files = image
+    node_dir = str(tmp_path / 'node')
+    passthru = mount_image(folder)
+    passthru.cache = CacheManager(1024 * 1024, passthru.evict_file, root=node_dir, store=passthru.content_store)
+    passthru.cache.measure()
+    sha256 = passthru.remote_entry('/sub/big.bin').sha256
+    assert read_file(passthru, '/sub/big.bin') == files['/sub/big.bin']
+    passthru.cache.check()
+    # The image link and the store link went together, so the bytes really left the disk
+    assert not os.path.exists(os.path.join(passthru.root, 'sub/big.bin'))
+    assert not passthru.content_store.has(sha256)
+    assert disk_usage(node_dir) <= 1024 * 1024
+    assert passthru.cache.used == disk_usage(node_dir)
+
+def test_budget_counts_every_image_of_the_node(image, mount_image, tmp_path):
+    folder, files = image
+    # Another image with the same content, deployed at its own urls
+    other = str(tmp_path / 'other_image')
+    shutil.copytree(folder, other)
+    mount.ffdeploy_path(other)
+    node_dir = str(tmp_path / 'node')
+    cas_dir = os.path.join(node_dir, mount.CAS_DIR)
+    first = mount_image(folder, name='node/first', cas_dir=cas_dir)
+    second = mount_image(other, name='node/second', cas_dir=cas_dir)
+    assert read_file(first, '/sub/big.bin') == files['/sub/big.bin']
+    # The second image links the same content from the store, it takes no new space
+    second.cache = CacheManager(1024 * 1024, second.evict_file, root=node_dir, store=second.content_store)
+    second.cache.measure()
+    assert read_file(second, '/sub/big.bin') == files['/sub/big.bin']
+    assert second.cache.used >= 3 * 1024 * 1024
+    second.cache.check()
+    # The first image still links the content, evicting the second's copy frees nothing on disk
+    assert not os.path.exists(os.path.join(second.root, 'sub/big.bin'))
+    assert os.path.exists(os.path.join(first.root, 'sub/big.bin'))
+    sha256 = first.remote_entry('/sub/big.bin').sha256
+    assert first.content_store.has(sha256)
+    assert second.cache.used == disk_usage(node_dir)
+    # The last image linking it frees the store copy along with its own
+    assert first.evict_file('/sub/big.bin') >= 3 * 1024 * 1024
+    assert not first.content_store.has(sha256)
+
+def test_reads_only_wake_the_cache_manager(image, mount_image, tmp_path):
+    folder, files = image
+    passthru = mount_image(folder)
+    passthru.cache = CacheManager(1024 * 1024, passthru.evict_file, root=str(tmp_path / 'node'), store=passthru.content_store)
+    passthru.cache.measure()
+    assert read_file(passthru, '/sub/big.bin') == files['/sub/big.bin']
+    # The FUSE thread counted the bytes and left the eviction to the manager's thread
+    assert passthru.cache.used > passthru.cache.budget
+    assert passthru.cache.wake.is_set()
+    assert os.path.exists(os.path.join(passthru.root, 'sub/big.bin'))
+    passthru.cache.check()
+    assert not os.path.exists(os.path.join(passthru.root, 'sub/big.bin'))
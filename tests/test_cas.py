@@ -0,0 +1,63 @@
+import os
+import errno
+import pytest
+
+try:
+    from ffbox import mount
+except OSError as e:  # fusepy loads libfuse on import
+    pytest.skip(f'libfuse is not available: {e}', allow_module_level=True)
+from fuse import FuseOSError
+from conftest import read_file
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_open_links_content_another_image_fetched(image, mount_image, tmp_path, lazy):
+    folder, files = image
+    cas_dir = str(tmp_path / mount.CAS_DIR)
+    first = mount_image(folder, name='first', cas_dir=cas_dir, lazy=lazy)
+    assert read_file(first, '/sub/big.bin') == files['/sub/big.bin']
+    if lazy:
+        # Lazy copies are published once every block is in
+        assert first.is_file_cached('/sub/big.bin')
+    sha256 = first.remote_entry('/sub/big.bin').sha256
+    assert first.content_store.has(sha256)
+    second = mount_image(folder, name='second', cas_dir=cas_dir, lazy=lazy)
+    backend_calls = second.backend_calls
+    # The open's own handle doesn't count as somebody else holding the placeholder
+    assert read_file(second, '/sub/big.bin') == files['/sub/big.bin']
+    assert second.backend_calls == backend_calls
+    store_path = second.content_store.path(sha256)
+    assert os.path.samefile(os.path.join(second.root, 'sub/big.bin'), store_path)
+
+def test_metadata_changes_leave_the_store_copy_intact(image, mount_image, tmp_path):
+    folder, files = image
+    cas_dir = str(tmp_path / mount.CAS_DIR)
+    first = mount_image(folder, name='first', cas_dir=cas_dir)
+    read_file(first, '/sub/big.bin')
+    second = mount_image(folder, name='second', cas_dir=cas_dir)
+    read_file(second, '/sub/big.bin')
+    store_path = second.content_store.path(second.remote_entry('/sub/big.bin').sha256)
+    store_st = os.stat(store_path)
+    second('chmod', '/sub/big.bin', 0o600)
+    second('utimens', '/sub/big.bin', (1, 1))
+    full_path = os.path.join(second.root, 'sub/big.bin')
+    assert not os.path.samefile(full_path, store_path)
+    assert os.stat(full_path).st_mode & 0o777 == 0o600
+    after = os.stat(store_path)
+    assert (after.st_mode, after.st_mtime_ns) == (store_st.st_mode, store_st.st_mtime_ns)
+    assert 'user.is_local' not in os.listxattr(store_path)
+    assert os.path.samefile(os.path.join(first.root, 'sub/big.bin'), store_path)
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_content_that_fails_its_hash_is_not_published(image, mount_image, tmp_path, lazy):
+    folder, files = image
+    # Same size, other bytes: the meta still names the deployed sha256
+    with open(os.path.join(folder, 'sub/big.bin'), 'r+b') as f:
+        f.write(b'poisoned')
+    cas_dir = str(tmp_path / mount.CAS_DIR)
+    passthru = mount_image(folder, cas_dir=cas_dir, lazy=lazy)
+    sha256 = passthru.remote_entry('/sub/big.bin').sha256
+    with pytest.raises(FuseOSError) as e:
+        read_file(passthru, '/sub/big.bin')
+    assert e.value.errno == errno.EIO
+    assert not passthru.content_store.has(sha256)
+    assert not passthru.is_file_cached('/sub/big.bin')
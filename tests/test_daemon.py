@@ -0,0 +1,54 @@
+import os
+import time
+import threading
+import pytest
+
+try:
+    from ffbox import mount
+except OSError as e:  # fusepy loads libfuse on import
+    pytest.skip(f'libfuse is not available: {e}', allow_module_level=True)
+from ffbox.daemon import FetchDaemon, DaemonClient
+
+BLOCK = 64 * 1024
+
+def test_overlapping_ranges_share_block_fetches(image, tmp_path, monkeypatch):
+    folder, files = image
+    content = files['/sub/big.bin']
+    socket_path = str(tmp_path / 'ffbox.sock')
+    daemon = FetchDaemon(socket_path, workers=4, block_size=BLOCK)
+    reads = []
+    real_read_range = daemon.read_range
+    gate = threading.Event()
+
+    def read_range(source, url, offset, length):
+        reads.append((offset, length))
+        gate.wait(5)  # keep the first fetch in flight until every mount asked
+        return real_read_range(source, url, offset, length)
+    monkeypatch.setattr(daemon, 'read_range', read_range)
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+    while not os.path.exists(socket_path):
+        time.sleep(0.01)
+    # Mounts with different block sizes ask for overlapping, unaligned ranges of the same object
+    ranges = [(0, 4 * BLOCK), (BLOCK + 100, 2 * BLOCK), (3 * BLOCK - 1, 2)]
+    results = {}
+
+    def get(i, offset, length):
+        results[i] = DaemonClient(socket_path, mount_id=f'm{i}').get_range(folder, 'sub/big.bin', offset, length)
+    threads = [threading.Thread(target=get, args=(i,) + r) for i, r in enumerate(ranges)]
+    threads[0].start()
+    while not reads:
+        time.sleep(0.01)
+    for thread in threads[1:]:
+        thread.start()
+    while daemon.stats['requests'] < len(ranges):
+        time.sleep(0.01)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    for i, (offset, length) in enumerate(ranges):
+        assert results[i] == content[offset:offset + length]
+    assert reads == [(0, 4 * BLOCK)]
+    assert daemon.stats['shared_fetches'] == 2
+    # Later asks of those blocks are answered from memory
+    assert DaemonClient(socket_path).get_range(folder, 'sub/big.bin', BLOCK, 10) == content[BLOCK:BLOCK + 10]
+    assert len(reads) == 1
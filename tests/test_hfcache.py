@@ -0,0 +1,80 @@
+import os
+import json
+import hashlib
+import pytest
+
+try:
+    from ffbox import mount
+except OSError as e:  # fusepy loads libfuse on import
+    pytest.skip(f'libfuse is not available: {e}', allow_module_level=True)
+from ffbox.index import INDEX_FILE
+from ffbox.hfcache import hub_blob_path
+from conftest import read_file, write_file
+
+REPO = 'org/model'
+
+@pytest.fixture
+def hub_image(image):
+    """The image with sub/big.bin pushed from a hub cache snapshot, as ffpush records it"""
+    folder, files = image
+    meta_path = os.path.join(folder, 'sub', mount.DIR_META_FILE)
+    with open(meta_path) as f:
+        meta = json.load(f)
+    sha256 = hashlib.sha256(files['/sub/big.bin']).hexdigest()
+    meta['big.bin'].update({'hf_repo': REPO, 'hf_revision': 'main', 'hf_blob': sha256})
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    os.unlink(os.path.join(folder, INDEX_FILE))  # per-folder metas, so the edited one is read
+    return folder, files, sha256
+
+def mount_with_hub(mount_image, folder, hub_dir):
+    passthru = mount_image(folder)
+    passthru.hf_hub_dir = hub_dir
+    passthru('getattr', '/sub/big.bin')  # folder metas are fetched here, the open only fetches content
+    return passthru
+
+def test_open_links_the_node_hub_blob(hub_image, mount_image, tmp_path):
+    folder, files, sha256 = hub_image
+    hub_dir = str(tmp_path / 'hub')
+    blob_path = hub_blob_path(REPO, sha256, hub_dir)
+    write_file(blob_path, files['/sub/big.bin'])
+    passthru = mount_with_hub(mount_image, folder, hub_dir)
+    backend_calls = passthru.backend_calls
+    assert read_file(passthru, '/sub/big.bin') == files['/sub/big.bin']
+    assert passthru.backend_calls == backend_calls
+    assert os.path.samefile(os.path.join(passthru.root, 'sub/big.bin'), blob_path)
+    # The hub cache is the user's, the mount leaves the blob as it found it
+    assert os.listxattr(blob_path) == []
+    assert os.stat(blob_path).st_nlink == 2
+    assert passthru.is_file_cached('/sub/big.bin')
+    # The cache manager can take the link back, the blob stays in the hub cache
+    assert passthru.evict_file('/sub/big.bin') is not None
+    assert not os.path.exists(os.path.join(passthru.root, 'sub/big.bin'))
+    assert open(blob_path, 'rb').read() == files['/sub/big.bin']
+
+@pytest.mark.parametrize('blob', ['truncated', 'other_hash'])
+def test_mismatching_hub_blob_is_not_linked(hub_image, mount_image, tmp_path, blob):
+    folder, files, sha256 = hub_image
+    hub_dir = str(tmp_path / 'hub')
+    if blob == 'truncated':
+        # An interrupted download left a shorter blob under the right name
+        blob_path = hub_blob_path(REPO, sha256, hub_dir)
+        write_file(blob_path, files['/sub/big.bin'][:1024])
+    else:
+        # Same size under another LFS hash, the meta names the blob it expects
+        other = os.urandom(len(files['/sub/big.bin']))
+        blob_path = hub_blob_path(REPO, hashlib.sha256(other).hexdigest(), hub_dir)
+        write_file(blob_path, other)
+        with open(os.path.join(folder, 'sub', mount.DIR_META_FILE)) as f:
+            meta = json.load(f)
+        meta['big.bin']['hf_blob'] = os.path.basename(blob_path)
+        meta['big.bin']['sha256'] = sha256
+        with open(os.path.join(folder, 'sub', mount.DIR_META_FILE), 'w') as f:
+            json.dump(meta, f)
+    blob_content = open(blob_path, 'rb').read()
+    passthru = mount_with_hub(mount_image, folder, hub_dir)
+    backend_calls = passthru.backend_calls
+    assert read_file(passthru, '/sub/big.bin') == files['/sub/big.bin']
+    assert passthru.backend_calls > backend_calls
+    assert not os.path.samefile(os.path.join(passthru.root, 'sub/big.bin'), blob_path)
+    assert open(blob_path, 'rb').read() == blob_content
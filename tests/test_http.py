@@ -0,0 +1,41 @@
+import threading
+import pytest
+
+try:
+    from ffbox import mount
+except OSError as e:  # fusepy loads libfuse on import
+    pytest.skip(f'libfuse is not available: {e}', allow_module_level=True)
+from ffbox.httpclient import serve
+from conftest import read_file
+
+@pytest.fixture
+def http_url(image):
+    """The deployed image served with range requests, as a static host or CDN would"""
+    folder, files = image
+    server = serve(folder, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_read_image_over_http(image, http_url, mount_image, lazy):
+    folder, files = image
+    passthru = mount_image(http_url, lazy=lazy)
+    assert sorted(passthru('readdir', '/', None)) == ['.', '..', 'sub', 'top.txt']
+    assert sorted(passthru('readdir', '/sub', None)) == ['.', '..', 'a.txt', 'big.bin']
+    for path, data in files.items():
+        assert passthru('getattr', path)['st_size'] == len(data)
+        assert read_file(passthru, path) == data
+
+def test_pushed_urls_map_under_the_mounted_url(image, http_url, mount_image):
+    passthru = mount_image(http_url)
+    url = 's3://bucket/img/sub/a b.txt'
+    assert passthru.mounted_url('/sub/a b.txt', url) == f'{http_url}/sub/a%20b.txt'
+    assert passthru.mounted_url('/sub', 's3://bucket/img/sub') == f'{http_url}/sub'
+    # Packs live next to the files, their url maps through the origin of a member
+    pack = 's3://bucket/img/.ffbox_packs/0.pack'
+    assert passthru.mounted_url('/sub/a b.txt', url, pack) == f'{http_url}/.ffbox_packs/0.pack'
+    # Hub references are fetched where they point
+    hub = 'https://huggingface.co/org/model/resolve/main/a.txt'
+    assert passthru.mounted_url('/sub/a.txt', hub) == hub
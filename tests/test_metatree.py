@@ -0,0 +1,64 @@
+import os
+import errno
+import pytest
+
+try:
+    from ffbox import mount
+except OSError as e:  # fusepy loads libfuse on import
+    pytest.skip(f'libfuse is not available: {e}', allow_module_level=True)
+from fuse import FuseOSError
+from ffbox.index import INDEX_FILE
+
+# What an import of `sub.mod` probes in every folder on sys.path before giving up
+PROBES = ['/sub/mod', '/sub/mod.py', '/sub/mod.pyc', '/sub/mod.cpython-311-x86_64-linux-gnu.so',
+          '/sub/mod/__init__.py', '/sub/__pycache__', '/sub/__init__.py']
+
+def walk(passthru):
+    for path in PROBES:
+        with pytest.raises(FuseOSError) as e:
+            passthru('getattr', path)
+        assert e.value.errno == errno.ENOENT
+
+@pytest.mark.parametrize('indexed', [True, False])
+def test_repeated_import_walk_skips_the_backend(image, mount_image, monkeypatch, indexed):
+    folder, files = image
+    if not indexed:
+        # Per-folder metas only, every folder is one backend request the first time
+        os.unlink(os.path.join(folder, INDEX_FILE))
+    passthru = mount_image(folder)
+    walk(passthru)
+    backend_calls = passthru.backend_calls
+    assert backend_calls == (0 if indexed else 2)
+    # Repeated misses are answered before the tree or the cache dir is looked at
+    lstat_calls = []
+    real_lstat = os.lstat
+
+    def lstat(path, *args, **kwargs):
+        lstat_calls.append(path)
+        return real_lstat(path, *args, **kwargs)
+    monkeypatch.setattr(os, 'lstat', lstat)
+    hits = passthru.negative.hits
+    for _ in range(3):
+        walk(passthru)
+    assert passthru.backend_calls == backend_calls
+    assert not lstat_calls
+    assert passthru.negative.hits - hits == 3 * len(PROBES)
+
+def test_creating_a_file_clears_its_negative_entry(image, mount_image):
+    folder, files = image
+    passthru = mount_image(folder)
+    walk(passthru)
+    fh = passthru('create', '/sub/mod.py', 0o644)
+    passthru('release', '/sub/mod.py', fh)
+    assert passthru('getattr', '/sub/mod.py')['st_size'] == 0
+
+def test_renaming_a_directory_clears_the_negative_entries_under_it(image, mount_image):
+    folder, files = image
+    passthru = mount_image(folder)
+    with pytest.raises(FuseOSError):
+        passthru('getattr', '/e/x')
+    passthru('mkdir', '/d', 0o755)
+    fh = passthru('create', '/d/x', 0o644)
+    passthru('release', '/d/x', fh)
+    passthru('rename', '/d', '/e')
+    assert passthru('getattr', '/e/x')['st_size'] == 0
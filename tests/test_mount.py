@@ -0,0 +1,112 @@
+import os
+import errno
+import pytest
+
+try:
+    from ffbox import mount
+except OSError as e:  # fusepy loads libfuse on import
+    pytest.skip(f'libfuse is not available: {e}', allow_module_level=True)
+from fuse import FuseOSError
+from conftest import read_file
+
+def test_rmdir_keeps_remote_folders_with_children(image, mount_image):
+    folder, files = image
+    passthru = mount_image(folder)
+    with pytest.raises(FuseOSError) as e:
+        passthru('rmdir', '/sub')
+    assert e.value.errno == errno.ENOTEMPTY
+    # The folder and its files are still served
+    assert sorted(passthru('readdir', '/sub', None)) == ['.', '..', 'a.txt', 'big.bin']
+    assert read_file(passthru, '/sub/a.txt') == files['/sub/a.txt']
+    with pytest.raises(FuseOSError) as e:
+        passthru('rmdir', '/sub')
+    assert e.value.errno == errno.ENOTEMPTY
+    passthru('unlink', '/sub/a.txt')
+    passthru('unlink', '/sub/big.bin')
+    passthru('rmdir', '/sub')
+    assert sorted(passthru('readdir', '/', None)) == ['.', '..', 'top.txt']
+    with pytest.raises(FuseOSError) as e:
+        passthru('getattr', '/sub')
+    assert e.value.errno == errno.ENOENT
+
+def test_failed_fetch_releases_its_waiters(image, mount_image, monkeypatch):
+    folder, files = image
+    passthru = mount_image(folder, lazy=True, block_size=1024 * 1024)
+    fh = passthru('open', '/sub/big.bin', os.O_RDONLY)
+    real_open = os.open
+
+    def failing_open(path, flags, *args):
+        if flags & os.O_WRONLY:
+            raise OSError(errno.EMFILE, 'Too many open files')
+        return real_open(path, flags, *args)
+    monkeypatch.setattr(os, 'open', failing_open)
+    with pytest.raises(OSError):
+        passthru('read', '/sub/big.bin', 4096, 0, fh)
+    # Nothing is left claimed, a later read fetches the blocks again instead of waiting forever
+    assert not passthru.inflight.fetches
+    monkeypatch.setattr(os, 'open', real_open)
+    assert passthru('read', '/sub/big.bin', 4096, 0, fh) == files['/sub/big.bin'][:4096]
+    passthru('release', '/sub/big.bin', fh)
+
+def test_block_data_is_flushed_before_its_bits(image, mount_image, monkeypatch):
+    folder, files = image
+    passthru = mount_image(folder, lazy=True, block_size=1024 * 1024)
+    events = []
+    real_fdatasync = os.fdatasync
+    real_add = mount.BlockMap.add
+
+    def fdatasync(fd):
+        events.append('sync')
+        real_fdatasync(fd)
+
+    def add(block_map, i):
+        events.append('bit')
+        real_add(block_map, i)
+    monkeypatch.setattr(os, 'fdatasync', fdatasync)
+    monkeypatch.setattr(mount.BlockMap, 'add', add)
+    fh = passthru('open', '/sub/big.bin', os.O_RDONLY)
+    assert passthru('read', '/sub/big.bin', 4096, 0, fh) == files['/sub/big.bin'][:4096]
+    passthru('release', '/sub/big.bin', fh)
+    assert events and events[0] == 'sync' and 'bit' in events
+
+def test_recorded_profile_stays_out_of_the_image(image, mount_image, tmp_path):
+    folder, files = image
+    passthru = mount_image(folder, name='recording', lazy=True)
+    profile_path = os.path.join(passthru.root, mount.META_DIR, mount.RECORDED_PROFILE_FILE)
+    passthru.start_recording(profile_path)
+    read_file(passthru, '/top.txt')
+    assert sorted(passthru('readdir', '/', None)) == ['.', '..', 'sub', 'top.txt']
+    passthru('destroy', '/')
+    # Published into the image, the next mount finds the profile and keeps its copy in the meta dir
+    mount.ffpublish_profile(passthru.root, folder)
+    assert os.path.exists(os.path.join(folder, mount.PROFILE_FILE))
+    assert os.path.exists(os.path.join(folder, mount.READ_ORDER_LOG))
+    replay = mount_image(folder, name='replay', lazy=True)
+    assert '/top.txt' in [key for key, payload in replay.read_order_entries()]
+
+def test_readdir_is_timed_and_counted(image, mount_image):
+    folder, files = image
+    passthru = mount_image(folder)
+    assert sorted(passthru('readdir', '/sub', None)) == ['.', '..', 'a.txt', 'big.bin']
+    with pytest.raises(FuseOSError):
+        passthru('readdir', '/missing', None)
+    # The folder meta fetch happened inside the timed call, the missing folder is counted as an error
+    assert passthru.metrics.histograms[('fuse_op_seconds', 'readdir')].count == 2
+    assert passthru.metrics.counters[('fuse_op_errors_total', 'readdir')] == 1
+
+def test_local_changes_survive_a_remount(image, mount_image):
+    folder, files = image
+    passthru = mount_image(folder)
+    fh = passthru('open', '/sub/a.txt', os.O_RDWR)
+    passthru('write', '/sub/a.txt', b'b' * 5000, 0, fh)
+    passthru('release', '/sub/a.txt', fh)
+    passthru('unlink', '/top.txt')
+    passthru.downloader.shutdown()
+    # Same cache dir, a fresh mount of it
+    remounted = mount_image(folder)
+    assert remounted('getattr', '/sub/a.txt')['st_size'] == 5000
+    assert read_file(remounted, '/sub/a.txt') == b'b' * 5000
+    with pytest.raises(FuseOSError) as e:
+        remounted('getattr', '/top.txt')
+    assert e.value.errno == errno.ENOENT
+    assert sorted(remounted('readdir', '/', None)) == ['.', '..', 'sub']
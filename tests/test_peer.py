@@ -0,0 +1,63 @@
+import http.client
+import pytest
+
+try:
+    from ffbox import mount
+except OSError as e:  # fusepy loads libfuse on import
+    pytest.skip(f'libfuse is not available: {e}', allow_module_level=True)
+from ffbox.peer import PeerServer, PeerClient, TOKEN_HEADER
+from conftest import read_file
+
+TOKEN = 'cluster-secret'
+
+def serve(passthru, token=TOKEN):
+    peer_server = PeerServer(0, token=token)
+    peer_server.add_mount(passthru)
+    server = peer_server.start()
+    return peer_server, server, f'127.0.0.1:{server.server_address[1]}'
+
+def get(address, path, headers):
+    host, port = address.split(':')
+    conn = http.client.HTTPConnection(host, int(port), timeout=5)
+    conn.request('GET', path, headers=headers)
+    response = conn.getresponse()
+    return response.status, response.read()
+
+def test_second_node_reads_from_peer(image, mount_image):
+    folder, files = image
+    first = mount_image(folder, name='first')
+    assert read_file(first, '/sub/big.bin') == files['/sub/big.bin']
+    peer_server, server, address = serve(first)
+    try:
+        second = mount_image(folder, name='second')
+        second.peers = PeerClient([address], token=TOKEN)
+        backend_calls = second.backend_calls
+        assert read_file(second, '/sub/big.bin') == files['/sub/big.bin']
+        assert second.peers.hits > 0 and second.peers.misses == 0
+        assert second.backend_calls == backend_calls
+        assert peer_server.served == second.peers.hits
+    finally:
+        server.shutdown()
+
+def test_peer_rejects_paths_and_missing_token(image, mount_image, tmp_path):
+    folder, files = image
+    first = mount_image(folder, name='first')
+    read_file(first, '/top.txt')
+    secret = tmp_path / 'credentials'
+    secret.write_text('aws_secret_access_key = hunter2\n')
+    peer_server, server, address = serve(first)
+    try:
+        headers = {'Range': 'bytes=0-9', TOKEN_HEADER: TOKEN}
+        for sha256 in (str(secret), '../../credentials', 'ab' * 31 + '/x'):
+            status, body = get(address, f'/range?url=x&sha256={sha256}', headers)
+            assert status == 404 and b'hunter2' not in body
+        url = first.peer_key('/top.txt')
+        assert get(address, f'/range?url={url}', {'Range': 'bytes=0-2'})[0] == 403
+        assert get(address, f'/range?url={url}', {'Range': 'bytes=0-2', TOKEN_HEADER: 'wrong'})[0] == 403
+        assert get(address, f'/range?url={url}', headers) == (206, files['/top.txt'])
+    finally:
+        server.shutdown()
+
+def test_peer_server_needs_token_off_localhost():
+    with pytest.raises(ValueError):
+        PeerServer(0, host='0.0.0.0', token='')
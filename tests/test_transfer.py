@@ -0,0 +1,20 @@
+import threading
+from ffbox.transfer import RangedDownloader
+
+def test_foreground_parts_skip_the_prefetch_queue():
+    downloader = RangedDownloader(max_concurrency=2)
+    release = threading.Event()
+    # Every prefetch worker is busy and more prefetch parts are queued behind them
+    prefetch = threading.Thread(target=downloader.map, args=(lambda part: release.wait(5), list(range(6)), 'prefetch'))
+    prefetch.start()
+    fetched = []
+    try:
+        foreground = threading.Thread(target=downloader.map, args=(fetched.append, [0, 1, 2], 'foreground'))
+        foreground.start()
+        foreground.join(2)
+        assert not foreground.is_alive()
+        assert sorted(fetched) == [0, 1, 2]
+    finally:
+        release.set()
+        prefetch.join()
+        downloader.shutdown()